@@ -150,11 +150,14 @@ def example_5_method_comparison():
     
     methods = ['dynamicrafter', 'steerable', 'hybrid']
     
+    # モデルは1回だけ読み込み、手法だけを切り替える
+    interpolator = AdvancedFrameInterpolator()
+    interpolator.setup_model()
+    
     for method in methods:
         print(f"\n処理中: {method}モード...")
         
-        interpolator = AdvancedFrameInterpolator(interpolation_method=method)
-        interpolator.setup_model()
+        interpolator.interpolation_method = method
         
         motion_control = {
             'camera': {
@@ -180,6 +183,7 @@ def example_5_method_comparison():
         print(f"✓ 完了: {output_path}")
     
     print("\n全ての比較動画が生成されました！")
+    print(f"キャッシュ統計: {interpolator.embedding_cache.stats()}")
 
 
 def example_6_high_quality_cinematic():
@@ -268,6 +272,7 @@ def example_7_batch_with_motion():
         print(f"✓ 完了: {output_path}")
     
     print("\n全てのバッチ処理が完了しました！")
+    print(f"キャッシュ統計: {interpolator.embedding_cache.stats()}")
 
 
 if __name__ == '__main__':
@@ -14,6 +14,7 @@ DynamiCrafter + Steerable-Motion統合中割りシステム
 import os
 import sys
 import argparse
+import time
 import torch
 import numpy as np
 from PIL import Image
@@ -24,6 +25,20 @@ from typing import Optional, List, Tuple, Dict
 import torchvision
 import cv2
 
+from embedding_cache import (
+    TensorCache, get_default_cache, get_default_prompt_cache, model_identity
+)
+import model_registry
+from precision import PRECISIONS, autocast_context, check_precision
+from quantize import QUANTIZE_MODES, check_quantize, model_dtype
+from progress import ProgressTracker, print_progress
+from metrics import trace_listeners
+from result_cache import add_result_cache_arguments, cli_params, result_cache_from_args
+from sampling import ddim_sample_latents, decode_latents, encode_first_stage_mode
+from video_writer import (
+    write_video, samples_to_frames, add_writer_arguments, writer_options_from_args
+)
+
 # DynamiCrafterのモジュールパスを追加
 SCRIPT_DIR = Path(__file__).parent
 DYNAMICRAFTER_DIR = SCRIPT_DIR.parent / "DynamiCrafter"
@@ -34,6 +49,32 @@ else:
     print("このスクリプトは /workspaces/dev/DynamiCrafter ディレクトリから実行してください")
 
 
+def rasterize_motion_field(matrices, resolution, dtype=np.float32):
+    """
+    アフィン行列列をフローフィールドにラスタライズ（時間方向もまとめてベクトル化）
+    
+    座標グリッドは (1,1,W) と (1,H,1) のブロードキャストで扱い、
+    (T,H,W,2) の出力を1回だけ確保する。
+    
+    Args:
+        matrices: (T, 2, 3) アフィン行列 (MotionController.camera_affine の出力)
+        resolution: (H, W) 出力解像度
+        dtype: 出力のdtype
+        
+    Returns:
+        (T, H, W, 2) フローフィールド
+    """
+    H, W = resolution
+    m = np.asarray(matrices, dtype=dtype)[:, :, :, None, None]  # (T,2,3,1,1)
+    dx = (np.arange(W, dtype=dtype) - W / 2)[None, None, :]
+    dy = (np.arange(H, dtype=dtype) - H / 2)[None, :, None]
+    
+    flow = np.empty((len(matrices), H, W, 2), dtype=dtype)
+    flow[..., 0] = m[:, 0, 0] * dx + m[:, 0, 1] * dy + m[:, 0, 2] * W
+    flow[..., 1] = m[:, 1, 0] * dx + m[:, 1, 1] * dy + m[:, 1, 2] * H
+    return flow
+
+
 class MotionController:
     """
     Steerable-Motionベースのモーション制御クラス
@@ -66,53 +107,53 @@ class MotionController:
             'rotate': np.clip(rotate, -180, 180)
         }
         
-    def generate_motion_vectors(self, resolution, num_frames):
+    def camera_affine(self, num_frames):
         """
-        モーションベクトルを生成
+        カメラモーションをフレームごとのアフィン行列として表現
+        
+        フロー (fx, fy) = A_t @ (x - W/2, y - H/2) + (tx_t * W, ty_t * H)
+        A_t はズームと回転、(tx_t, ty_t) は画像サイズに対する割合のパン量。
+        解像度に依存しないので、任意の解像度でラスタライズできる。
         
         Args:
-            resolution: (H, W) 解像度
             num_frames: フレーム数
             
         Returns:
-            モーションベクトル (num_frames, H, W, 2)
+            (num_frames, 2, 3) float64配列 [[a, b, tx], [c, d, ty]]
         """
-        H, W = resolution
-        motion_vectors = []
+        progress = np.arange(num_frames, dtype=np.float64) / max(num_frames - 1, 1)
         
-        for t in range(num_frames):
-            # 時間の進行度 (0.0 to 1.0)
-            progress = t / max(num_frames - 1, 1)
-            
-            # ベースのフローフィールドを作成
-            y, x = np.mgrid[0:H, 0:W].astype(np.float32)
-            flow = np.zeros((H, W, 2), dtype=np.float32)
-            
-            # カメラパン
-            flow[:, :, 0] = self.camera_motion['pan_x'] * progress * W * 0.1
-            flow[:, :, 1] = self.camera_motion['pan_y'] * progress * H * 0.1
-            
-            # ズーム効果
-            if abs(self.camera_motion['zoom']) > 0.01:
-                center_x, center_y = W / 2, H / 2
-                dx = x - center_x
-                dy = y - center_y
-                zoom_factor = self.camera_motion['zoom'] * progress * 0.1
-                flow[:, :, 0] += dx * zoom_factor
-                flow[:, :, 1] += dy * zoom_factor
-            
-            # 回転効果
-            if abs(self.camera_motion['rotate']) > 0.1:
-                center_x, center_y = W / 2, H / 2
-                angle = np.radians(self.camera_motion['rotate'] * progress)
-                dx = x - center_x
-                dy = y - center_y
-                flow[:, :, 0] += -dy * np.sin(angle)
-                flow[:, :, 1] += dx * np.sin(angle)
-            
-            motion_vectors.append(flow)
+        # ズーム効果
+        zoom = self.camera_motion['zoom']
+        zoom_factor = zoom * progress * 0.1 if abs(zoom) > 0.01 else np.zeros_like(progress)
         
-        return np.stack(motion_vectors, axis=0)
+        # 回転効果
+        rotate = self.camera_motion['rotate']
+        sin = np.sin(np.radians(rotate * progress)) if abs(rotate) > 0.1 else np.zeros_like(progress)
+        
+        matrices = np.empty((num_frames, 2, 3), dtype=np.float64)
+        matrices[:, 0, 0] = zoom_factor
+        matrices[:, 0, 1] = -sin
+        matrices[:, 1, 0] = sin
+        matrices[:, 1, 1] = zoom_factor
+        # カメラパン
+        matrices[:, 0, 2] = self.camera_motion['pan_x'] * progress * 0.1
+        matrices[:, 1, 2] = self.camera_motion['pan_y'] * progress * 0.1
+        return matrices
+    
+    def generate_motion_vectors(self, resolution, num_frames, dtype=np.float32):
+        """
+        モーションベクトルを生成
+        
+        Args:
+            resolution: (H, W) 解像度（latent解像度 H/8×W/8 なども可）
+            num_frames: フレーム数
+            dtype: 出力のdtype
+            
+        Returns:
+            モーションベクトル (num_frames, H, W, 2)
+        """
+        return rasterize_motion_field(self.camera_affine(num_frames), resolution, dtype)
     
     def create_motion_mask(self, image_shape, regions: List[Dict]):
         """
@@ -143,7 +184,8 @@ class AdvancedFrameInterpolator:
     """
     
     def __init__(self, model_path=None, config_path=None, device='cuda', 
-                 interpolation_method='dynamicrafter'):
+                 interpolation_method='dynamicrafter', embedding_cache=None,
+                 prompt_cache=None, precision='fp32', quantize='none', progress=None):
         """
         初期化
         
@@ -152,41 +194,42 @@ class AdvancedFrameInterpolator:
             config_path: 設定ファイルのパス
             device: 使用するデバイス
             interpolation_method: 'dynamicrafter', 'steerable', 'hybrid'
+            embedding_cache: latent・画像埋め込みのキャッシュ (省略時はプロセス共有のキャッシュ)
+            prompt_cache: プロンプト埋め込みのキャッシュ (省略時はプロセス共有のキャッシュ)
+            precision: 'fp32' または 'bf16' (CPUではbf16でメモリ約半分・AMX等で高速化)
+            quantize: 'none' または 'int8' (CPUでLinear層をint8動的量子化)
+            progress: 進捗イベントの送信先 ProgressTracker (省略時はリスナーなし)
         """
         self.device = device if torch.cuda.is_available() else 'cpu'
         self.model_path = model_path or 'checkpoints/dynamicrafter_512_interp_v1/model.ckpt'
         self.config_path = config_path or 'configs/inference_512_v1.0.yaml'
         self.model = None
         self.resolution = (320, 512)  # (H, W)
+        self.progress = progress or ProgressTracker()
         self.interpolation_method = interpolation_method
         self.motion_controller = MotionController()
+        self.embedding_cache = embedding_cache or get_default_cache()
+        self.prompt_cache = prompt_cache or get_default_prompt_cache()
+        self.precision = check_precision(precision)
+        self.quantize = check_quantize(quantize, self.precision, self.device)
+        self.model_dtype = model_dtype(self.precision, self.quantize)
         
     def setup_model(self):
-        """モデルのセットアップ"""
-        try:
-            from omegaconf import OmegaConf
-            from utils.utils import instantiate_from_config
-            from scripts.evaluation.funcs import load_model_checkpoint
-            
-            config = OmegaConf.load(self.config_path)
-            model_config = config.pop("model", OmegaConf.create())
-            model_config['params']['unet_config']['params']['use_checkpoint'] = False
-            
-            model = instantiate_from_config(model_config)
-            
-            if os.path.exists(self.model_path):
-                model = load_model_checkpoint(model, self.model_path)
-                model = model.to(self.device)
-                model.eval()
-                self.model = model
-                print(f"✓ DynamiCrafterモデルを読み込みました: {self.model_path}")
-            else:
-                raise FileNotFoundError(f"モデルファイルが見つかりません: {self.model_path}")
-                
-        except ImportError as e:
-            print(f"警告: DynamiCrafterのモジュールが見つかりません: {e}")
-            print("DynamiCrafterリポジトリのルートディレクトリから実行してください。")
-            raise
+        """モデルのセットアップ（プロセス共有のレジストリから取得）"""
+        if self.model is not None:
+            return
+        
+        self.progress.start('load')
+        self.model = model_registry.acquire_model(self.config_path, self.model_path, self.device,
+                                                  self.model_dtype)
+        print(f"✓ DynamiCrafterモデルを読み込みました: {self.model_path}")
+    
+    def release_model(self):
+        """レジストリのモデル参照を解放"""
+        if self.model is not None:
+            self.model = None
+            model_registry.release_model(self.config_path, self.model_path, self.device,
+                                         self.model_dtype)
             
     def load_and_preprocess_images(self, image1_path, image2_path):
         """画像の読み込みと前処理"""
@@ -197,22 +240,64 @@ class AdvancedFrameInterpolator:
             transforms.Normalize(mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5))
         ])
         
-        img1 = Image.open(image1_path).convert('RGB')
-        img2 = Image.open(image2_path).convert('RGB')
+        img1 = self._open_image(image1_path)
+        img2 = self._open_image(image2_path)
         
         img1_tensor = transform(img1)
         img2_tensor = transform(img2)
         
         return img1_tensor, img2_tensor
     
+    @staticmethod
+    def _open_image(image):
+        """画像パス・PIL Image・numpy配列をRGBのPIL Imageに変換"""
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        elif not isinstance(image, Image.Image):
+            image = Image.open(image)
+        return image.convert('RGB')
+    
     def get_latent_z(self, videos):
         """ビデオをLatent spaceに変換"""
         b, c, t, h, w = videos.shape
         x = rearrange(videos, 'b c t h w -> (b t) c h w')
-        z = self.model.encode_first_stage(x)
+        z = encode_first_stage_mode(self.model, x)
         z = rearrange(z, '(b t) c h w -> b c t h w', b=b, t=t)
         return z
     
+    def autocast(self):
+        """条件付け・サンプリング・デコード用のautocast (precision.autocast_context)"""
+        return autocast_context(self.device, self.precision)
+    
+    def model_identity(self):
+        """キャッシュキー用のモデル識別子"""
+        return model_identity(self.model_path, self.config_path, self.device, self.model_dtype)
+    
+    def encode_latent(self, img_tensor):
+        """キーフレーム (b,c,h,w) をlatent (b,c,1,h,w) に変換（キャッシュ付き）"""
+        key = self.embedding_cache.key('latent_mode', img_tensor, self.resolution, self.model_identity())
+        z = self.embedding_cache.get_or_compute(
+            key, lambda: self.get_latent_z(img_tensor.unsqueeze(2)))
+        return z.to(self.device)
+    
+    def encode_image_embedding(self, img_tensor):
+        """条件画像のCLIP埋め込みを取得（キャッシュ付き）"""
+        key = self.embedding_cache.key('image_emb', img_tensor, self.resolution, self.model_identity())
+        img_emb = self.embedding_cache.get_or_compute(
+            key, lambda: self.model.image_proj_model(self.model.embedder(img_tensor)))
+        return img_emb.to(self.device)
+    
+    def get_text_embedding(self, prompt):
+        """プロンプトのテキスト埋め込みを取得（キャッシュ付き）"""
+        return self.prompt_cache.get(self.model, self.model_identity(), prompt).to(self.device)
+    
+    def warmup_prompts(self, prompts):
+        """よく使うプロンプトを事前にエンコードしてキャッシュ"""
+        if self.model is None:
+            self.setup_model()
+        with torch.no_grad(), self.autocast():
+            self.prompt_cache.warmup(self.model, self.model_identity(), prompts)
+    
     def apply_motion_guidance(self, latent_samples, motion_vectors):
         """
         モーションガイダンスを適用（Steerable-Motion風）
@@ -240,7 +325,8 @@ class AdvancedFrameInterpolator:
                    eta=1.0, 
                    fps=5, 
                    seed=123,
-                   motion_control: Optional[Dict] = None):
+                   motion_control: Optional[Dict] = None,
+                   callback=None):
         """
         高度な中割り生成
         
@@ -259,12 +345,12 @@ class AdvancedFrameInterpolator:
                     'camera': {'pan_x', 'pan_y', 'zoom', 'rotate'},
                     'regions': [{'bbox', 'motion'}, ...]
                 }
+            callback: 各DDIMステップ後に callback(step) を呼ぶ（例外を投げると中断）
             
         Returns:
             生成された動画テンソル
         """
         from pytorch_lightning import seed_everything
-        from scripts.evaluation.funcs import batch_ddim_sampling
         
         seed_everything(seed)
         
@@ -273,6 +359,7 @@ class AdvancedFrameInterpolator:
         
         # モーション制御の設定
         if motion_control:
+            self.progress.start('motion')
             if 'camera' in motion_control:
                 cam = motion_control['camera']
                 self.motion_controller.set_camera_motion(
@@ -282,27 +369,34 @@ class AdvancedFrameInterpolator:
                     rotate=cam.get('rotate', 0.0)
                 )
             
-            # モーションベクトルを生成
+            # モーションベクトルを生成（latentに適用するためlatent解像度で）
+            latent_resolution = (self.resolution[0] // 8, self.resolution[1] // 8)
             motion_vectors = self.motion_controller.generate_motion_vectors(
-                self.resolution, num_frames
+                latent_resolution, num_frames
             )
         else:
             motion_vectors = None
         
         # 画像を読み込み
+        self.progress.start('preprocess')
         img1_tensor, img2_tensor = self.load_and_preprocess_images(image1_path, image2_path)
         
         img1_tensor = img1_tensor.unsqueeze(0).to(self.device)
         img2_tensor = img2_tensor.unsqueeze(0).to(self.device)
         
-        with torch.no_grad(), torch.cuda.amp.autocast():
-            # テキスト条件付け（拡張プロンプト）
-            enhanced_prompt = self._enhance_prompt(prompt, motion_control)
-            text_emb = self.model.get_learned_conditioning([enhanced_prompt])
+        with torch.no_grad(), self.autocast():
+            self.progress.start('encode')
             
             # Latent space変換
-            z1 = self.get_latent_z(img1_tensor.unsqueeze(2))
-            z2 = self.get_latent_z(img2_tensor.unsqueeze(2))
+            z1 = self.encode_latent(img1_tensor)
+            z2 = self.encode_latent(img2_tensor)
+            
+            self.progress.start('condition')
+            
+            # テキスト条件付け（拡張プロンプト）
+            enhanced_prompt = self._enhance_prompt(prompt, motion_control)
+            text_emb = self.get_text_embedding(enhanced_prompt)
+            uc_text_emb = self.get_text_embedding("")
             
             # 条件付け準備
             batch_size = 1
@@ -311,8 +405,7 @@ class AdvancedFrameInterpolator:
             noise_shape = [batch_size, channels, num_frames, h, w]
             
             # 画像埋め込み
-            img_emb1 = self.model.embedder(img1_tensor)
-            img_emb1 = self.model.image_proj_model(img_emb1)
+            img_emb1 = self.encode_image_embedding(img1_tensor)
             
             imtext_cond = torch.cat([text_emb, img_emb1], dim=1)
             
@@ -334,16 +427,16 @@ class AdvancedFrameInterpolator:
             }
             
             # サンプリング
-            batch_samples = batch_ddim_sampling(
-                self.model,
-                cond,
-                noise_shape,
-                n_samples=1,
-                ddim_steps=ddim_steps,
-                ddim_eta=eta,
-                cfg_scale=cfg_scale
+            samples = ddim_sample_latents(
+                self.model, cond, noise_shape,
+                ddim_steps=ddim_steps, ddim_eta=eta, cfg_scale=cfg_scale,
+                callback=self.progress.step_callback(ddim_steps, callback=callback),
+                uc_text_emb=uc_text_emb
             )
             
+            self.progress.start('decode')
+            batch_samples = decode_latents(self.model, samples)
+            
         return batch_samples
     
     def _enhance_prompt(self, prompt, motion_control):
@@ -381,24 +474,10 @@ class AdvancedFrameInterpolator:
         
         return prompt
     
-    def save_video(self, samples, output_path, fps=5):
-        """動画を保存"""
-        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
-        
-        video = samples[0, 0]
-        video = video.detach().cpu()
-        video = torch.clamp(video.float(), -1., 1.)
-        video = (video + 1.0) / 2.0
-        video = video.permute(1, 2, 3, 0)
-        video = (video * 255).to(torch.uint8)
-        
-        torchvision.io.write_video(
-            output_path,
-            video,
-            fps=fps,
-            video_codec='h264',
-            options={'crf': '10'}
-        )
+    def save_video(self, samples, output_path, fps=5, backend='auto', **writer_options):
+        """動画を保存（フレーム単位でffmpegへ逐次書き込み）"""
+        frames = self.progress.track(samples_to_frames(samples), 'write', total=samples.shape[3])
+        write_video(frames, output_path, fps=fps, backend=backend, **writer_options)
         
         print(f"✓ 動画を保存しました: {output_path}")
 
@@ -437,6 +516,7 @@ def main():
     parser.add_argument('--cfg-scale', type=float, default=7.5, help='CFGスケール')
     parser.add_argument('--fps', type=int, default=5, help='FPS')
     parser.add_argument('--seed', type=int, default=123, help='ランダムシード')
+    add_writer_arguments(parser)
     
     # モーション制御パラメータ
     parser.add_argument('--method', type=str, default='hybrid', 
@@ -454,6 +534,15 @@ def main():
     # モデルパス
     parser.add_argument('--model-path', type=str, default=None, help='モデルパス')
     parser.add_argument('--config-path', type=str, default=None, help='設定ファイルパス')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None,
+                       help='latent・画像埋め込みのディスクキャッシュ (fp16) の保存先')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                       help='推論精度 (bf16: CPUでメモリ約半分、AVX512-BF16/AMXで高速化)')
+    parser.add_argument('--quantize', type=str, default='none', choices=QUANTIZE_MODES,
+                       help='int8: Linear層を動的量子化 (CPUのみ、量子化済みモデルはディスクにキャッシュ)')
+    parser.add_argument('--progress-json', action='store_true',
+                       help='進捗イベントを1行のJSONで標準出力に書き出す (WebUIのサブプロセス用)')
+    add_result_cache_arguments(parser)
     
     args = parser.parse_args()
     
@@ -478,9 +567,27 @@ def main():
     interpolator = AdvancedFrameInterpolator(
         model_path=args.model_path,
         config_path=args.config_path,
-        interpolation_method=args.method
+        device='cpu' if args.quantize == 'int8' else 'cuda',
+        interpolation_method=args.method,
+        embedding_cache=TensorCache(cache_dir=args.embedding_cache_dir) if args.embedding_cache_dir else None,
+        precision=args.precision,
+        quantize=args.quantize,
+        progress=ProgressTracker(([print_progress] if args.progress_json else [])
+                                 + trace_listeners('advanced'))
     )
     
+    # 結果キャッシュ（同じ入力・設定の動画があればモデルを読み込まずに返す）
+    result_cache = result_cache_from_args(args)
+    if result_cache is not None:
+        cache_params = cli_params(args, 'advanced_interpolate')
+        cache_key = result_cache.key([args.image1, args.image2], cache_params,
+                                     interpolator.model_identity())
+        if result_cache.fetch(cache_key, args.output):
+            interpolator.progress.done(cached=True)
+            print(f"✓ 結果キャッシュから取り出しました: {args.output}")
+            return
+    generation_start = time.perf_counter()
+    
     interpolator.setup_model()
     
     # 中割り実行
@@ -509,7 +616,12 @@ def main():
     )
     
     # 動画を保存
-    interpolator.save_video(samples, args.output, fps=args.fps)
+    interpolator.save_video(samples, args.output, fps=args.fps,
+                            **writer_options_from_args(args))
+    if result_cache is not None:
+        result_cache.store(cache_key, args.output, time.perf_counter() - generation_start,
+                           cache_params)
+    interpolator.progress.done()
     print(f"\n完了しました！")
     print("=" * 60)
 
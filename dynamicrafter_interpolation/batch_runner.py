@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+マニフェストファイルによる中割りのバッチ処理（中断・再開対応）
+
+マニフェスト (JSONL または CSV) の各行が1ジョブ。モデルは1回だけ読み込み、
+ジョブごとの結果を出力ディレクトリの ledger.jsonl に追記する。
+途中で止まった場合は、同じコマンドを再実行すると完了済みのジョブを飛ばして再開する。
+ジョブごとの所要時間は summary.json にまとめる。
+
+マニフェストの項目（image1, image2 以外は省略可）:
+  id, image1, image2, output, prompt, frames, steps, cfg_scale, eta, fps, seed,
+  method, pan_x, pan_y, zoom, rotate
+  JSONL では motion: {"camera": {...}} も指定できる。
+  相対パスはマニフェストのあるディレクトリを基準にする。
+
+使用例:
+  python batch_runner.py jobs.jsonl --output-dir output_videos/batch
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+
+from embedding_cache import TensorCache
+from precision import PRECISIONS
+from quantize import QUANTIZE_MODES
+from result_cache import (add_result_cache_arguments, cli_params, image_digest, result_cache_from_args,
+                          result_key)
+from video_writer import add_writer_arguments, writer_options_from_args
+
+LEDGER_NAME = 'ledger.jsonl'
+SUMMARY_NAME = 'summary.json'
+
+# ジョブの既定値（interpolate.py のCLIと同じ）
+JOB_DEFAULTS = {
+    'prompt': '',
+    'frames': 16,
+    'steps': 50,
+    'cfg_scale': 7.5,
+    'eta': 1.0,
+    'fps': 5,
+    'seed': 123,
+    'method': 'hybrid',
+}
+
+CAMERA_KEYS = ['pan_x', 'pan_y', 'zoom', 'rotate']
+
+_INT_FIELDS = ['frames', 'steps', 'fps', 'seed']
+
+
+def load_manifest(path):
+    """
+    マニフェストを読み込んでジョブのリストにする
+
+    Args:
+        path: .jsonl / .json / .csv ファイル
+
+    Returns:
+        ジョブ (dict) のリスト
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = [{k: v for k, v in row.items() if v not in (None, '')}
+                    for row in csv.DictReader(f)]
+    else:
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_no}: JSONとして読めません: {e}")
+
+    jobs = []
+    ids = set()
+    for index, row in enumerate(rows, 1):
+        job = normalize_job(row, index, path.parent)
+        if job['id'] in ids:
+            raise ValueError(f"ジョブIDが重複しています: {job['id']}")
+        ids.add(job['id'])
+        jobs.append(job)
+    return jobs
+
+
+def normalize_job(row, index, base_dir):
+    """
+    マニフェストの1行を既定値・型変換・パス解決済みのジョブにする
+
+    Args:
+        row: マニフェストの1行 (dict)
+        index: 1始まりの行番号（IDの既定値に使う）
+        base_dir: 相対パスの基準ディレクトリ
+    """
+    for key in ('image1', 'image2'):
+        if not row.get(key):
+            raise ValueError(f"ジョブ {index}: {key} がありません")
+
+    job = dict(JOB_DEFAULTS)
+    job.update({k: v for k, v in row.items() if k not in CAMERA_KEYS and k != 'motion'})
+    job['id'] = str(row.get('id') or f"job_{index:04d}")
+    if 'cfg' in job:
+        job['cfg_scale'] = job.pop('cfg')
+    for key in _INT_FIELDS:
+        job[key] = int(job[key])
+    for key in ('cfg_scale', 'eta'):
+        job[key] = float(job[key])
+    for key in ('image1', 'image2'):
+        job[key] = str((base_dir / job[key]) if not os.path.isabs(job[key]) else job[key])
+    if job.get('output') and not os.path.isabs(job['output']):
+        job['output'] = str(base_dir / job['output'])
+
+    # モーション: JSONLの motion、またはフラットな pan_x などの列
+    motion = row.get('motion')
+    camera = {k: float(row[k]) for k in CAMERA_KEYS if k in row}
+    if camera:
+        motion = {'camera': {**{k: 0.0 for k in CAMERA_KEYS}, **camera}}
+    if motion and not any(motion.get('camera', {}).values()) and not motion.get('regions'):
+        motion = None
+    job['motion'] = motion
+    return job
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_image_digest(path, mtime_ns, size):
+    return image_digest(path)
+
+
+def input_digest(path):
+    """
+    入力画像の画素のハッシュ（同じファイルは更新されるまで計算し直さない）
+
+    読めない場合はNone（ジョブの実行時にエラーとして記録される）。
+    """
+    try:
+        stat = os.stat(path)
+        return _cached_image_digest(str(path), stat.st_mtime_ns, stat.st_size)
+    except (OSError, ValueError):
+        return None
+
+
+def job_hash(job):
+    """
+    出力に影響するパラメータと入力画像の内容のハッシュ（変更されたジョブは再実行する）
+
+    入力画像は result_cache と同じく画素のハッシュで比べるので、同じパスのまま
+    画像を差し替えた場合も再実行する。
+    """
+    keys = sorted(k for k in job if k not in ('id', 'output'))
+    payload = {k: job[k] for k in keys}
+    payload['image_digests'] = [input_digest(job['image1']), input_digest(job['image2'])]
+    payload = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class Ledger:
+    """
+    ジョブごとの状態を追記するログ (ledger.jsonl)
+
+    1行1レコードで追記のみ行い、同じジョブは最後のレコードが有効。
+    書き込みごとに fsync するので、強制終了しても直前のジョブまでの記録が残る。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.records = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 書き込み途中で止まった行
+                    self.records[record['id']] = record
+
+    def is_done(self, job, output_path):
+        """完了済みで、パラメータが同じで、出力が残っているか"""
+        record = self.records.get(job['id'])
+        return (record is not None and record.get('status') == 'done'
+                and record.get('hash') == job_hash(job) and Path(output_path).exists())
+
+    def append(self, record):
+        self.records[record['id']] = record
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class BatchRunner:
+    """マニフェストのジョブを順に実行するランナー（モデルは共有して1回だけ読み込む）"""
+
+    def __init__(self, output_dir, model_path=None, config_path=None, device='cuda',
+                 precision='fp32', quantize='none', embedding_cache=None, writer_options=None,
+                 batch_size=1, result_cache=None, cache_params=None):
+        """
+        初期化
+
+        Args:
+            output_dir: 出力・ledger.jsonl・summary.json の保存先
+            model_path, config_path, device, precision, quantize: 補間器の設定
+            embedding_cache: latent・画像埋め込みのキャッシュ
+            writer_options: save_video() に渡す書き出しオプション
+            batch_size: モーションなしのジョブをまとめてサンプリングする数
+                (FrameInterpolator.interpolate_batch を使う。1でジョブごとに実行)
+            result_cache: 完成した動画の ResultCache（同じ入力・設定のジョブは生成を省略）
+            cache_params: 結果キャッシュのキーに含めるCLIの設定 (result_cache.cli_params)
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.ledger = Ledger(self.output_dir / LEDGER_NAME)
+        self.writer_options = writer_options or {}
+        self.batch_size = max(1, int(batch_size))
+        self.result_cache = result_cache
+        self.cache_params = cache_params or {}
+        self._options = dict(model_path=model_path, config_path=config_path, device=device,
+                             precision=precision, quantize=quantize,
+                             embedding_cache=embedding_cache)
+        self._interpolators = {}
+
+    def get_interpolator(self, motion):
+        """
+        モーションなしは FrameInterpolator、ありは AdvancedFrameInterpolator
+
+        どちらもモデルレジストリ経由で同じモデルを共有する。
+        """
+        interpolator = self._interpolator(motion)
+        if interpolator.model is None:
+            interpolator.setup_model()
+        return interpolator
+
+    def _interpolator(self, motion):
+        """補間器を作成（モデルはまだ読み込まない）"""
+        kind = 'advanced' if motion else 'basic'
+        if kind not in self._interpolators:
+            if kind == 'advanced':
+                from advanced_interpolate import AdvancedFrameInterpolator
+                interpolator = AdvancedFrameInterpolator(**self._options)
+            else:
+                from interpolate import FrameInterpolator
+                interpolator = FrameInterpolator(**self._options)
+            self._interpolators[kind] = interpolator
+        return self._interpolators[kind]
+
+    def cache_params_for(self, job):
+        """結果キャッシュのキーに含めるパラメータ（CLIの設定 + ジョブのパラメータ）"""
+        params = dict(self.cache_params)
+        params['job'] = {k: v for k, v in job.items() if k not in ('id', 'output', 'image1', 'image2')}
+        return params
+
+    def cache_key(self, job):
+        """
+        結果キャッシュのキー（入力画像の画素・ジョブのパラメータ・CLIの設定・モデル）
+
+        入力画像が読めなければNone（キャッシュを使わずに実行してエラーを記録する）。
+        """
+        model_id = self._interpolator(job['motion']).model_identity()
+        try:
+            return result_key([job['image1'], job['image2']], self.cache_params_for(job), model_id)
+        except (OSError, ValueError):
+            return None
+
+    def fetch_cached(self, job, key):
+        """
+        結果キャッシュにあれば出力先に取り出す
+
+        Returns:
+            ヒットしたら所要時間の内訳 (dict)、なければNone
+        """
+        if self.result_cache is None or key is None:
+            return None
+        t = time.perf_counter()
+        if not self.result_cache.fetch(key, self.output_path(job)):
+            return None
+        print(f"結果キャッシュから取り出しました: {self.output_path(job)}")
+        return {'cached': True, 'save': time.perf_counter() - t}
+
+    def store_result(self, job, key, timings):
+        """完了したジョブの動画を結果キャッシュに追加"""
+        if self.result_cache is None or key is None:
+            return
+        seconds = sum(timings.get(k, 0.0) for k in ('setup', 'sample', 'save'))
+        self.result_cache.store(key, self.output_path(job), seconds, self.cache_params_for(job))
+
+    def warmup_prompts(self, jobs):
+        """
+        ジョブのプロンプトを補間器ごとに1回のバッチでまとめてエンコード
+
+        モーションありのジョブはカメラモーションで拡張したプロンプトを使う。
+        CFG用の空プロンプトも含めるので、実行中はテキストエンコーダを呼ばない。
+        """
+        prompts = {}
+        for job in jobs:
+            prompts.setdefault('advanced' if job['motion'] else 'basic', []).append(job)
+        for kind, kind_jobs in prompts.items():
+            interpolator = self.get_interpolator(kind == 'advanced')
+            if kind == 'advanced':
+                texts = [interpolator._enhance_prompt(job['prompt'], job['motion'])
+                         for job in kind_jobs]
+            else:
+                texts = [job['prompt'] for job in kind_jobs]
+            interpolator.warmup_prompts(list(dict.fromkeys(texts + [''])))
+
+    def output_path(self, job):
+        return Path(job.get('output') or self.output_dir / f"{job['id']}.mp4")
+
+    def run_job(self, job):
+        """
+        1ジョブを実行
+
+        出力は一時ファイルに書いてから置き換えるので、途中で止まっても
+        完了済みに見える不完全な動画は残らない。
+
+        Returns:
+            所要時間の内訳 (dict)
+        """
+        timings = {}
+        t = time.perf_counter()
+        interpolator = self.get_interpolator(job['motion'])
+        timings['setup'] = time.perf_counter() - t
+
+        kwargs = dict(prompt=job['prompt'], num_frames=job['frames'], ddim_steps=job['steps'],
+                      cfg_scale=job['cfg_scale'], eta=job['eta'], fps=job['fps'], seed=job['seed'])
+        if job['motion']:
+            interpolator.interpolation_method = job['method']
+            kwargs['motion_control'] = job['motion']
+
+        t = time.perf_counter()
+        samples = interpolator.interpolate(job['image1'], job['image2'], **kwargs)
+        timings['sample'] = time.perf_counter() - t
+
+        timings['save'] = self._save(interpolator, job, samples)
+        return timings
+
+    def run_group(self, jobs, saved=None):
+        """
+        モーションなしの複数ジョブを interpolate_batch でまとめて実行
+
+        Args:
+            jobs: ジョブのリスト
+            saved: 保存まで済んだジョブの所要時間を {ジョブID: 内訳} で記録するdict
+                （途中で失敗しても、それまでに保存したジョブが分かる）
+
+        Returns:
+            ジョブごとの所要時間の内訳 (サンプリング時間はジョブ数で按分) のリスト
+        """
+        saved = {} if saved is None else saved
+        t = time.perf_counter()
+        interpolator = self.get_interpolator(None)
+        setup = (time.perf_counter() - t) / len(jobs)
+
+        batch = [dict(image1_path=job['image1'], image2_path=job['image2'], prompt=job['prompt'],
+                      num_frames=job['frames'], ddim_steps=job['steps'],
+                      cfg_scale=job['cfg_scale'], eta=job['eta'], fps=job['fps'], seed=job['seed'])
+                 for job in jobs]
+        t = time.perf_counter()
+        results = interpolator.interpolate_batch(batch, max_batch_size=len(jobs))
+        sample = (time.perf_counter() - t) / len(jobs)
+
+        for job, samples in zip(jobs, results):
+            saved[job['id']] = {'setup': setup, 'sample': sample, 'batch': len(jobs),
+                                'save': self._save(interpolator, job, samples)}
+        return [saved[job['id']] for job in jobs]
+
+    def run_unit(self, unit):
+        """
+        実行単位を実行し、ジョブごとの結果を返す
+
+        まとめて実行して失敗した場合、保存まで済んだジョブは完了とし、残りのジョブは
+        1件ずつ実行し直す（失敗の原因になったジョブだけが失敗として残る）。
+
+        Returns:
+            ジョブごとの所要時間の内訳 (dict)、または失敗した例外のリスト
+        """
+        if len(unit) == 1:
+            try:
+                return [self.run_job(unit[0])]
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                return [e]
+
+        saved = {}
+        try:
+            return self.run_group(unit, saved)
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            traceback.print_exc()
+            print(f"⚠️ まとめて実行できなかったため、残りの {len(unit) - len(saved)} ジョブを"
+                  f"1件ずつ実行し直します")
+        return [saved[job['id']] if job['id'] in saved else self.run_unit([job])[0]
+                for job in unit]
+
+    def _save(self, interpolator, job, samples):
+        """一時ファイルに書き出してから置き換える。所要時間を返す"""
+        output_path = self.output_path(job)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        partial = output_path.with_name(output_path.stem + '.partial' + output_path.suffix)
+        t = time.perf_counter()
+        interpolator.save_video(samples, str(partial), fps=job['fps'], **self.writer_options)
+        os.replace(partial, output_path)
+        return time.perf_counter() - t
+
+    def plan_units(self, jobs):
+        """
+        実行単位に分割（連続するモーションなしのジョブを batch_size 個までまとめる）
+        """
+        units = []
+        group = []
+        for job in jobs:
+            if self.batch_size > 1 and not job['motion']:
+                group.append(job)
+                if len(group) == self.batch_size:
+                    units.append(group)
+                    group = []
+                continue
+            if group:
+                units.append(group)
+                group = []
+            units.append([job])
+        if group:
+            units.append(group)
+        return units
+
+    def run(self, jobs, stop_on_error=False):
+        """
+        全ジョブを実行（完了済みのジョブは飛ばす）
+
+        Args:
+            jobs: load_manifest() のジョブのリスト
+            stop_on_error: 失敗したジョブがあれば中断する
+
+        Returns:
+            summary (dict)。summary.json にも保存する
+        """
+        start = time.perf_counter()
+        results = []
+        pending = [job for job in jobs if not self.ledger.is_done(job, self.output_path(job))]
+        skipped = len(jobs) - len(pending)
+        if skipped:
+            print(f"完了済みの {skipped} ジョブを飛ばして再開します")
+
+        # 結果キャッシュのキー（入力画像のハッシュを含むので最初に1回だけ計算）
+        keys = {job['id']: self.cache_key(job) for job in pending} if self.result_cache else {}
+        cached = {key for _, key, _ in self.result_cache.entries()} if self.result_cache else set()
+
+        try:
+            uncached = [job for job in pending if keys.get(job['id']) not in cached]
+            if uncached:
+                try:
+                    self.warmup_prompts(uncached)
+                except Exception as e:
+                    # 失敗してもジョブごとの実行で改めてエンコード・記録する
+                    print(f"⚠️ プロンプトの事前エンコードに失敗しました: {type(e).__name__}: {e}")
+            count = 0
+            for unit in self.plan_units(pending):
+                for job in unit:
+                    count += 1
+                    print(f"\n[{count}/{len(pending)}] {job['id']}: {job['image1']} -> {job['image2']}")
+                records = [{'id': job['id'], 'hash': job_hash(job),
+                            'output': str(self.output_path(job))} for job in unit]
+                t = time.perf_counter()
+                outcomes = {}
+                for job in unit:
+                    hit = self.fetch_cached(job, keys.get(job['id']))
+                    if hit is not None:
+                        outcomes[job['id']] = hit
+                todo = [job for job in unit if job['id'] not in outcomes]
+                for job, outcome in zip(todo, self.run_unit(todo) if todo else []):
+                    outcomes[job['id']] = outcome
+                    if not isinstance(outcome, Exception):
+                        self.store_result(job, keys.get(job['id']), outcome)
+                for record, job in zip(records, unit):
+                    outcome = outcomes[job['id']]
+                    if isinstance(outcome, Exception):
+                        record['status'] = 'failed'
+                        record['error'] = f"{type(outcome).__name__}: {outcome}"
+                        print(f"❌ 失敗: {record['id']}: {record['error']}")
+                    else:
+                        record['timings'] = outcome
+                        record['status'] = 'done'
+                        print(f"✓ 完了: {record['output']}")
+                seconds = (time.perf_counter() - t) / len(unit)
+                for record in records:
+                    record['seconds'] = seconds
+                    record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                    self.ledger.append(record)
+                    results.append(record)
+                if stop_on_error and any(r['status'] == 'failed' for r in records):
+                    break
+        finally:
+            summary = self.write_summary(jobs, results, skipped, time.perf_counter() - start)
+        return summary
+
+    def write_summary(self, jobs, results, skipped, elapsed):
+        """今回の実行結果と ledger 全体の状態を summary.json に保存"""
+        done = [r for r in results if r['status'] == 'done']
+        states = [self.ledger.records.get(job['id'], {}).get('status', 'pending') for job in jobs]
+        summary = {
+            'jobs': len(jobs),
+            'completed': states.count('done'),
+            'failed': states.count('failed'),
+            'pending': states.count('pending'),
+            'this_run': {
+                'ran': len(results),
+                'done': len(done),
+                'failed': len(results) - len(done),
+                'skipped': skipped,
+                'seconds': elapsed,
+                'mean_job_seconds': sum(r['seconds'] for r in done) / len(done) if done else 0.0,
+            },
+            'job_results': results,
+        }
+        for interpolator in self._interpolators.values():
+            summary['embedding_cache'] = interpolator.embedding_cache.stats()
+            break
+        path = self.output_dir / SUMMARY_NAME
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, path)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='マニフェストによる中割りのバッチ処理（中断・再開対応）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+マニフェスト例 (jobs.jsonl):
+  {"id": "scene01", "image1": "a.jpg", "image2": "b.jpg", "prompt": "walking", "seed": 1}
+  {"id": "scene02", "image1": "b.jpg", "image2": "c.jpg", "pan_x": 0.5, "frames": 16}
+
+マニフェスト例 (jobs.csv):
+  id,image1,image2,prompt,frames,steps,cfg_scale,seed,pan_x,zoom
+  scene01,a.jpg,b.jpg,walking,16,50,7.5,1,,
+        """
+    )
+    parser.add_argument('manifest', type=str, help='マニフェスト (.jsonl / .csv)')
+    parser.add_argument('--output-dir', type=str, default='output_videos/batch',
+                        help='出力・ledger.jsonl・summary.json の保存先')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='モーションなしのジョブをまとめてサンプリングする数 (1=ジョブごと)')
+    parser.add_argument('--stop-on-error', action='store_true',
+                        help='失敗したジョブがあれば中断する（既定は次のジョブへ進む）')
+    parser.add_argument('--model-path', type=str, default=None, help='モデルファイルのパス')
+    parser.add_argument('--config-path', type=str, default=None, help='設定ファイルのパス')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None,
+                        help='latent・画像埋め込みのディスクキャッシュ (fp16) の保存先')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                        help='推論精度')
+    parser.add_argument('--quantize', type=str, default='none', choices=QUANTIZE_MODES,
+                        help='int8: Linear層を動的量子化 (CPUのみ)')
+    add_writer_arguments(parser)
+    add_result_cache_arguments(parser)
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    print(f"マニフェスト: {args.manifest} ({len(jobs)} ジョブ)")
+
+    runner = BatchRunner(
+        args.output_dir,
+        model_path=args.model_path,
+        config_path=args.config_path,
+        device='cpu' if args.quantize == 'int8' else 'cuda',
+        precision=args.precision,
+        quantize=args.quantize,
+        embedding_cache=TensorCache(cache_dir=args.embedding_cache_dir) if args.embedding_cache_dir else None,
+        writer_options=writer_options_from_args(args),
+        batch_size=args.batch_size,
+        result_cache=result_cache_from_args(args),
+        cache_params=cli_params(args, 'batch_runner'),
+    )
+    summary = runner.run(jobs, stop_on_error=args.stop_on_error)
+
+    print("\n" + "=" * 60)
+    print(f"完了 {summary['completed']} / 失敗 {summary['failed']} / 未処理 {summary['pending']} "
+          f"(全 {summary['jobs']} ジョブ)")
+    print(f"結果: {Path(args.output_dir) / SUMMARY_NAME}")
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+補間処理のマイクロベンチマーク
+
+RIFE・モーション制御・動画書き出しのホットパスを、解像度 × フレーム数の組み合わせごとに
+計測してJSONに保存する。RIFEは決定的なスタブのフローモデルを使うので、
+モデルのダウンロードは不要（計測するのはモデル以外の前処理・バッチ化・変換のコスト）。
+
+計測対象:
+  rife.interpolate_opencv             OpenCVフォールバック
+  rife.interpolate_basic[timestep]    任意時刻の推論に対応したモデル（バッチ推論）
+  rife.interpolate_basic[bisection]   中点のみのモデル（二分割スケジュール）
+  rife.apply_motion_transform         1枚のアフィン変換
+  rife.interpolate_with_motion[hybrid|steerable]
+  motion.generate_motion_vectors      MotionController（latent解像度 H/8×W/8）
+  motion.create_motion_mask
+  save_video[ffmpeg|opencv]           動画書き出しのバックエンド
+
+使用例:
+  python benchmark.py run --output bench_baseline.json
+  python benchmark.py run --resolutions 320x512 576x1024 --frames 16 32 --output bench.json
+  python benchmark.py compare bench_baseline.json bench.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from advanced_interpolate import MotionController
+from rife_interpolate import RIFEInterpolator
+from video_writer import find_ffmpeg
+
+DEFAULT_RESOLUTIONS = ['320x512', '576x1024']
+DEFAULT_FRAMES = [8, 16]
+
+# 比較で回帰とみなす中央値の増加率と、ノイズとして無視する差（秒）
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_MIN_DELTA = 0.0005
+
+
+class StubFlowModel(torch.nn.Module):
+    """
+    RIFEの代わりに使う決定的なスタブ（中点のみを推論するモデル）
+
+    固定の重みの畳み込みで画素数に比例した計算を行い、出力は両端の線形ブレンド。
+    """
+
+    def __init__(self, channels=16, seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.encode = torch.nn.Conv2d(6, channels, 3, padding=1)
+        self.decode = torch.nn.Conv2d(channels, 3, 3, padding=1)
+        with torch.no_grad():
+            for conv in (self.encode, self.decode):
+                conv.weight.copy_(torch.randn(conv.weight.shape, generator=generator) * 0.01)
+                conv.bias.zero_()
+
+    def _blend(self, img0, img1, t):
+        features = torch.relu(self.encode(torch.cat([img0, img1], dim=1)))
+        residual = self.decode(features)
+        # 畳み込みは計算コストのためだけで、出力には影響させない
+        return ((1 - t) * img0 + t * img1 + 0 * residual).clamp(0, 1)
+
+    def forward(self, img0, img1):
+        return self._blend(img0, img1, 0.5)
+
+
+class StubTimestepFlowModel(StubFlowModel):
+    """任意の時刻を推論できるスタブ (inference(img0, img1, timestep=...))"""
+
+    def inference(self, img0, img1, timestep=0.5):
+        return self._blend(img0, img1, timestep)
+
+
+def parse_resolution(text):
+    """'320x512' → (320, 512) (H, W)"""
+    h, w = text.lower().split('x')
+    return int(h), int(w)
+
+
+def make_test_images(resolution, seed=0):
+    """
+    決定的なテスト画像のペア（グラデーション + ノイズ、2枚目は平行移動）
+
+    Args:
+        resolution: (H, W)
+
+    Returns:
+        (PIL Image, PIL Image)
+    """
+    h, w = resolution
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = np.stack([x / w, y / h, (x + y) / (w + h)], axis=-1) * 200
+    base += rng.normal(0, 20, size=base.shape)
+    img1 = base.clip(0, 255).astype(np.uint8)
+    img2 = np.roll(img1, shift=(h // 16, w // 16), axis=(0, 1))
+    return Image.fromarray(img1), Image.fromarray(img2)
+
+
+def time_call(fn, repeat=5, warmup=1):
+    """
+    fn() の実行時間を計測（標準出力は捨てる）
+
+    Returns:
+        dict: median, min, mean, stdev, repeat（秒）
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            fn()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'mean': statistics.fmean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeat': repeat,
+    }
+
+
+def make_rife(model):
+    """スタブのモデルを組み込んだRIFEInterpolator（Noneならフォールバック）"""
+    rife = RIFEInterpolator(device='cpu')
+    rife.model = model.eval() if model is not None else None
+    rife.model_loaded = True
+    return rife
+
+
+def benchmark_cases(resolution, num_frames, workdir):
+    """
+    1つの解像度・フレーム数で計測する処理の一覧
+
+    Args:
+        resolution: (H, W)
+        num_frames: フレーム数
+        workdir: 動画を書き出す一時ディレクトリ
+
+    Returns:
+        [(名前, 引数なし関数), ...]
+    """
+    img1, img2 = make_test_images(resolution)
+    opencv = make_rife(None)
+    timestep = make_rife(StubTimestepFlowModel())
+    bisection = make_rife(StubFlowModel())
+    motion = dict(pan_x=0.1, pan_y=-0.05, zoom=1.2, rotate=10)
+
+    controller = MotionController()
+    controller.set_camera_motion(pan_x=0.5, pan_y=0.2, zoom=0.3, rotate=15)
+    latent_resolution = (resolution[0] // 8, resolution[1] // 8)
+    h, w = resolution
+    regions = [
+        {'bbox': [0, 0, w // 2, h // 2], 'motion': [1.0, 0.0]},
+        {'bbox': [w // 4, h // 4, w, h], 'motion': [0.0, -1.0]},
+    ]
+
+    frames = opencv.interpolate_opencv(img1, img2, num_frames)
+
+    cases = [
+        ('rife.interpolate_opencv', lambda: opencv.interpolate_opencv(img1, img2, num_frames)),
+        ('rife.interpolate_basic[timestep]',
+         lambda: timestep.interpolate_basic(img1, img2, num_frames)),
+        ('rife.interpolate_basic[bisection]',
+         lambda: bisection.interpolate_basic(img1, img2, num_frames)),
+        ('rife.apply_motion_transform', lambda: timestep.apply_motion_transform(img2, **motion)),
+        ('rife.interpolate_with_motion[hybrid]',
+         lambda: timestep.interpolate_with_motion(img1, img2, num_frames, 'hybrid', **motion)),
+        ('rife.interpolate_with_motion[steerable]',
+         lambda: timestep.interpolate_with_motion(img1, img2, num_frames, 'steerable', **motion)),
+        ('motion.generate_motion_vectors',
+         lambda: controller.generate_motion_vectors(latent_resolution, num_frames)),
+        ('motion.create_motion_mask', lambda: controller.create_motion_mask(resolution, regions)),
+    ]
+    backends = ['opencv'] + (['ffmpeg'] if find_ffmpeg() else [])
+    for backend in backends:
+        path = Path(workdir) / f"bench_{backend}.mp4"
+        cases.append((f'save_video[{backend}]',
+                      lambda path=path, backend=backend:
+                      opencv.save_video(frames, path, fps=16, backend=backend)))
+    return cases
+
+
+def environment_info():
+    """計測環境（結果の比較時の確認用）"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'ffmpeg': find_ffmpeg() is not None,
+    }
+
+
+def run_benchmarks(resolutions, frame_counts, repeat=5, warmup=1, name_filter=None):
+    """
+    解像度 × フレーム数の全組み合わせを計測
+
+    Args:
+        resolutions: (H, W) のリスト
+        frame_counts: フレーム数のリスト
+        repeat: 計測回数
+        warmup: 計測前の空実行の回数
+        name_filter: 名前にこの文字列を含む処理だけを計測（Noneなら全て）
+
+    Returns:
+        dict: environment, created, results
+    """
+    results = []
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as workdir, torch.no_grad():
+        for resolution in resolutions:
+            for num_frames in frame_counts:
+                for name, fn in benchmark_cases(resolution, num_frames, workdir):
+                    if name_filter and name_filter not in name:
+                        continue
+                    stats = time_call(fn, repeat=repeat, warmup=warmup)
+                    result = {'name': name, 'resolution': list(resolution),
+                              'frames': num_frames, **stats}
+                    results.append(result)
+                    print(f"  {result_id(result):58} {stats['median'] * 1000:10.2f} ms")
+    return {
+        'environment': environment_info(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def result_id(result):
+    """比較に使う結果の識別子 (名前@HxW/フレーム数)"""
+    h, w = result['resolution']
+    return f"{result['name']}@{h}x{w}/{result['frames']}f"
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD, min_delta=DEFAULT_MIN_DELTA):
+    """
+    2つの計測結果の中央値を比較
+
+    Args:
+        baseline, current: run_benchmarks() の戻り値
+        threshold: 回帰とみなす増加率 (0.1 = 10%遅くなった)
+        min_delta: これより小さい差（秒）はノイズとして無視
+
+    Returns:
+        [{'id', 'baseline', 'current', 'ratio', 'status'}, ...]
+        status は 'regression' / 'improvement' / 'ok' / 'new' / 'missing'
+    """
+    base = {result_id(r): r for r in baseline['results']}
+    cur = {result_id(r): r for r in current['results']}
+    rows = []
+    for key in list(base) + [k for k in cur if k not in base]:
+        b, c = base.get(key), cur.get(key)
+        if b is None or c is None:
+            rows.append({'id': key, 'baseline': b and b['median'], 'current': c and c['median'],
+                         'ratio': None, 'status': 'new' if b is None else 'missing'})
+            continue
+        delta = c['median'] - b['median']
+        ratio = c['median'] / b['median'] if b['median'] else float('inf')
+        status = 'ok'
+        if abs(delta) >= min_delta:
+            if ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 / (1 + threshold):
+                status = 'improvement'
+        rows.append({'id': key, 'baseline': b['median'], 'current': c['median'],
+                     'ratio': ratio, 'status': status})
+    return rows
+
+
+def print_comparison(rows):
+    """比較結果の表を表示"""
+    marks = {'regression': '❌ 回帰', 'improvement': '✓ 改善', 'ok': '', 'new': '新規',
+             'missing': '計測なし'}
+    print(f"{'':58}{'基準 (ms)':>12}{'今回 (ms)':>12}{'比率':>8}")
+    for row in rows:
+        base = f"{row['baseline'] * 1000:.2f}" if row['baseline'] is not None else '-'
+        cur = f"{row['current'] * 1000:.2f}" if row['current'] is not None else '-'
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+        print(f"{row['id']:58}{base:>12}{cur:>12}{ratio:>8}  {marks[row['status']]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='補間処理のマイクロベンチマーク')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='計測してJSONに保存')
+    run.add_argument('--resolutions', nargs='+', default=DEFAULT_RESOLUTIONS,
+                     help='解像度 HxW のリスト')
+    run.add_argument('--frames', type=int, nargs='+', default=DEFAULT_FRAMES,
+                     help='フレーム数のリスト')
+    run.add_argument('--repeat', type=int, default=5, help='計測回数（中央値を使う）')
+    run.add_argument('--warmup', type=int, default=1, help='計測前の空実行の回数')
+    run.add_argument('--filter', type=str, default=None, help='名前にこの文字列を含む処理だけ計測')
+    run.add_argument('--threads', type=int, default=None, help='torchのスレッド数')
+    run.add_argument('--output', type=str, default=None, help='結果のJSONの保存先')
+
+    compare = sub.add_parser('compare', help='基準の結果と比較して回帰を検出')
+    compare.add_argument('baseline', help='基準の結果のJSON')
+    compare.add_argument('current', help='今回の結果のJSON')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                         help='回帰とみなす中央値の増加率 (0.1 = 10%%)')
+    compare.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA * 1000,
+                         help='これより小さい差 (ms) はノイズとして無視')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.repeat < 1:
+            parser.error('--repeat には1以上を指定してください')
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        resolutions = [parse_resolution(r) for r in args.resolutions]
+        print(f"🔄 計測中 (解像度 {args.resolutions} × フレーム数 {args.frames}, "
+              f"{args.repeat}回の中央値)")
+        report = run_benchmarks(resolutions, args.frames, repeat=args.repeat,
+                                warmup=args.warmup, name_filter=args.filter)
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+            print(f"✓ 結果を保存しました: {args.output}")
+        else:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    if baseline.get('environment') != current.get('environment'):
+        print("⚠️ 計測環境が異なります（結果は参考値）")
+    rows = compare_results(baseline, current, threshold=args.threshold,
+                           min_delta=args.min_delta_ms / 1000)
+    print_comparison(rows)
+    regressions = [row for row in rows if row['status'] == 'regression']
+    if regressions:
+        print(f"\n❌ {len(regressions)}件の回帰があります (しきい値 {args.threshold:.0%})")
+        sys.exit(1)
+    print("\n✓ 回帰はありません")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+パイプライン全体のベンチマーク（スタブのDynamiCrafterモデル）
+
+FrameInterpolator.interpolate → save_video の実際のコードを、チェックポイントなしで動かして
+段階ごとの所要時間を計測する。UNet以外（前処理・条件付け・キャッシュ・テンソル変換・
+動画書き出し）のオーバーヘッドを調べて最適化するためのもの。
+
+- モデル: StubDynamiCrafter（実際と同じテンソル形状を返し、呼び出しごとのコストは指定可能）。
+  model_registry のローダーを差し替えて読み込ませる
+- サンプラー: lvdm.models.samplers.ddim.DDIMSampler を計測中だけスタブに置き換える。
+  サンプリングの手順は補間器と同じ sampling.py で、DDIMSampler は各ステップで
+  model.apply_model を呼ぶ（CFGありなら2回）
+- 段階の区切り: 補間器の ProgressTracker のイベント（load / motion / preprocess / encode /
+  condition / sampling / decode / write）
+
+コストは秒単位で、time.sleep で消費する（CPU負荷の揺らぎを結果に混ぜない）。
+
+使用例:
+  python benchmark_pipeline.py --frames 16 --steps 10
+  python benchmark_pipeline.py --mode long --frames 40 --cost apply_model=0.2 --output pipeline.json
+"""
+import argparse
+import contextlib
+import json
+import random
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+import model_registry
+from embedding_cache import TensorCache, PromptEmbeddingCache
+from progress import ProgressTracker
+
+# 呼び出し1回あたりのコスト（秒）の既定値。apply_model は UNet の1回の評価
+DEFAULT_COSTS = {
+    'encode_first_stage': 0.0,
+    'decode_first_stage': 0.0,
+    'embedder': 0.0,
+    'image_proj_model': 0.0,
+    'get_learned_conditioning': 0.0,
+    'apply_model': 0.0,
+}
+
+MODES = ['basic', 'long', 'advanced']
+
+
+class StubPosterior:
+    """VAEの事後分布のスタブ（lvdm の DiagonalGaussianDistribution と同じく sample は乱数を使う）"""
+
+    def __init__(self, mean, std=0.05):
+        self.mean = mean
+        self.std = std
+
+    def sample(self):
+        return self.mean + self.std * torch.randn(self.mean.shape)
+
+    def mode(self):
+        return self.mean
+
+
+class StubDynamiCrafter(torch.nn.Module):
+    """
+    DynamiCrafterの推論で使う部分だけを持つスタブ
+
+    形状は dynamicrafter_512_interp_v1 に合わせる:
+      first_stage_model.encode: (N,3,H,W) → 事後分布 (N,4,H/8,W/8)
+      decode_first_stage: (b,4,t,h,w) → (b,3,t,8h,8w)
+      embedder: (N,3,H,W) → (N,257,1280)、image_proj_model: → (N,256,1024)
+      get_learned_conditioning: プロンプトのリスト → (n,77,1024)
+    """
+
+    uncond_type = 'empty_seq'
+    scale_factor = 1.0
+
+    def __init__(self, costs=None, temporal_length=16):
+        super().__init__()
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.temporal_length = temporal_length
+        self.model = types.SimpleNamespace(diffusion_model=types.SimpleNamespace(out_channels=4))
+        self.first_stage_model = types.SimpleNamespace(encode=self._encode)
+        # メソッドごとの呼び出し回数と合計時間
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    @property
+    def device(self):
+        return torch.device('cpu')
+
+    @contextlib.contextmanager
+    def _call(self, name):
+        start = time.perf_counter()
+        time.sleep(self.costs.get(name, 0.0))
+        yield
+        self.calls[name] += 1
+        self.seconds[name] += time.perf_counter() - start
+
+    def _encode(self, x):
+        with self._call('encode_first_stage'):
+            z = torch.nn.functional.avg_pool2d(x, 8)
+            return StubPosterior(torch.cat([z, z.mean(1, keepdim=True)], dim=1))
+
+    def encode_first_stage(self, x):
+        return self.scale_factor * self.first_stage_model.encode(x).sample()
+
+    def decode_first_stage(self, z):
+        with self._call('decode_first_stage'):
+            video = z[:, :3].clamp(-1, 1)
+            return video.repeat_interleave(8, -1).repeat_interleave(8, -2)
+
+    def embedder(self, x):
+        with self._call('embedder'):
+            pooled = x.mean((2, 3))  # (N,3)
+            return pooled[:, None, :].repeat(1, 257, 427)[..., :1280]
+
+    def image_proj_model(self, x):
+        with self._call('image_proj_model'):
+            return x[:, :256, :1024].contiguous()
+
+    def get_learned_conditioning(self, prompts):
+        with self._call('get_learned_conditioning'):
+            return torch.zeros(len(prompts), 77, 1024)
+
+    def apply_model(self, x, t, cond, **kwargs):
+        with self._call('apply_model'):
+            return x * 0.1
+
+
+class StubDDIMSampler:
+    """lvdm の DDIMSampler.sample と同じ引数を受け取るスタブ"""
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+
+    def sample(self, S, batch_size, shape, conditioning=None, callback=None, x_T=None,
+               unconditional_guidance_scale=1.0, unconditional_conditioning=None,
+               mask=None, x0=None, **kwargs):
+        x = x_T if x_T is not None else torch.randn(batch_size, *shape)
+        for i in range(S):
+            t = torch.full((batch_size,), S - i, dtype=torch.long)
+            e_t = self.model.apply_model(x, t, conditioning)
+            if unconditional_conditioning is not None and unconditional_guidance_scale != 1.0:
+                e_u = self.model.apply_model(x, t, unconditional_conditioning)
+                e_t = e_u + unconditional_guidance_scale * (e_t - e_u)
+            x = x - e_t
+            if mask is not None:
+                x = x0 * mask + (1. - mask) * x
+            if callback is not None:
+                callback(i)
+        return x, None
+
+
+def _seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    return seed
+
+
+@contextlib.contextmanager
+def stub_dynamicrafter(costs=None):
+    """
+    計測中だけDynamiCrafterの外部モジュールとモデルのローダーをスタブに置き換える
+
+    pytorch_lightning が入っていればそのまま使う。
+
+    Yields:
+        作成したスタブのモデルのリスト（読み込まれた順）
+    """
+    modules = {
+        'lvdm': types.ModuleType('lvdm'),
+        'lvdm.models': types.ModuleType('lvdm.models'),
+        'lvdm.models.samplers': types.ModuleType('lvdm.models.samplers'),
+        'lvdm.models.samplers.ddim': types.ModuleType('lvdm.models.samplers.ddim'),
+    }
+    modules['lvdm.models.samplers.ddim'].DDIMSampler = StubDDIMSampler
+    try:
+        import pytorch_lightning  # noqa: F401
+    except ImportError:
+        modules['pytorch_lightning'] = types.ModuleType('pytorch_lightning')
+        modules['pytorch_lightning'].seed_everything = _seed_everything
+
+    models = []
+
+    def loader(config_path, model_path, device, dtype):
+        model = StubDynamiCrafter(costs)
+        models.append(model)
+        return model
+
+    registry = model_registry.get_registry()
+    saved_modules = {name: sys.modules.get(name) for name in modules}
+    saved_loader = registry.loader
+    sys.modules.update(modules)
+    registry.loader = loader
+    try:
+        yield models
+    finally:
+        registry.loader = saved_loader
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+class StageTimer:
+    """ProgressTracker のイベントから段階ごとの所要時間を集計するリスナー"""
+
+    def __init__(self):
+        self.marks = []  # (段階名, 開始時刻)
+        self.steps = defaultdict(int)
+
+    def mark(self, stage):
+        """段階の開始を記録（None は終了）"""
+        self.marks.append((stage, time.perf_counter()))
+
+    def __call__(self, event):
+        if event['event'] == 'stage':
+            self.mark(event['stage'])
+        elif event['event'] == 'step':
+            self.steps[event['stage']] = event['step']
+        elif event['event'] == 'done':
+            self.mark(None)
+
+    def durations(self):
+        """段階ごとの合計秒数（同じ段階が複数回あれば合算）"""
+        totals = defaultdict(float)
+        for (stage, start), (_, end) in zip(self.marks, self.marks[1:]):
+            if stage is not None:
+                totals[stage] += end - start
+        return dict(totals)
+
+
+def make_test_images(seed=0):
+    """決定的な入力画像のペア (320x512)"""
+    rng = np.random.default_rng(seed)
+    img1 = rng.integers(0, 256, size=(320, 512, 3), dtype=np.uint8)
+    img2 = np.roll(img1, shift=(20, 32), axis=(0, 1))
+    return Image.fromarray(img1), Image.fromarray(img2)
+
+
+def run_pipeline(mode='basic', num_frames=16, ddim_steps=10, cfg_scale=7.5, costs=None,
+                 warm_cache=False, backend='auto', workdir=None):
+    """
+    スタブのモデルでパイプラインを1回実行して段階ごとの時間を計測
+
+    Args:
+        mode: 'basic' (interpolate), 'long' (interpolate_long), 'advanced' (モーション制御付き)
+        num_frames: フレーム数
+        ddim_steps: DDIMのステップ数
+        cfg_scale: CFGスケール（1.0以外なら1ステップで apply_model を2回呼ぶ）
+        costs: 呼び出しごとのコスト (DEFAULT_COSTS のキー → 秒)
+        warm_cache: Trueなら同じ入力で1回実行して埋め込みキャッシュを温めてから計測
+        backend: 動画書き出しのバックエンド
+        workdir: チェックポイントの代わりのパスと動画の出力先（省略時は一時ディレクトリ）
+
+    Returns:
+        dict: stages（段階ごとの秒数）, model（メソッドごとの回数・秒数）, total, overhead
+    """
+    from interpolate import FrameInterpolator
+    from advanced_interpolate import AdvancedFrameInterpolator
+
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        models = stack.enter_context(stub_dynamicrafter(costs))
+        stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+
+        # setup_model はチェックポイントの2つ上のディレクトリに hf_cache を作る
+        (Path(workdir) / 'stub' / 'checkpoints').mkdir(parents=True, exist_ok=True)
+        timer = StageTimer()
+        options = dict(
+            model_path=str(Path(workdir) / 'stub' / 'checkpoints' / 'model.ckpt'),
+            config_path=str(Path(workdir) / 'stub' / 'inference.yaml'),
+            device='cpu',
+            embedding_cache=TensorCache(),
+            prompt_cache=PromptEmbeddingCache(),
+            progress=ProgressTracker([timer]),
+        )
+        if mode == 'advanced':
+            interpolator = AdvancedFrameInterpolator(interpolation_method='hybrid', **options)
+        else:
+            interpolator = FrameInterpolator(**options)
+        stack.callback(interpolator.release_model)
+
+        img1, img2 = make_test_images()
+        kwargs = dict(num_frames=num_frames, ddim_steps=ddim_steps, cfg_scale=cfg_scale)
+        if mode == 'advanced':
+            kwargs['motion_control'] = {'camera': {'pan_x': 0.3, 'pan_y': 0.0, 'zoom': 0.2,
+                                                   'rotate': 0.0}}
+        generate = interpolator.interpolate_long if mode == 'long' else interpolator.interpolate
+        output_path = Path(workdir) / f'pipeline_{mode}.mp4'
+
+        start = time.perf_counter()
+        interpolator.setup_model()
+        if warm_cache:
+            interpolator.save_video(generate(img1, img2, **kwargs), str(output_path))
+            interpolator.progress.reset()
+            model = models[-1]
+            model.calls.clear()
+            model.seconds.clear()
+            timer.marks.clear()
+            start = time.perf_counter()
+
+        samples = generate(img1, img2, **kwargs)
+        interpolator.save_video(samples, str(output_path), backend=backend)
+        interpolator.progress.done()
+        total = time.perf_counter() - start
+
+    model = models[-1]
+    model_seconds = sum(model.seconds.values())
+    return {
+        'mode': mode,
+        'frames': num_frames,
+        'steps': ddim_steps,
+        'cfg_scale': cfg_scale,
+        'warm_cache': warm_cache,
+        'costs': model.costs,
+        'stages': timer.durations(),
+        'sampling_steps': timer.steps.get('sampling', 0),
+        'model': {name: {'calls': model.calls[name], 'seconds': model.seconds[name]}
+                  for name in sorted(model.calls)},
+        'total': total,
+        'model_seconds': model_seconds,
+        # スタブのモデル以外（パイプライン側）にかかった時間
+        'overhead': total - model_seconds,
+    }
+
+
+def print_report(result):
+    """段階ごとの時間とモデル呼び出しの内訳を表示"""
+    total = result['total']
+    print(f"\n📊 {result['mode']}: {result['frames']}フレーム × {result['steps']}ステップ "
+          f"(合計 {total:.3f}s, モデル以外 {result['overhead']:.3f}s)")
+    print(f"{'段階':16}{'秒':>10}{'割合':>8}")
+    for stage, seconds in result['stages'].items():
+        print(f"{stage:16}{seconds:>10.3f}{seconds / total:>8.1%}")
+    print(f"\n{'モデル呼び出し':28}{'回数':>6}{'秒':>10}")
+    for name, info in result['model'].items():
+        print(f"{name:28}{info['calls']:>6}{info['seconds']:>10.3f}")
+
+
+def parse_costs(items):
+    """['apply_model=0.2', ...] → {'apply_model': 0.2}"""
+    costs = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        if name not in DEFAULT_COSTS:
+            raise ValueError(f"不明なコスト: {name} ({', '.join(DEFAULT_COSTS)})")
+        costs[name] = float(value)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スタブのDynamiCrafterモデルによるパイプラインのベンチマーク')
+    parser.add_argument('--mode', type=str, default='basic', choices=MODES,
+                        help='basic: interpolate, long: interpolate_long, advanced: モーション制御付き')
+    parser.add_argument('--frames', type=int, default=16, help='フレーム数')
+    parser.add_argument('--steps', type=int, default=10, help='DDIMのステップ数')
+    parser.add_argument('--cfg-scale', type=float, default=7.5, help='CFGスケール')
+    parser.add_argument('--cost', type=str, nargs='*', default=[],
+                        help=f"呼び出しごとのコスト 名前=秒 ({', '.join(DEFAULT_COSTS)})")
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='埋め込みキャッシュを温めてから計測（2回目以降の実行を想定）')
+    parser.add_argument('--repeat', type=int, default=1, help='計測回数（合計時間の中央値の回を報告）')
+    parser.add_argument('--backend', type=str, default='auto', choices=['auto', 'ffmpeg', 'opencv'],
+                        help='動画書き出しのバックエンド')
+    parser.add_argument('--output', type=str, default=None, help='結果のJSONの保存先')
+    args = parser.parse_args()
+
+    try:
+        costs = parse_costs(args.cost)
+    except ValueError as e:
+        parser.error(str(e))
+
+    runs = []
+    for i in range(max(1, args.repeat)):
+        print(f"🔄 計測中 ({i + 1}/{max(1, args.repeat)})...")
+        runs.append(run_pipeline(mode=args.mode, num_frames=args.frames, ddim_steps=args.steps,
+                                 cfg_scale=args.cfg_scale, costs=costs,
+                                 warm_cache=args.warm_cache, backend=args.backend))
+    runs.sort(key=lambda run: run['total'])
+    result = runs[len(runs) // 2]
+    result['totals'] = [run['total'] for run in runs]
+
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2, ensure_ascii=False))
+        print(f"\n✓ 結果を保存しました: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+カスケード中割り: DynamiCrafterでキーフレームを生成し、RIFEで時間方向に補間
+
+重いDynamiCrafterは少数のキーフレーム（例: 8フレーム）だけを生成し、
+その間を軽いRIFEで埋めて目標FPSの滑らかな動画にする。
+キーフレームはテンソルのままRIFEに渡し、中間のmp4の書き出し・読み込みはしない。
+RIFEの出力は生成した順に動画ライターへ流し込む。
+
+使用例:
+  python cascade_interpolate.py --image1 a.jpg --image2 b.jpg \\
+    --keyframes 8 --source-fps 5 --target-fps 30
+"""
+import argparse
+import time
+from pathlib import Path
+
+import torch
+
+from interpolate import FrameInterpolator
+from embedding_cache import TensorCache
+from precision import PRECISIONS
+from quantize import QUANTIZE_MODES
+from result_cache import add_result_cache_arguments, cli_params, result_cache_from_args
+from rife_interpolate import RIFEInterpolator
+from video_writer import write_video, add_writer_arguments, writer_options_from_args
+
+
+def upsample_factor(source_fps, target_fps):
+    """
+    キーフレーム間を何分割するか（source_fps × 分割数 ≒ target_fps）
+
+    Args:
+        source_fps: キーフレームのFPS
+        target_fps: 出力動画のFPS
+    """
+    return max(1, int(round(target_fps / source_fps)))
+
+
+def keyframe_tensors(samples, device='cpu'):
+    """
+    DynamiCrafterの出力テンソルをRIFEの入力形式に変換してyield
+
+    Args:
+        samples: 生成された動画テンソル (b, samples, c, t, h, w) [-1, 1]
+        device: RIFEのデバイス
+
+    Yields:
+        (1,3,H,W) float32テンソル [0,1]
+    """
+    video = samples[0, 0].detach()
+    for i in range(video.shape[1]):
+        frame = (video[:, i].float().clamp(-1., 1.) + 1.0) / 2.0
+        yield frame.unsqueeze(0).to(device)
+
+
+def tensor_to_rgb24(frame):
+    """(1,3,H,W) テンソル [0,1] → (H,W,3) uint8 numpy配列"""
+    frame = (frame.squeeze(0).float().clamp(0., 1.) * 255).round().byte()
+    return frame.permute(1, 2, 0).cpu().numpy()
+
+
+class CascadeInterpolator:
+    """DynamiCrafter（キーフレーム）→ RIFE（時間方向の補間）のカスケード"""
+
+    def __init__(self, interpolator=None, rife=None):
+        """
+        初期化
+
+        Args:
+            interpolator: FrameInterpolator（省略時はデフォルト設定で作成）
+            rife: RIFEInterpolator（省略時はCPUで作成）
+        """
+        self.interpolator = interpolator or FrameInterpolator()
+        self.rife = rife or RIFEInterpolator(device='cpu')
+
+    def generate_keyframes(self, image1, image2, prompt="", keyframes=8, ddim_steps=50,
+                           cfg_scale=7.5, source_fps=5, seed=123):
+        """
+        DynamiCrafterでキーフレームを生成
+
+        ネイティブ長を超える場合は interpolate_long() を使う。
+
+        Returns:
+            生成された動画テンソル (1, 1, c, keyframes, h, w)
+        """
+        interpolate_fn = self.interpolator.interpolate
+        if self.interpolator.model is not None and \
+                keyframes > getattr(self.interpolator.model, 'temporal_length', 16):
+            interpolate_fn = self.interpolator.interpolate_long
+        return interpolate_fn(image1, image2, prompt=prompt, num_frames=keyframes,
+                              ddim_steps=ddim_steps, cfg_scale=cfg_scale, fps=source_fps,
+                              seed=seed)
+
+    def iter_upsampled(self, samples, factor):
+        """
+        キーフレームの各区間をRIFEで factor 分割し、全フレームを時間順にyield
+
+        区間の境界のキーフレームは1回だけ出力する。
+
+        Args:
+            samples: キーフレームの動画テンソル (1, 1, c, t, h, w) [-1, 1]
+            factor: 区間の分割数（1ならキーフレームのみ）
+
+        Yields:
+            (1,3,H,W) テンソル [0,1]
+        """
+        if not self.rife.model_loaded:
+            self.rife.load_model()
+
+        keyframes = keyframe_tensors(samples, self.rife.device)
+        previous = next(keyframes)
+        yield previous
+        for current in keyframes:
+            segment = self._iter_segment(previous, current, factor + 1)
+            next(segment)  # 先頭は前の区間の末尾と同じ
+            yield from segment
+            previous = current
+
+    def _iter_segment(self, I0, I1, num_frames):
+        if num_frames <= 2:
+            return iter([I0, I1])
+        if self.rife.model is None:
+            # RIFEが使えない場合は線形ブレンド（RIFEInterpolatorのOpenCVフォールバックと同じ）
+            return ((1 - t) * I0 + t * I1 for t in
+                    (i / (num_frames - 1) for i in range(num_frames)))
+        return self.rife.iter_frames_tensor(I0, I1, num_frames)
+
+    def interpolate(self, image1, image2, output_path, prompt="", keyframes=8, ddim_steps=50,
+                    cfg_scale=7.5, source_fps=5, target_fps=30, seed=123, backend='auto',
+                    **writer_options):
+        """
+        キーフレーム生成からRIFE補間・動画保存までを実行
+
+        Args:
+            image1: 開始画像（パス / PIL Image / numpy配列）
+            image2: 終了画像（パス / PIL Image / numpy配列）
+            output_path: 出力動画のパス
+            prompt: テキストプロンプト
+            keyframes: DynamiCrafterで生成するフレーム数
+            ddim_steps: DDIMサンプリングのステップ数
+            cfg_scale: Classifier-free guidanceのスケール
+            source_fps: キーフレームのFPS（DynamiCrafterのfps条件）
+            target_fps: 出力動画のFPS
+            seed: ランダムシード
+            backend, **writer_options: video_writer.write_video と同じ
+
+        Returns:
+            書き込んだフレーム数
+        """
+        factor = upsample_factor(source_fps, target_fps)
+        total = (keyframes - 1) * factor + 1
+
+        print(f"🎬 DynamiCrafterで{keyframes}キーフレームを生成中...")
+        samples = self.generate_keyframes(image1, image2, prompt=prompt, keyframes=keyframes,
+                                          ddim_steps=ddim_steps, cfg_scale=cfg_scale,
+                                          source_fps=source_fps, seed=seed)
+
+        print(f"🔄 RIFEで各区間を{factor}分割中 (合計{total}フレーム, {target_fps}fps)...")
+        with torch.no_grad():
+            frames = (tensor_to_rgb24(frame) for frame in self.iter_upsampled(samples, factor))
+            count = write_video(frames, output_path, fps=target_fps, backend=backend,
+                                **writer_options)
+
+        print(f"✓ 動画を保存しました: {output_path} ({count}フレーム)")
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='カスケード中割り (DynamiCrafterのキーフレーム + RIFEの時間補間)')
+    parser.add_argument('--image1', type=str, required=True, help='最初の画像のパス')
+    parser.add_argument('--image2', type=str, required=True, help='2番目の画像のパス')
+    parser.add_argument('--output', type=str, default='output_videos/cascade.mp4',
+                       help='出力動画のパス')
+    parser.add_argument('--prompt', type=str, default='', help='テキストプロンプト')
+    parser.add_argument('--keyframes', type=int, default=8,
+                       help='DynamiCrafterで生成するキーフレーム数')
+    parser.add_argument('--source-fps', type=int, default=5,
+                       help='キーフレームのFPS (DynamiCrafterのfps条件)')
+    parser.add_argument('--target-fps', type=int, default=30, help='出力動画のFPS')
+    parser.add_argument('--steps', type=int, default=50, help='DDIMサンプリングのステップ数')
+    parser.add_argument('--cfg-scale', type=float, default=7.5, help='Classifier-free guidanceスケール')
+    parser.add_argument('--seed', type=int, default=123, help='ランダムシード')
+    parser.add_argument('--model-path', type=str, default=None, help='モデルファイルのパス')
+    parser.add_argument('--config-path', type=str, default=None, help='設定ファイルのパス')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None,
+                       help='latent・画像埋め込みのディスクキャッシュ (fp16) の保存先')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                       help='DynamiCrafterの推論精度')
+    parser.add_argument('--quantize', type=str, default='none', choices=QUANTIZE_MODES,
+                       help='int8: DynamiCrafterのLinear層を動的量子化 (CPUのみ)')
+    parser.add_argument('--rife-device', type=str, default='cpu', help='RIFEのデバイス')
+    parser.add_argument('--rife-batch-size', type=int, default=8,
+                       help='RIFEで1回の推論にまとめるフレームペア数の上限')
+    parser.add_argument('--tile-size', type=int, default=0,
+                       help='RIFEのタイル推論のタイルの一辺（0で無効）')
+    parser.add_argument('--tile-overlap', type=int, default=64, help='RIFEのタイルの重なり幅')
+    add_writer_arguments(parser)
+    add_result_cache_arguments(parser)
+
+    args = parser.parse_args()
+    if args.keyframes < 2:
+        parser.error('--keyframes には2以上を指定してください')
+
+    interpolator = FrameInterpolator(
+        model_path=args.model_path,
+        config_path=args.config_path,
+        device='cpu' if args.quantize == 'int8' else 'cuda',
+        embedding_cache=TensorCache(cache_dir=args.embedding_cache_dir) if args.embedding_cache_dir else None,
+        precision=args.precision,
+        quantize=args.quantize
+    )
+    rife = RIFEInterpolator(device=args.rife_device, max_batch_size=args.rife_batch_size,
+                            tile_size=args.tile_size, tile_overlap=args.tile_overlap)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(exist_ok=True, parents=True)
+
+    # 結果キャッシュ（同じ入力・設定の動画があればDynamiCrafterを読み込まずに返す）
+    result_cache = result_cache_from_args(args)
+    if result_cache is not None:
+        cache_params = cli_params(args, 'cascade_interpolate')
+        model_id = f"{interpolator.model_identity()}|{rife.model_identity()}"
+        cache_key = result_cache.key([args.image1, args.image2], cache_params, model_id)
+        if result_cache.fetch(cache_key, output_path):
+            print(f"\n✅ 結果キャッシュから取り出しました: {output_path}")
+            return
+    generation_start = time.perf_counter()
+
+    interpolator.setup_model()
+    cascade = CascadeInterpolator(interpolator, rife)
+    cascade.interpolate(
+        args.image1,
+        args.image2,
+        str(output_path),
+        prompt=args.prompt,
+        keyframes=args.keyframes,
+        ddim_steps=args.steps,
+        cfg_scale=args.cfg_scale,
+        source_fps=args.source_fps,
+        target_fps=args.target_fps,
+        seed=args.seed,
+        **writer_options_from_args(args)
+    )
+    if result_cache is not None:
+        result_cache.store(cache_key, output_path, time.perf_counter() - generation_start,
+                           cache_params)
+
+    print(f"\n✅ 完了! {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+DynamiCrafterチェックポイントを推論専用の軽量版に変換
+
+- EMA重みがあればそれを採用し、学習用の重み・オプティマイザ状態などは除外
+- 既定は fp32 のまま保存。--dtype fp16 / bf16 で任意に変換（拡散スケジュールのバッファは fp32 のまま）
+- safetensors 形式で保存（読み込み時にmmapでき、pickleの復元が不要）
+
+使用例:
+  python convert_checkpoint.py \\
+    --input checkpoints/dynamicrafter_512_interp_v1/model.ckpt \\
+    --output checkpoints/dynamicrafter_512_interp_v1/model_slim.safetensors
+"""
+import argparse
+import time
+from pathlib import Path
+
+import torch
+
+DTYPES = {'fp32': torch.float32, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+EMA_PREFIX = 'model_ema.'
+
+
+def load_state_dict(path):
+    """
+    .ckpt からstate_dictを取り出す（load_model_checkpoint と同じ形式に対応）
+
+    Args:
+        path: チェックポイントのパス
+
+    Returns:
+        state_dict
+    """
+    # 元のチェックポイントはload_model_checkpointと同様にpickleとして読み込む
+    checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+    if 'state_dict' in checkpoint:
+        return checkpoint['state_dict']
+    if 'module' in checkpoint:
+        # deepspeed形式: 先頭の '_forward_module.' を除去
+        return {key[16:]: value for key, value in checkpoint['module'].items()}
+    return checkpoint
+
+
+def extract_ema_weights(state_dict):
+    """
+    EMA重みで本体の重みを置き換え、EMA用のキーを除外
+
+    LVDMのEMAは 'model_ema.<ドットを除いたパラメータ名>' で保存されている。
+
+    Args:
+        state_dict: 元のstate_dict
+
+    Returns:
+        (推論用state_dict, 置き換えたパラメータ数)
+    """
+    ema = {key[len(EMA_PREFIX):]: value for key, value in state_dict.items()
+           if key.startswith(EMA_PREFIX)}
+    slim = {}
+    replaced = 0
+    for key, value in state_dict.items():
+        if key.startswith(EMA_PREFIX):
+            continue
+        if key.startswith('model.'):
+            ema_value = ema.get(key[len('model.'):].replace('.', ''))
+            if ema_value is not None:
+                value = ema_value
+                replaced += 1
+        slim[key] = value
+    return slim, replaced
+
+
+def cast_state_dict(state_dict, dtype):
+    """
+    浮動小数点の重みを dtype に変換
+
+    ルート直下のバッファ (betas, alphas_cumprod などの拡散スケジュール) は
+    精度が必要なので fp32 のまま残す。
+    """
+    out = {}
+    for key, value in state_dict.items():
+        if value.is_floating_point() and '.' in key:
+            value = value.to(dtype)
+        out[key] = value
+    return out
+
+
+def convert(input_path, output_path, dtype='fp32', use_ema=True):
+    """
+    チェックポイントを変換して保存
+
+    Args:
+        input_path: 元の .ckpt
+        output_path: 出力先 (.safetensors)
+        dtype: 'fp32', 'fp16', 'bf16'
+        use_ema: EMA重みがあれば採用する
+
+    Returns:
+        統計情報のdict
+    """
+    from safetensors.torch import save_file
+
+    start = time.perf_counter()
+    state_dict = load_state_dict(input_path)
+    n_original = len(state_dict)
+
+    replaced = 0
+    if use_ema:
+        state_dict, replaced = extract_ema_weights(state_dict)
+    else:
+        state_dict = {k: v for k, v in state_dict.items() if not k.startswith(EMA_PREFIX)}
+
+    state_dict = {k: v for k, v in state_dict.items() if torch.is_tensor(v)}
+    state_dict = cast_state_dict(state_dict, DTYPES[dtype])
+
+    # safetensorsは共有ストレージを保存できないため、共有している重みは複製
+    seen = set()
+    for key, value in state_dict.items():
+        ptr = value.untyped_storage().data_ptr()
+        value = value.contiguous()
+        if ptr in seen:
+            value = value.clone()
+        seen.add(ptr)
+        state_dict[key] = value
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    save_file(state_dict, str(output_path), metadata={
+        'source': Path(input_path).name,
+        'dtype': dtype,
+        'ema': str(replaced > 0),
+    })
+
+    size = sum(v.numel() * v.element_size() for v in state_dict.values())
+    return {
+        'keys_in': n_original,
+        'keys_out': len(state_dict),
+        'ema_replaced': replaced,
+        'bytes': size,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DynamiCrafterチェックポイントを推論専用の軽量版に変換')
+    parser.add_argument('--input', type=str, required=True, help='元のチェックポイント (.ckpt)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='出力先 (.safetensors, 省略時は <input>_slim.safetensors)')
+    parser.add_argument('--dtype', type=str, default='fp32', choices=list(DTYPES),
+                        help='重みのdtype (既定: fp32、fp16 / bf16 は任意)')
+    parser.add_argument('--no-ema', action='store_true', help='EMA重みを使わない')
+    args = parser.parse_args()
+
+    output = args.output or str(Path(args.input).with_name(Path(args.input).stem + '_slim.safetensors'))
+
+    print(f"変換中: {args.input} -> {output} ({args.dtype})")
+    stats = convert(args.input, output, dtype=args.dtype, use_ema=not args.no_ema)
+    print(f"✓ 完了: {stats['keys_in']} -> {stats['keys_out']} キー, "
+          f"EMA置き換え {stats['ema_replaced']}, "
+          f"{stats['bytes'] / 1024 ** 3:.2f} GB, {stats['seconds']:.1f}秒")
+    print(f"使用方法: --model-path {output}")
+
+
+if __name__ == '__main__':
+    main()
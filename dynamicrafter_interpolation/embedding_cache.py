@@ -0,0 +1,341 @@
+"""
+キーフレームlatent・CLIP画像埋め込み・プロンプト埋め込みのキャッシュ
+
+同じ入力画像で設定だけを変えて何度も中割りする場合に、VAEエンコード
+(encode_first_stage) や画像埋め込み (embedder + image_proj_model) を
+毎回やり直さないためのキャッシュ。
+
+- キー: 前処理済み画像テンソルの内容ハッシュ + 解像度 + モデル識別子
+- メモリ層: バイト数上限つきLRU
+- ディスク層 (任意): fp16で保存し、プロセスをまたいで再利用
+
+プロンプトのテキスト埋め込み (get_learned_conditioning) は (モデル, プロンプト)
+をキーにした件数上限つきLRU (PromptEmbeddingCache) で別に保持する。
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import torch
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2  # 512MB
+DEFAULT_MAX_PROMPTS = 256
+
+
+def tensor_digest(tensor):
+    """テンソル内容のSHA-256 (dtype・形状を含む)"""
+    t = tensor.detach().contiguous().cpu()
+    h = hashlib.sha256()
+    h.update(f"{t.dtype}|{tuple(t.shape)}|".encode())
+    h.update(t.view(torch.uint8).numpy().tobytes() if t.numel() else b'')
+    return h.hexdigest()
+
+
+def model_identity(model_path, config_path, *extra):
+    """
+    モデルを識別する文字列
+
+    パスに加えてファイルサイズと更新時刻を含めるので、同じパスの
+    チェックポイントが差し替えられた場合も別のモデルとして扱う。
+
+    Args:
+        model_path: チェックポイントのパス
+        config_path: 設定ファイルのパス
+        *extra: デバイス・精度などの追加要素
+    """
+    parts = []
+    for path in (model_path, config_path):
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_size}:{int(st.st_mtime)}")
+        except OSError:
+            parts.append(path)
+    parts.extend(str(e) for e in extra)
+    return "|".join(parts)
+
+
+class TensorCache:
+    """
+    内容アドレス方式のテンソルキャッシュ（メモリLRU + 任意のディスク層）
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None):
+        """
+        初期化
+
+        Args:
+            max_bytes: メモリ層のバイト数上限
+            cache_dir: ディスク層のディレクトリ (Noneでディスク層なし)
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries = OrderedDict()  # key -> (tensor, 計算にかかった秒数)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(kind, tensor, *parts):
+        """
+        キャッシュキーを作成
+
+        Args:
+            kind: 種類 ('latent_mode', 'image_emb' など)
+            tensor: 入力テンソル（内容ハッシュを取る）
+            *parts: 解像度・モデル識別子などの追加要素
+        """
+        h = hashlib.sha256()
+        h.update(kind.encode())
+        h.update(tensor_digest(tensor).encode())
+        for part in parts:
+            h.update(b'|' + str(part).encode())
+        return f"{kind}-{h.hexdigest()[:40]}"
+
+    def get_or_compute(self, key, compute):
+        """
+        キャッシュから取得し、なければ compute() で計算して保存
+
+        Args:
+            key: key() で作成したキー
+            compute: 値を計算する引数なし関数
+
+        Returns:
+            テンソル（ディスク層から読んだ場合はCPU上）
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        start = time.perf_counter()
+        value = compute()
+        self.put(key, value, time.perf_counter() - start)
+        return value
+
+    def get(self, key):
+        """キャッシュから取得（なければNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+
+        value, seconds = self._load_from_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.saved_seconds += seconds
+        self._store(key, value, seconds)
+        return value
+
+    def put(self, key, value, seconds=0.0):
+        """
+        値を保存
+
+        Args:
+            key: キー
+            value: テンソル
+            seconds: 計算にかかった時間（ヒット時の節約時間として集計）
+        """
+        value = value.detach()
+        self._store(key, value, seconds)
+        self._save_to_disk(key, value, seconds)
+
+    def _store(self, key, value, seconds):
+        size = value.numel() * value.element_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[0].numel() * old[0].element_size()
+            self._entries[key] = (value, seconds)
+            self.bytes += size
+            # 上限を超えたら古いものから削除（ディスク層があればそちらに残っている）
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted.numel() * evicted.element_size()
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.pt"
+
+    def _save_to_disk(self, key, value, seconds):
+        if self.cache_dir is None:
+            return
+        path = self._disk_path(key)
+        if path.exists():
+            return
+        stored = value.cpu()
+        if stored.is_floating_point():
+            stored = stored.half()
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        torch.save({'tensor': stored, 'dtype': str(value.dtype).replace('torch.', ''),
+                    'seconds': seconds}, tmp)
+        os.replace(tmp, path)
+
+    def _load_from_disk(self, key):
+        if self.cache_dir is None:
+            return None, 0.0
+        path = self._disk_path(key)
+        if not path.exists():
+            return None, 0.0
+        try:
+            data = torch.load(path, map_location='cpu')
+        except Exception as e:
+            print(f"警告: キャッシュの読み込みに失敗しました ({path}): {e}")
+            return None, 0.0
+        return data['tensor'].to(getattr(torch, data['dtype'])), data.get('seconds', 0.0)
+
+    def clear(self):
+        """メモリ層を空にする（ディスク層は残す）"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        ヒット率と節約時間
+
+        Returns:
+            dict: hits, disk_hits, misses, hit_rate, saved_seconds, entries, bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'saved_seconds': self.saved_seconds,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+            }
+
+
+class PromptEmbeddingCache:
+    """
+    テキスト埋め込みのLRUキャッシュ（キー: (モデル識別子, プロンプト)）
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_PROMPTS):
+        """
+        初期化
+
+        Args:
+            max_entries: 保持するプロンプト数の上限
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (model_id, prompt) -> (1, L, D) テンソル
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_calls = 0
+
+    def get(self, model, model_id, prompt):
+        """
+        1つのプロンプトの埋め込みを取得
+
+        Args:
+            model: get_learned_conditioning を持つモデル
+            model_id: モデル識別子
+            prompt: プロンプト
+
+        Returns:
+            (1, L, D) テンソル
+        """
+        return self.get_many(model, model_id, [prompt])[0]
+
+    def get_many(self, model, model_id, prompts):
+        """
+        複数プロンプトの埋め込みを取得（未キャッシュ分は1回のバッチでエンコード）
+
+        Args:
+            model: get_learned_conditioning を持つモデル
+            model_id: モデル識別子
+            prompts: プロンプトのリスト
+
+        Returns:
+            (1, L, D) テンソルのリスト（prompts と同じ順）
+        """
+        results = {}
+        with self._lock:
+            for prompt in prompts:
+                entry = self._entries.get((model_id, prompt))
+                if entry is not None:
+                    self._entries.move_to_end((model_id, prompt))
+                    results[prompt] = entry
+            self.hits += sum(1 for p in prompts if p in results)
+
+        # 重複を除いた未キャッシュのプロンプトをまとめてエンコード
+        missing = list(dict.fromkeys(p for p in prompts if p not in results))
+        if missing:
+            embeddings = model.get_learned_conditioning(missing)
+            with self._lock:
+                self.misses += len(missing)
+                self.encode_calls += 1
+                for prompt, emb in zip(missing, embeddings.split(1, dim=0)):
+                    emb = emb.detach()
+                    results[prompt] = emb
+                    self._entries[(model_id, prompt)] = emb
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return [results[p] for p in prompts]
+
+    def warmup(self, model, model_id, prompts):
+        """起動時などに、よく使うプロンプトを事前にエンコード"""
+        self.get_many(model, model_id, list(prompts))
+
+    def stats(self):
+        """ヒット率などの統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'encode_calls': self.encode_calls,
+                'entries': len(self._entries),
+            }
+
+
+_default_cache = None
+_default_prompt_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    プロセス共有のデフォルトキャッシュ
+
+    環境変数 DYNAMICRAFTER_EMBEDDING_CACHE_DIR を設定するとディスク層を有効化する。
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = TensorCache(
+                cache_dir=os.environ.get('DYNAMICRAFTER_EMBEDDING_CACHE_DIR') or None
+            )
+        return _default_cache
+
+
+def get_default_prompt_cache():
+    """プロセス共有のデフォルトのプロンプト埋め込みキャッシュ"""
+    global _default_prompt_cache
+    with _default_lock:
+        if _default_prompt_cache is None:
+            _default_prompt_cache = PromptEmbeddingCache()
+        return _default_prompt_cache
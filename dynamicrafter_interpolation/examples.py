@@ -98,7 +98,12 @@ def example_high_quality():
 
 
 def example_batch_processing():
-    """複数の画像ペアを処理する例"""
+    """
+    複数の画像ペアを処理する例
+    
+    数百ペア規模の処理には、モデルを1回だけ読み込み中断後に再開できる
+    batch_runner.py（マニフェスト形式）を使ってください。
+    """
     print("\n=== バッチ処理の例 ===")
     
     interpolator = FrameInterpolator()
@@ -169,6 +174,9 @@ def example_custom_settings():
         output_path = f"output_videos/{config['output']}"
         interpolator.save_video(samples, output_path, fps=5)
         print(f"✓ 完了: {output_path}")
+    
+    # 同じ入力画像のlatent・画像埋め込みは2回目以降キャッシュから再利用される
+    print(f"\nキャッシュ統計: {interpolator.embedding_cache.stats()}")
 
 
 if __name__ == '__main__':
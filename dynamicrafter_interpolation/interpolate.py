@@ -4,6 +4,7 @@ DynamiCrafterを使った2枚の静止画から中割りフレームを生成す
 import os
 import sys
 import argparse
+import time
 import torch
 import numpy as np
 from PIL import Image
@@ -12,6 +13,20 @@ from einops import repeat
 import torchvision
 from pathlib import Path
 
+from embedding_cache import (
+    TensorCache, get_default_cache, get_default_prompt_cache, model_identity
+)
+import model_registry
+from precision import PRECISIONS, autocast_context, check_precision
+from quantize import QUANTIZE_MODES, check_quantize, model_dtype
+from progress import ProgressTracker, print_progress
+from metrics import trace_listeners
+from result_cache import add_result_cache_arguments, cli_params, result_cache_from_args
+from sampling import ddim_sample_latents, decode_latents, encode_first_stage_mode, job_noise
+from video_writer import (
+    write_video, samples_to_frames, add_writer_arguments, writer_options_from_args
+)
+
 # DynamiCrafterのモジュールパスを追加
 SCRIPT_DIR = Path(__file__).parent
 DYNAMICRAFTER_DIR = SCRIPT_DIR.parent / "DynamiCrafter"
@@ -27,7 +42,8 @@ class FrameInterpolator:
     DynamiCrafterを使用してフレーム補間を行うクラス
     """
     
-    def __init__(self, model_path=None, config_path=None, device='cuda'):
+    def __init__(self, model_path=None, config_path=None, device='cuda', embedding_cache=None,
+                 prompt_cache=None, precision='fp32', quantize='none', progress=None):
         """
         初期化
         
@@ -35,77 +51,91 @@ class FrameInterpolator:
             model_path: DynamiCrafterのモデルパス
             config_path: 設定ファイルのパス
             device: 使用するデバイス ('cuda' or 'cpu')
+            embedding_cache: latent・画像埋め込みのキャッシュ (省略時はプロセス共有のキャッシュ)
+            prompt_cache: プロンプト埋め込みのキャッシュ (省略時はプロセス共有のキャッシュ)
+            precision: 'fp32' または 'bf16' (CPUではbf16でメモリ約半分・AMX等で高速化)
+            quantize: 'none' または 'int8' (CPUでLinear層をint8動的量子化)
+            progress: 進捗イベントの送信先 ProgressTracker (省略時はリスナーなし)
         """
         self.device = device if torch.cuda.is_available() else 'cpu'
         self.model_path = model_path or 'checkpoints/dynamicrafter_512_interp_v1/model.ckpt'
         self.config_path = config_path or 'configs/inference_512_v1.0.yaml'
         self.model = None
         self.resolution = (320, 512)  # (H, W)
+        self.progress = progress or ProgressTracker()
+        self.embedding_cache = embedding_cache or get_default_cache()
+        self.prompt_cache = prompt_cache or get_default_prompt_cache()
+        self.precision = check_precision(precision)
+        self.quantize = check_quantize(quantize, self.precision, self.device)
+        self.model_dtype = model_dtype(self.precision, self.quantize)
         
     def setup_model(self):
         """
         DynamiCrafterモデルのセットアップ
+        
+        モデルはプロセス共有のレジストリから取得するため、同じ設定の
+        AdvancedFrameInterpolator と同じモデルを共有する（二重に読み込まない）。
         """
+        if self.model is not None:
+            return
+        
+        self.progress.start('load')
+        
         # HuggingFaceキャッシュをDynamiCrafterディレクトリ内に設定（ディスク容量節約）
         cache_dir = Path(self.model_path).parent.parent / "hf_cache"
         cache_dir.mkdir(exist_ok=True)
         os.environ['HF_HOME'] = str(cache_dir)
         
-        try:
-            from omegaconf import OmegaConf
-            from utils.utils import instantiate_from_config
-            from scripts.evaluation.funcs import load_model_checkpoint
-            
-            # 設定ファイルを読み込み
-            config = OmegaConf.load(self.config_path)
-            model_config = config.pop("model", OmegaConf.create())
-            model_config['params']['unet_config']['params']['use_checkpoint'] = False
-            
-            # モデルを初期化
-            model = instantiate_from_config(model_config)
-            
-            # チェックポイントを読み込み
-            if os.path.exists(self.model_path):
-                model = load_model_checkpoint(model, self.model_path)
-                model = model.to(self.device)
-                model.eval()
-                self.model = model
-                print(f"モデルを正常に読み込みました: {self.model_path}")
-            else:
-                raise FileNotFoundError(f"モデルファイルが見つかりません: {self.model_path}")
-                
-        except ImportError as e:
-            print(f"警告: DynamiCrafterのモジュールが見つかりません: {e}")
-            print("このスクリプトはDynamiCrafterリポジトリのルートディレクトリから実行してください。")
-            raise
+        self.model = model_registry.acquire_model(self.config_path, self.model_path, self.device,
+                                                  self.model_dtype)
+        print(f"モデルを正常に読み込みました: {self.model_path}")
+    
+    def release_model(self):
+        """レジストリのモデル参照を解放（他に利用者がいなければメモリから削除）"""
+        if self.model is not None:
+            self.model = None
+            model_registry.release_model(self.config_path, self.model_path, self.device,
+                                         self.model_dtype)
             
     def load_and_preprocess_images(self, image1_path, image2_path):
         """
         2枚の画像を読み込んで前処理
         
         Args:
-            image1_path: 最初の画像のパス
-            image2_path: 2番目の画像のパス
+            image1_path: 最初の画像のパス（PIL Image・numpy配列も可）
+            image2_path: 2番目の画像のパス（PIL Image・numpy配列も可）
             
         Returns:
             処理済みのテンソル
         """
+        return self.preprocess_image(image1_path), self.preprocess_image(image2_path)
+    
+    def preprocess_image(self, image):
+        """
+        1枚の画像を読み込んで前処理
+        
+        Args:
+            image: 画像のパス（PIL Image・numpy配列も可）
+            
+        Returns:
+            処理済みのテンソル (c, h, w) [-1, 1]
+        """
         transform = transforms.Compose([
             transforms.Resize(min(self.resolution)),
             transforms.CenterCrop(self.resolution),
             transforms.ToTensor(),
             transforms.Normalize(mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5))
         ])
-        
-        # 画像を読み込み
-        img1 = Image.open(image1_path).convert('RGB')
-        img2 = Image.open(image2_path).convert('RGB')
-        
-        # 変換
-        img1_tensor = transform(img1)
-        img2_tensor = transform(img2)
-        
-        return img1_tensor, img2_tensor
+        return transform(self._open_image(image))
+    
+    @staticmethod
+    def _open_image(image):
+        """画像パス・PIL Image・numpy配列をRGBのPIL Imageに変換"""
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        elif not isinstance(image, Image.Image):
+            image = Image.open(image)
+        return image.convert('RGB')
     
     def get_latent_z(self, videos):
         """
@@ -121,13 +151,85 @@ class FrameInterpolator:
         
         b, c, t, h, w = videos.shape
         x = rearrange(videos, 'b c t h w -> (b t) c h w')
-        z = self.model.encode_first_stage(x)
+        z = encode_first_stage_mode(self.model, x)
         z = rearrange(z, '(b t) c h w -> b c t h w', b=b, t=t)
         return z
     
+    def autocast(self):
+        """条件付け・サンプリング・デコード用のautocast (precision.autocast_context)"""
+        return autocast_context(self.device, self.precision)
+    
+    def model_identity(self):
+        """キャッシュキー用のモデル識別子"""
+        return model_identity(self.model_path, self.config_path, self.device, self.model_dtype)
+    
+    def encode_latent(self, img_tensor):
+        """
+        キーフレームをlatentに変換（キャッシュ付き）
+        
+        Args:
+            img_tensor: 前処理済み画像 (b, c, h, w)
+            
+        Returns:
+            Latentテンソル (b, c, 1, h, w)
+        """
+        key = self.embedding_cache.key('latent_mode', img_tensor, self.resolution, self.model_identity())
+        z = self.embedding_cache.get_or_compute(
+            key, lambda: self.get_latent_z(img_tensor.unsqueeze(2)))
+        return z.to(self.device)
+    
+    def encode_image_embedding(self, img_tensor):
+        """
+        条件画像のCLIP埋め込み (embedder + image_proj_model) を取得（キャッシュ付き）
+        
+        Args:
+            img_tensor: 前処理済み画像 (b, c, h, w)
+        """
+        key = self.embedding_cache.key('image_emb', img_tensor, self.resolution, self.model_identity())
+        img_emb = self.embedding_cache.get_or_compute(
+            key, lambda: self.model.image_proj_model(self.model.embedder(img_tensor)))
+        return img_emb.to(self.device)
+    
+    def get_text_embedding(self, prompt):
+        """
+        プロンプトのテキスト埋め込みを取得（キャッシュ付き）
+        
+        Args:
+            prompt: テキストプロンプト
+            
+        Returns:
+            テキスト埋め込み (1, L, D)
+        """
+        return self.prompt_cache.get(self.model, self.model_identity(), prompt).to(self.device)
+    
+    def get_text_embeddings(self, prompts):
+        """
+        複数プロンプトのテキスト埋め込みを取得（未キャッシュ分は1回のバッチでエンコード）
+        
+        Args:
+            prompts: プロンプトのリスト
+            
+        Returns:
+            テキスト埋め込み (1, L, D) のリスト（prompts と同じ順）
+        """
+        embs = self.prompt_cache.get_many(self.model, self.model_identity(), prompts)
+        return [emb.to(self.device) for emb in embs]
+    
+    def warmup_prompts(self, prompts):
+        """
+        よく使うプロンプトを事前にまとめてエンコードしてキャッシュ
+        
+        Args:
+            prompts: プロンプトのリスト
+        """
+        if self.model is None:
+            self.setup_model()
+        with torch.no_grad(), self.autocast():
+            self.prompt_cache.warmup(self.model, self.model_identity(), prompts)
+    
     def interpolate(self, image1_path, image2_path, prompt="", 
                    num_frames=16, ddim_steps=50, cfg_scale=7.5, 
-                   eta=1.0, fps=5, seed=123):
+                   eta=1.0, fps=5, seed=123, callback=None):
         """
         2枚の画像から中割りフレームを生成
         
@@ -141,12 +243,12 @@ class FrameInterpolator:
             eta: DDIMのetaパラメータ
             fps: 出力動画のフレームレート
             seed: ランダムシード
+            callback: 各DDIMステップ後に callback(step) を呼ぶ（例外を投げると中断）
             
         Returns:
             生成された動画テンソル
         """
         from pytorch_lightning import seed_everything
-        from scripts.evaluation.funcs import batch_ddim_sampling
         
         # シードを設定
         seed_everything(seed)
@@ -155,143 +257,585 @@ class FrameInterpolator:
             self.setup_model()
         
         # 画像を読み込み
+        self.progress.start('preprocess')
         img1_tensor, img2_tensor = self.load_and_preprocess_images(image1_path, image2_path)
         
         # バッチ次元を追加してデバイスに送る
         img1_tensor = img1_tensor.unsqueeze(0).to(self.device)
         img2_tensor = img2_tensor.unsqueeze(0).to(self.device)
         
-        with torch.no_grad(), torch.cuda.amp.autocast():
-            # テキスト条件付け
-            text_emb = self.model.get_learned_conditioning([prompt])
+        with torch.no_grad(), self.autocast():
+            self.progress.start('encode')
             
             # 画像をLatent spaceに変換
             # 最初と最後のフレームとして使用
-            z1 = self.get_latent_z(img1_tensor.unsqueeze(2))  # b,c,1,h,w
-            z2 = self.get_latent_z(img2_tensor.unsqueeze(2))  # b,c,1,h,w
+            z1 = self.encode_latent(img1_tensor)  # b,c,1,h,w
+            z2 = self.encode_latent(img2_tensor)  # b,c,1,h,w
             
-            # フレーム補間用の条件付けを準備
-            # 最初と最後のフレームを条件として設定
-            batch_size = 1
-            channels = self.model.model.diffusion_model.out_channels
-            h, w = self.resolution[0] // 8, self.resolution[1] // 8
-            noise_shape = [batch_size, channels, num_frames, h, w]
+            self.progress.start('condition')
             
-            # 条件画像の埋め込みを取得
-            img_emb1 = self.model.embedder(img1_tensor)
-            img_emb1 = self.model.image_proj_model(img_emb1)
-            
-            # テキストと画像の埋め込みを結合
-            imtext_cond = torch.cat([text_emb, img_emb1], dim=1)
+            # テキスト条件付け（CFG用の空プロンプトも一緒に）
+            text_emb, uc_text_emb = self.get_text_embeddings([prompt, ""])
             
-            # 中割り用の条件テンソルを作成
-            img_cat_cond = torch.zeros(batch_size, channels, num_frames, h, w).to(self.device)
-            img_cat_cond[:, :, 0, :, :] = z1[:, :, 0, :, :]   # 最初のフレーム
-            img_cat_cond[:, :, -1, :, :] = z2[:, :, 0, :, :]  # 最後のフレーム
+            # 条件画像の埋め込みを取得
+            img_emb1 = self.encode_image_embedding(img1_tensor)
             
-            fs = torch.tensor([fps], dtype=torch.long, device=self.device)
-            cond = {
-                "c_crossattn": [imtext_cond],
-                "fs": fs,
-                "c_concat": [img_cat_cond]
-            }
+            # フレーム補間用の条件付けを準備
+            # 最初と最後のフレームを条件として設定
+            cond, noise_shape = self.build_cond(text_emb, img_emb1, z1, z2, num_frames, fps)
             
             # サンプリングを実行
-            batch_samples = batch_ddim_sampling(
-                self.model,
-                cond,
-                noise_shape,
-                n_samples=1,
-                ddim_steps=ddim_steps,
-                ddim_eta=eta,
-                cfg_scale=cfg_scale
+            samples = ddim_sample_latents(
+                self.model, cond, noise_shape,
+                ddim_steps=ddim_steps, ddim_eta=eta, cfg_scale=cfg_scale,
+                callback=self.progress.step_callback(ddim_steps, callback=callback),
+                uc_text_emb=uc_text_emb
             )
             
+            self.progress.start('decode')
+            batch_samples = decode_latents(self.model, samples)
+            
         return batch_samples
     
-    def save_video(self, samples, output_path, fps=5):
+    def build_cond(self, text_emb, img_emb, z_first, z_last, num_frames, fps):
         """
-        生成された動画を保存
+        中割り用の条件付けを作成（バッチ次元ごとに別の区間）
         
         Args:
-            samples: 生成された動画テンソル (b, samples, c, t, h, w)
-            output_path: 出力ファイルのパス
-            fps: フレームレート
+            text_emb: テキスト埋め込み (1 または b, L, D)
+            img_emb: 開始画像のCLIP埋め込み (b, L, D)
+            z_first: 開始フレームのlatent (b, c, 1, h, w)
+            z_last: 終了フレームのlatent (b, c, 1, h, w)
+            num_frames: 生成するフレーム数
+            fps: フレームレート条件（int、またはバッチごとの値のリスト）
+            
+        Returns:
+            (cond, noise_shape)
         """
-        # ディレクトリが存在しない場合は作成
-        os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
+        batch_size = z_first.shape[0]
+        channels = self.model.model.diffusion_model.out_channels
+        h, w = self.resolution[0] // 8, self.resolution[1] // 8
+        noise_shape = [batch_size, channels, num_frames, h, w]
+        
+        # テキストと画像の埋め込みを結合
+        if text_emb.shape[0] != batch_size:
+            text_emb = text_emb.expand(batch_size, -1, -1)
+        imtext_cond = torch.cat([text_emb, img_emb], dim=1)
         
-        # テンソルを処理
-        video = samples[0, 0]  # 最初のバッチ、最初のサンプル
-        video = video.detach().cpu()
-        video = torch.clamp(video.float(), -1., 1.)
+        # 中割り用の条件テンソルを作成
+        img_cat_cond = torch.zeros(batch_size, channels, num_frames, h, w).to(self.device)
+        img_cat_cond[:, :, 0, :, :] = z_first[:, :, 0, :, :]   # 最初のフレーム
+        img_cat_cond[:, :, -1, :, :] = z_last[:, :, 0, :, :]   # 最後のフレーム
         
-        # [-1, 1] -> [0, 1]
-        video = (video + 1.0) / 2.0
+        if isinstance(fps, (list, tuple)):
+            fs = torch.tensor(fps, dtype=torch.long, device=self.device)
+        else:
+            fs = torch.full((batch_size,), fps, dtype=torch.long, device=self.device)
+        cond = {
+            "c_crossattn": [imtext_cond],
+            "fs": fs,
+            "c_concat": [img_cat_cond]
+        }
+        return cond, noise_shape
+    
+    def interpolate_batch(self, jobs, max_batch_size=4):
+        """
+        複数の画像ペアをバッチにまとめて中割り
         
-        # [c, t, h, w] -> [t, h, w, c]
-        video = video.permute(1, 2, 3, 0)
+        num_frames・ddim_steps・cfg_scale・eta が同じジョブをまとめ、条件付け
+        (c_crossattn, c_concat, fs) をバッチ次元に積んで1回のサンプリングで処理し、
+        結果をジョブごとに分けて返す。CPUでは行列演算が大きくなる分、
+        バッチ1を繰り返すより1フレームあたりのスループットが上がる。
         
-        # [0, 1] -> [0, 255]
-        video = (video * 255).to(torch.uint8)
+        初期ノイズは各ジョブのシードから作る。DDIMのステップ中のノイズ (eta > 0) は
+        バッチ内で共有する乱数列から取るため、結果は interpolate() の単独実行とは一致しない。
         
-        # 動画を保存
-        torchvision.io.write_video(
-            output_path,
-            video,
-            fps=fps,
-            video_codec='h264',
-            options={'crf': '10'}
-        )
+        Args:
+            jobs: ジョブのリスト。各ジョブは interpolate() と同じキーのdict
+                {'image1_path', 'image2_path', 'prompt', 'num_frames', 'ddim_steps',
+                 'cfg_scale', 'eta', 'fps', 'seed'}（image1_path, image2_path 以外は省略可）
+            max_batch_size: 1回のサンプリングにまとめるジョブ数の上限
+            
+        Returns:
+            ジョブと同じ順の動画テンソル (1, 1, c, t, h, w) のリスト
+        """
+        from pytorch_lightning import seed_everything
+        
+        defaults = dict(prompt="", num_frames=16, ddim_steps=50, cfg_scale=7.5,
+                        eta=1.0, fps=5, seed=123)
+        jobs = [{**defaults, **job} for job in jobs]
+        max_batch_size = max(1, int(max_batch_size))
+        
+        if self.model is None:
+            self.setup_model()
+        
+        # サンプリング設定が同じジョブをまとめる
+        groups = {}
+        for index, job in enumerate(jobs):
+            key = (job['num_frames'], job['ddim_steps'], job['cfg_scale'], job['eta'])
+            groups.setdefault(key, []).append(index)
+        
+        results = [None] * len(jobs)
+        for (num_frames, ddim_steps, cfg_scale, eta), indices in groups.items():
+            for start in range(0, len(indices), max_batch_size):
+                chunk = indices[start:start + max_batch_size]
+                batch = [jobs[i] for i in chunk]
+                print(f"{len(batch)}ジョブをまとめてサンプリング中 "
+                      f"(frames={num_frames}, steps={ddim_steps})...")
+                
+                # ステップ中のノイズ用（先頭ジョブのシード）
+                seed_everything(batch[0]['seed'])
+                
+                with torch.no_grad(), self.autocast():
+                    # プロンプトとCFG用の空プロンプトをまとめて取得
+                    *text_embs, uc_text_emb = self.get_text_embeddings(
+                        [job['prompt'] for job in batch] + [""])
+                    
+                    self.progress.start('encode', len(batch))
+                    img_embs, z_first, z_last = [], [], []
+                    for job in batch:
+                        img1, img2 = self.load_and_preprocess_images(job['image1_path'],
+                                                                     job['image2_path'])
+                        img1 = img1.unsqueeze(0).to(self.device)
+                        img2 = img2.unsqueeze(0).to(self.device)
+                        img_embs.append(self.encode_image_embedding(img1))
+                        z_first.append(self.encode_latent(img1))
+                        z_last.append(self.encode_latent(img2))
+                        self.progress.advance()
+                    
+                    cond, noise_shape = self.build_cond(
+                        torch.cat(text_embs), torch.cat(img_embs),
+                        torch.cat(z_first), torch.cat(z_last), num_frames,
+                        [job['fps'] for job in batch]
+                    )
+                    
+                    # ジョブごとのシードで初期ノイズを作成
+                    x_T = torch.stack([job_noise(job['seed'], noise_shape[1:], self.device)
+                                       for job in batch])
+                    
+                    samples = ddim_sample_latents(
+                        self.model, cond, noise_shape,
+                        ddim_steps=ddim_steps, ddim_eta=eta, cfg_scale=cfg_scale, x_T=x_T,
+                        callback=self.progress.step_callback(ddim_steps), uc_text_emb=uc_text_emb
+                    )
+                    self.progress.start('decode')
+                    videos = decode_latents(self.model, samples)
+                
+                # (b, 1, c, t, h, w) -> ジョブごとの (1, 1, c, t, h, w)
+                for i, video in zip(chunk, videos.cpu().split(1, dim=0)):
+                    results[i] = video
+        
+        return results
+    
+    def interpolate_long(self, image1_path, image2_path, prompt="", num_frames=64,
+                         ddim_steps=50, cfg_scale=7.5, eta=1.0, fps=5, seed=123,
+                         window_frames=None, overlap=4, callback=None):
+        """
+        モデルのネイティブ長を超える中割りをスライディングウィンドウで生成
+        
+        時間方向のAttentionはフレーム数の2乗で重くなるため、ネイティブ長の
+        ウィンドウを重ねながら順に生成する。コストはフレーム数に比例し、
+        メモリはウィンドウ1つ分で頭打ちになる。
+        
+        1. 全体の遷移をネイティブ長で1回生成し、ウィンドウ境界の目標latent（アンカー）にする
+        2. 各ウィンドウの先頭は前のウィンドウの生成済みlatent、末尾はアンカー
+           （最後のウィンドウは終了画像）で条件付けする
+        3. 前のウィンドウと重なるフレームは mask / x0 で生成済みのlatentに固定して
+           サンプリングする。新しいフレームは固定した重なりを条件に生成されるので
+           境界は連続し、重なり部分は生成済みのlatentをそのまま使う（ブレンドしない）
+        4. latentはウィンドウ長ずつデコードする
+        
+        Args:
+            image1_path: 最初の画像のパス
+            image2_path: 2番目の画像のパス
+            prompt: テキストプロンプト
+            num_frames: 生成するフレーム数（ネイティブ長以下なら interpolate() と同じ）
+            ddim_steps: DDIMサンプリングのステップ数
+            cfg_scale: Classifier-free guidanceのスケール
+            eta: DDIMのetaパラメータ
+            fps: 出力動画のフレームレート
+            seed: ランダムシード
+            window_frames: ウィンドウのフレーム数（省略時はモデルのネイティブ長）
+            overlap: 隣り合うウィンドウで重ねるフレーム数
+            callback: 各DDIMステップ後に callback(step) を呼ぶ。step はアンカーと全ウィンドウを
+                通した通し番号（合計 ddim_steps × long_sampling_passes()）
+            
+        Returns:
+            生成された動画テンソル (1, 1, c, num_frames, h, w)（CPU上）
+        """
+        from pytorch_lightning import seed_everything
+        
+        if self.model is None:
+            self.setup_model()
+        
+        window = int(window_frames or getattr(self.model, 'temporal_length', 16))
+        if num_frames <= window:
+            return self.interpolate(image1_path, image2_path, prompt=prompt,
+                                    num_frames=num_frames, ddim_steps=ddim_steps,
+                                    cfg_scale=cfg_scale, eta=eta, fps=fps, seed=seed,
+                                    callback=callback)
+        
+        starts = self.window_starts(num_frames, window, overlap)
+        
+        seed_everything(seed)
+        
+        self.progress.start('preprocess')
+        img1_tensor, img2_tensor = self.load_and_preprocess_images(image1_path, image2_path)
+        img1_tensor = img1_tensor.unsqueeze(0).to(self.device)
+        img2_tensor = img2_tensor.unsqueeze(0).to(self.device)
+        
+        sample_kwargs = dict(ddim_steps=ddim_steps, ddim_eta=eta, cfg_scale=cfg_scale)
+        
+        with torch.no_grad(), self.autocast():
+            self.progress.start('encode')
+            z1 = self.encode_latent(img1_tensor)
+            z2 = self.encode_latent(img2_tensor)
+            self.progress.start('condition')
+            # CFG用の空プロンプトも同じキャッシュから1回だけ取得して全パスで共有
+            text_emb, uc_text_emb = self.get_text_embeddings([prompt, ""])
+            sample_kwargs['uc_text_emb'] = uc_text_emb
+            img_emb1 = self.encode_image_embedding(img1_tensor)
+            
+            on_step = self.progress.step_callback(ddim_steps * (len(starts) + 1),
+                                                  callback=callback)
+            
+            def pass_callback(index):
+                # index 回目のサンプリングのステップを通し番号に変換
+                if on_step is None:
+                    return None
+                return lambda step: on_step(index * ddim_steps + step)
+            
+            # 1. 全体の遷移（アンカー）
+            print(f"アンカーを生成中 ({window}フレーム)...")
+            cond, noise_shape = self.build_cond(text_emb, img_emb1, z1, z2, window, fps)
+            coarse = ddim_sample_latents(self.model, cond, noise_shape,
+                                         callback=pass_callback(0), **sample_kwargs)
+            
+            _, channels, _, h, w = noise_shape
+            latents = torch.zeros(1, channels, num_frames, h, w, device=self.device,
+                                  dtype=coarse.dtype)
+            filled = 0  # 生成済みのフレーム数（先頭から）
+            
+            for k, start in enumerate(starts):
+                end = start + window - 1
+                print(f"ウィンドウ {k + 1}/{len(starts)} (フレーム {start}-{end}) を生成中...")
+                
+                # 2. 先頭は生成済みのlatent、末尾はアンカー
+                z_start = z1 if start == 0 else latents[:, :, start:start + 1]
+                if end == num_frames - 1:
+                    z_end = z2
+                else:
+                    z_end = self._anchor_latent(coarse, end / (num_frames - 1))
+                cond, noise_shape = self.build_cond(text_emb, img_emb1, z_start, z_end,
+                                                    window, fps)
+                
+                # 3. 重なるフレームを生成済みのlatentに固定（新しいフレームの条件になる）
+                known = filled - start
+                kwargs = {}
+                if known > 0:
+                    mask = torch.zeros(noise_shape, device=self.device, dtype=latents.dtype)
+                    mask[:, :, :known] = 1.0
+                    x0 = torch.zeros_like(mask)
+                    x0[:, :, :known] = latents[:, :, start:filled]
+                    kwargs = dict(mask=mask, x0=x0)
+                
+                new = ddim_sample_latents(self.model, cond, noise_shape,
+                                          callback=pass_callback(k + 1), **sample_kwargs, **kwargs)
+                
+                # 重なり部分は固定した値なので、新しいフレームだけを書き込む
+                latents[:, :, filled:end + 1] = new[:, :, max(known, 0):]
+                filled = end + 1
+            
+            # 4. ウィンドウ長ずつデコード
+            self.progress.start('decode', num_frames)
+            videos = []
+            for i in range(0, num_frames, window):
+                videos.append(self.model.decode_first_stage(latents[:, :, i:i + window]).cpu())
+                self.progress.advance(videos[-1].shape[2])
+        
+        return torch.cat(videos, dim=2).unsqueeze(1)
+    
+    @staticmethod
+    def window_starts(num_frames, window, overlap):
+        """
+        スライディングウィンドウの開始フレームのリスト
+        
+        各ウィンドウで少なくとも2フレームは新しく生成するよう overlap を制限する。
+        最後のウィンドウは終了画像で終わるよう num_frames - window から始めるので、
+        前のウィンドウとの重なりは overlap より大きくなることがある。
+        """
+        overlap = min(max(1, int(overlap)), window - 2)
+        stride = window - overlap
+        return list(range(0, num_frames - window, stride)) + [num_frames - window]
+    
+    def long_sampling_passes(self, num_frames, window_frames=None, overlap=4):
+        """
+        interpolate_long() のDDIMサンプリング回数（アンカー + ウィンドウ数）
+        
+        ネイティブ長以下なら1回。
+        """
+        window = int(window_frames or getattr(self.model, 'temporal_length', 16))
+        if num_frames <= window:
+            return 1
+        return 1 + len(self.window_starts(num_frames, window, overlap))
+    
+    @staticmethod
+    def _anchor_latent(coarse, t):
+        """
+        アンカーのlatent列を時刻 t (0〜1) で線形補間
+        
+        Args:
+            coarse: (1, c, T, h, w)
+            t: 正規化時刻
+            
+        Returns:
+            (1, c, 1, h, w)
+        """
+        pos = t * (coarse.shape[2] - 1)
+        i0 = min(int(pos), coarse.shape[2] - 2)
+        frac = pos - i0
+        return ((1 - frac) * coarse[:, :, i0] + frac * coarse[:, :, i0 + 1]).unsqueeze(2)
+    
+    def interpolate_sequence(self, image_paths, prompt="", num_frames=16, ddim_steps=50,
+                             cfg_scale=7.5, eta=1.0, fps=5, seed=123, max_batch_size=2):
+        """
+        N枚のキーフレームを順に中割りして1本の動画にする
+        
+        各キーフレームのエンコード（latent・CLIP埋め込み）は1回だけ行い、
+        隣り合う区間で共有する。区間は max_batch_size 個ずつまとめてサンプリングする。
+        区間の境界フレームは重複しないよう、2区間目以降の先頭フレームを除く。
+        
+        Args:
+            image_paths: キーフレームのパス（PIL Image・numpy配列も可）のリスト（2枚以上）
+            prompt: テキストプロンプト
+            num_frames: 1区間あたりのフレーム数（両端のキーフレームを含む）
+            ddim_steps: DDIMサンプリングのステップ数
+            cfg_scale: Classifier-free guidanceのスケール
+            eta: DDIMのetaパラメータ
+            fps: 出力動画のフレームレート
+            seed: ランダムシード
+            max_batch_size: 同時にサンプリングする区間数の上限（メモリに応じて調整）
+            
+        Returns:
+            生成された動画テンソル (1, 1, c, t, h, w)
+            t = (キーフレーム数 - 1) * (num_frames - 1) + 1
+        """
+        from pytorch_lightning import seed_everything
+        
+        if len(image_paths) < 2:
+            raise ValueError("キーフレームは2枚以上必要です")
+        max_batch_size = max(1, int(max_batch_size))
+        
+        seed_everything(seed)
+        
+        if self.model is None:
+            self.setup_model()
+        
+        num_segments = len(image_paths) - 1
+        segments = []
+        
+        with torch.no_grad(), self.autocast():
+            self.progress.start('preprocess', len(image_paths))
+            images = [self.preprocess_image(p).unsqueeze(0).to(self.device) for p in image_paths]
+            
+            # 各キーフレームを1回だけエンコード
+            self.progress.start('encode', len(image_paths))
+            latents = [self.encode_latent(img) for img in images]
+            
+            self.progress.start('condition')
+            text_emb, uc_text_emb = self.get_text_embeddings([prompt, ""])
+            # CLIP埋め込みは区間の開始フレーム（最後のキーフレーム以外）のみ
+            img_embs = [self.encode_image_embedding(img) for img in images[:-1]]
+            
+            # 全区間を通したステップ数で進捗を出す
+            num_chunks = (num_segments + max_batch_size - 1) // max_batch_size
+            on_step = self.progress.step_callback(ddim_steps * num_chunks)
+            
+            chunk_latents = []
+            for start in range(0, num_segments, max_batch_size):
+                idx = range(start, min(start + max_batch_size, num_segments))
+                print(f"区間 {idx.start + 1}-{idx.stop}/{num_segments} をサンプリング中...")
+                
+                cond, noise_shape = self.build_cond(
+                    text_emb,
+                    torch.cat([img_embs[i] for i in idx]),
+                    torch.cat([latents[i] for i in idx]),
+                    torch.cat([latents[i + 1] for i in idx]),
+                    num_frames, fps
+                )
+                chunk_latents.append(ddim_sample_latents(
+                    self.model, cond, noise_shape,
+                    ddim_steps=ddim_steps, ddim_eta=eta, cfg_scale=cfg_scale,
+                    callback=on_step, uc_text_emb=uc_text_emb
+                ))
+            
+            # サンプリングの後にまとめてデコード（latentは小さいので全区間分を保持できる）
+            self.progress.start('decode', num_segments)
+            for samples in chunk_latents:
+                videos = decode_latents(self.model, samples)
+                # (b, 1, c, t, h, w) -> 区間ごとの (c, t, h, w)、GPUメモリを空けるためCPUへ
+                segments.extend(videos[:, 0].cpu().unbind(0))
+                self.progress.advance(samples.shape[0])
+        
+        return self.concat_segments(segments)
+    
+    @staticmethod
+    def concat_segments(segments):
+        """
+        区間ごとの動画を境界フレームを重複させずに連結
+        
+        Args:
+            segments: (c, t, h, w) テンソルのリスト（区間 i の最終フレーム = 区間 i+1 の先頭フレーム）
+            
+        Returns:
+            (1, 1, c, t_total, h, w)
+        """
+        parts = [segments[0]] + [seg[:, 1:] for seg in segments[1:]]
+        return torch.cat(parts, dim=1)[None, None]
+    
+    def save_video(self, samples, output_path, fps=5, backend='auto', **writer_options):
+        """
+        生成された動画を保存
+        
+        Args:
+            samples: 生成された動画テンソル (b, samples, c, t, h, w)
+            output_path: 出力ファイルのパス
+            fps: フレームレート
+            backend: 'auto', 'ffmpeg', 'opencv' (video_writer.open_video_writer を参照)
+            **writer_options: codec, preset, crf, threads
+        """
+        # フレーム単位でuint8に変換し、ffmpegへ逐次書き込み
+        frames = self.progress.track(samples_to_frames(samples), 'write', total=samples.shape[3])
+        write_video(frames, output_path, fps=fps, backend=backend, **writer_options)
         
         print(f"動画を保存しました: {output_path}")
 
 
 def main():
     parser = argparse.ArgumentParser(description='DynamiCrafterを使った画像中割りシステム')
-    parser.add_argument('--image1', type=str, required=True, help='最初の画像のパス')
-    parser.add_argument('--image2', type=str, required=True, help='2番目の画像のパス')
+    parser.add_argument('--image1', type=str, default=None, help='最初の画像のパス')
+    parser.add_argument('--image2', type=str, default=None, help='2番目の画像のパス')
+    parser.add_argument('--sequence', type=str, nargs='+', default=None,
+                       help='キーフレームのパス（順番に3枚以上も可、--image1/--image2 の代わり）')
+    parser.add_argument('--long', action='store_true',
+                       help='ネイティブ長を超えるフレーム数をスライディングウィンドウで生成')
+    parser.add_argument('--window-frames', type=int, default=None,
+                       help='--long のウィンドウのフレーム数 (省略時はモデルのネイティブ長)')
+    parser.add_argument('--overlap', type=int, default=4,
+                       help='--long で隣り合うウィンドウを重ねるフレーム数')
+    parser.add_argument('--batch-size', type=int, default=2,
+                       help='--sequence で同時にサンプリングする区間数の上限')
     parser.add_argument('--output', type=str, default='output_videos/interpolated.mp4', 
                        help='出力動画のパス')
     parser.add_argument('--prompt', type=str, default='', help='テキストプロンプト')
-    parser.add_argument('--frames', type=int, default=16, help='生成するフレーム数')
+    parser.add_argument('--frames', type=int, default=16, help='生成するフレーム数（--sequence では1区間あたり）')
     parser.add_argument('--steps', type=int, default=50, help='DDIMサンプリングのステップ数')
     parser.add_argument('--cfg-scale', type=float, default=7.5, help='Classifier-free guidanceスケール')
     parser.add_argument('--fps', type=int, default=5, help='出力動画のFPS')
     parser.add_argument('--seed', type=int, default=123, help='ランダムシード')
+    add_writer_arguments(parser)
     parser.add_argument('--model-path', type=str, default=None, help='モデルファイルのパス')
     parser.add_argument('--config-path', type=str, default=None, help='設定ファイルのパス')
+    parser.add_argument('--embedding-cache-dir', type=str, default=None,
+                       help='latent・画像埋め込みのディスクキャッシュ (fp16) の保存先')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                       help='推論精度 (bf16: CPUでメモリ約半分、AVX512-BF16/AMXで高速化)')
+    parser.add_argument('--quantize', type=str, default='none', choices=QUANTIZE_MODES,
+                       help='int8: Linear層を動的量子化 (CPUのみ、量子化済みモデルはディスクにキャッシュ)')
+    parser.add_argument('--progress-json', action='store_true',
+                       help='進捗イベントを1行のJSONで標準出力に書き出す (WebUIのサブプロセス用)')
+    add_result_cache_arguments(parser)
     
     args = parser.parse_args()
+    if args.sequence is None:
+        if not (args.image1 and args.image2):
+            parser.error('--image1 と --image2、または --sequence を指定してください')
+    elif len(args.sequence) < 2:
+        parser.error('--sequence には2枚以上の画像を指定してください')
     
     # 補間器を初期化
     interpolator = FrameInterpolator(
         model_path=args.model_path,
-        config_path=args.config_path
+        config_path=args.config_path,
+        device='cpu' if args.quantize == 'int8' else 'cuda',
+        embedding_cache=TensorCache(cache_dir=args.embedding_cache_dir) if args.embedding_cache_dir else None,
+        precision=args.precision,
+        quantize=args.quantize,
+        progress=ProgressTracker(([print_progress] if args.progress_json else [])
+                                 + trace_listeners('dynamicrafter'))
     )
     
+    # 結果キャッシュ（同じ入力・設定の動画があればモデルを読み込まずに返す）
+    result_cache = result_cache_from_args(args)
+    if result_cache is not None:
+        cache_params = cli_params(args, 'interpolate')
+        cache_key = result_cache.key(args.sequence or [args.image1, args.image2], cache_params,
+                                     interpolator.model_identity())
+        if result_cache.fetch(cache_key, args.output):
+            interpolator.progress.done(cached=True)
+            print(f"結果キャッシュから取り出しました: {args.output}")
+            return
+    generation_start = time.perf_counter()
+    
     # モデルをセットアップ
     interpolator.setup_model()
     
     # 中割りを実行
     print(f"画像の中割りを開始します...")
-    print(f"入力画像1: {args.image1}")
-    print(f"入力画像2: {args.image2}")
-    print(f"フレーム数: {args.frames}")
-    
-    samples = interpolator.interpolate(
-        args.image1,
-        args.image2,
-        prompt=args.prompt,
-        num_frames=args.frames,
-        ddim_steps=args.steps,
-        cfg_scale=args.cfg_scale,
-        fps=args.fps,
-        seed=args.seed
-    )
+    if args.sequence:
+        print(f"キーフレーム: {len(args.sequence)}枚 ({len(args.sequence) - 1}区間)")
+        print(f"1区間あたりのフレーム数: {args.frames}")
+        
+        samples = interpolator.interpolate_sequence(
+            args.sequence,
+            prompt=args.prompt,
+            num_frames=args.frames,
+            ddim_steps=args.steps,
+            cfg_scale=args.cfg_scale,
+            fps=args.fps,
+            seed=args.seed,
+            max_batch_size=args.batch_size
+        )
+    elif args.long:
+        print(f"入力画像1: {args.image1}")
+        print(f"入力画像2: {args.image2}")
+        print(f"フレーム数: {args.frames} (スライディングウィンドウ, 重なり {args.overlap})")
+        
+        samples = interpolator.interpolate_long(
+            args.image1,
+            args.image2,
+            prompt=args.prompt,
+            num_frames=args.frames,
+            ddim_steps=args.steps,
+            cfg_scale=args.cfg_scale,
+            fps=args.fps,
+            seed=args.seed,
+            window_frames=args.window_frames,
+            overlap=args.overlap
+        )
+    else:
+        print(f"入力画像1: {args.image1}")
+        print(f"入力画像2: {args.image2}")
+        print(f"フレーム数: {args.frames}")
+        
+        samples = interpolator.interpolate(
+            args.image1,
+            args.image2,
+            prompt=args.prompt,
+            num_frames=args.frames,
+            ddim_steps=args.steps,
+            cfg_scale=args.cfg_scale,
+            fps=args.fps,
+            seed=args.seed
+        )
     
     # 動画を保存
-    interpolator.save_video(samples, args.output, fps=args.fps)
+    interpolator.save_video(samples, args.output, fps=args.fps,
+                            **writer_options_from_args(args))
+    if result_cache is not None:
+        result_cache.store(cache_key, args.output, time.perf_counter() - generation_start,
+                           cache_params)
+    interpolator.progress.done()
     print("完了しました!")
 
 
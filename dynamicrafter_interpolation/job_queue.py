@@ -0,0 +1,411 @@
+"""
+WebUI用のジョブキュー
+
+Gradioのハンドラ内で直接処理せず、ジョブとしてキューに積んでワーカースレッドで実行する。
+
+- ジョブごとにIDと専用の作業ディレクトリ（入力画像・出力動画・ログ）を持つので、
+  複数ユーザーが同時に使ってもファイルが衝突しない
+- 同時実行数の上限（max_workers）
+- 優先度クラス: preview は final より先に実行される（同じ優先度なら先着順）
+- キュー内の順番の取得
+- キャンセル: 待機中のジョブは取り除き、実行中のジョブは協調的に中止する
+  （サブプロセスはプロセスグループごと終了させる）
+- 進捗: サブプロセスの --progress-json の出力行や ProgressTracker のイベントを
+  job.progress に反映し、待っている側をすぐに起こす
+- 計測: ジョブIDをトレースIDにする（サブプロセスには環境変数で渡す）。待ち時間・実行時間・
+  キューの件数と、サブプロセスの段階ごとの時間を metrics に記録する
+"""
+import heapq
+import itertools
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import metrics
+from progress import parse_progress_line
+
+# 優先度クラス（小さいほど先に実行）
+PRIORITIES = {'preview': 0, 'final': 1}
+
+# ジョブの状態
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# キャンセル時に SIGTERM から SIGKILL までに待つ秒数
+KILL_GRACE_SECONDS = 5.0
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされた"""
+
+
+class Job:
+    """キューに積まれた1件の処理"""
+
+    def __init__(self, fn, priority, workspace, name='', engine=''):
+        self.id = uuid.uuid4().hex[:12]
+        self.fn = fn
+        self.priority = priority
+        self.name = name
+        self.engine = engine
+        self.workspace = Path(workspace) / self.id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+        # 最新の進捗イベントと更新回数
+        self.progress = None
+        self.progress_seq = 0
+        self._update_cond = threading.Condition()
+
+    @property
+    def log_path(self):
+        return self.workspace / 'job.log'
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def elapsed(self):
+        """実行開始からの経過秒数（未開始なら0）"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def check_cancelled(self):
+        """キャンセルされていれば JobCancelled を投げる（長い処理の区切りで呼ぶ）"""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def run_subprocess(self, cmd, cwd=None, poll_interval=0.5):
+        """
+        コマンドを実行し、出力を job.log に書き込む
+
+        新しいセッションで起動するので、キャンセル時は子プロセスごと終了できる。
+        進捗イベントの行 (progress.PROGRESS_PREFIX) はログに書かず report_progress() に渡す。
+
+        Args:
+            cmd: コマンドのリスト
+            cwd: 作業ディレクトリ
+            poll_interval: 終了・キャンセルの確認間隔（秒）
+
+        Returns:
+            終了コード
+
+        Raises:
+            JobCancelled: 実行中にキャンセルされた
+        """
+        with open(self.log_path, 'a') as log:
+            with self._lock:
+                self.check_cancelled()
+                self._process = subprocess.Popen(
+                    cmd,
+                    cwd=cwd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    errors='replace',
+                    start_new_session=True,
+                    env=metrics.trace_env(self.id)
+                )
+            reader = threading.Thread(target=self._pump_output, args=(self._process.stdout, log),
+                                      daemon=True)
+            reader.start()
+            try:
+                while True:
+                    try:
+                        code = self._process.wait(timeout=poll_interval)
+                        break
+                    except subprocess.TimeoutExpired:
+                        pass
+                    if self.cancel_requested:
+                        self._kill_process()
+                        raise JobCancelled()
+            finally:
+                reader.join()
+                with self._lock:
+                    self._process = None
+        # cancel() から終了させられた場合
+        self.check_cancelled()
+        return code
+
+    def _pump_output(self, stream, log):
+        """
+        サブプロセスの出力を1行ずつログと進捗に振り分ける
+
+        進捗イベントからサブプロセスの段階ごとの時間もこのプロセスのメトリクスに記録する
+        （構造化ログはサブプロセス側で出す）。
+        """
+        stage_metrics = metrics.StageMetrics(self.engine, trace_id=self.id, log=False)
+        for line in stream:
+            event = parse_progress_line(line)
+            if event is not None:
+                stage_metrics(event)
+                self.report_progress(event)
+            else:
+                log.write(line)
+                log.flush()
+        stream.close()
+
+    def report_progress(self, event):
+        """進捗イベントを記録し、wait_update() で待っている側を起こす"""
+        with self._update_cond:
+            self.progress = event
+            self.progress_seq += 1
+            self._update_cond.notify_all()
+
+    def wait_update(self, seen_seq, timeout=None):
+        """
+        進捗の更新か終了を待つ
+
+        Args:
+            seen_seq: 呼び出し側が最後に見た progress_seq
+            timeout: 最大待ち時間（秒）
+
+        Returns:
+            現在の progress_seq
+        """
+        with self._update_cond:
+            self._update_cond.wait_for(
+                lambda: self.progress_seq != seen_seq or self._done_event.is_set(), timeout)
+            return self.progress_seq
+
+    def read_log(self, tail=2000):
+        """ログの末尾を取得"""
+        if not self.log_path.exists():
+            return ""
+        return self.log_path.read_text(errors='replace')[-tail:]
+
+    def wait(self, timeout=None):
+        """終了を待つ。終了していればTrue"""
+        return self._done_event.wait(timeout)
+
+    def _request_cancel(self):
+        self._cancel_event.set()
+        with self._lock:
+            if self._process is not None:
+                self._kill_process()
+
+    def _kill_process(self):
+        """プロセスグループに SIGTERM を送り、終わらなければ SIGKILL"""
+        process = self._process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class JobQueue:
+    """優先度付きのジョブキューとワーカースレッド"""
+
+    def __init__(self, workspace_root, max_workers=1, max_finished=50, name='jobs'):
+        """
+        初期化
+
+        Args:
+            workspace_root: ジョブの作業ディレクトリを作る場所
+            max_workers: 同時に実行するジョブ数の上限
+            max_finished: 保持する終了済みジョブ数（古いものから作業ディレクトリごと削除）
+            name: メトリクスのラベル
+        """
+        self.name = name
+        self.workspace_root = Path(workspace_root)
+        self.workspace_root.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max(1, int(max_workers))
+        self.max_finished = max_finished
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._finished = []
+        self._cond = threading.Condition()
+        self._workers = []
+        self._shutdown = False
+        metrics.watch_queue(name, self)
+
+    def submit(self, fn, priority='final', name='', engine=''):
+        """
+        ジョブを追加
+
+        Args:
+            fn: fn(job) を実行し、戻り値を job.result にする。
+                job.workspace に書き込み、長い処理では job.check_cancelled() を呼ぶ
+            priority: 'preview' または 'final'
+            name: 表示用の名前
+            engine: メトリクスのラベル（'dynamicrafter', 'advanced', 'rife' など）
+
+        Returns:
+            Job
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"不明な優先度: {priority} ({', '.join(PRIORITIES)})")
+        job = Job(fn, priority, self.workspace_root, name=name, engine=engine)
+        job.workspace.mkdir(parents=True, exist_ok=True)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("ジョブキューは停止しています")
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (PRIORITIES[priority], next(self._counter), job))
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        """IDからジョブを取得（見つからなければNone）"""
+        return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """
+        キュー内の順番
+
+        Returns:
+            実行待ちなら1始まりの順番、実行中・終了済みなら0、不明なIDならNone
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status != QUEUED:
+                return 0
+            waiting = sorted(entry for entry in self._heap if entry[2].status == QUEUED)
+            for index, (_, _, queued) in enumerate(waiting):
+                if queued is job:
+                    return index + 1
+            return 0
+
+    def cancel(self, job_id):
+        """
+        ジョブをキャンセル
+
+        待機中ならキューから外し、実行中なら中止を要求する（サブプロセスは終了させる）。
+
+        Returns:
+            キャンセルを受け付けたらTrue（終了済み・不明なIDはFalse）
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            if job.status == QUEUED:
+                # ヒープからは取り出し時に読み飛ばす
+                job._cancel_event.set()
+                self._finish(job, CANCELLED)
+                return True
+        job._request_cancel()
+        return True
+
+    def jobs(self):
+        """全ジョブ（作成順）"""
+        return sorted(self._jobs.values(), key=lambda job: job.created)
+
+    def counts(self):
+        """待機中・実行中のジョブ数"""
+        with self._cond:
+            statuses = [job.status for job in self._jobs.values()]
+        return {QUEUED: statuses.count(QUEUED), RUNNING: statuses.count(RUNNING)}
+
+    def shutdown(self, cancel_running=True):
+        """ワーカーを止める（待機中のジョブはキャンセル）"""
+        with self._cond:
+            self._shutdown = True
+            pending = [job for job in self._jobs.values() if job.status == QUEUED]
+            running = [job for job in self._jobs.values() if job.status == RUNNING]
+            self._cond.notify_all()
+        for job in pending:
+            self.cancel(job.id)
+        if cancel_running:
+            for job in running:
+                self.cancel(job.id)
+        for worker in self._workers:
+            worker.join()
+
+    def _ensure_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker, daemon=True,
+                                      name=f"job-worker-{len(self._workers)}")
+            worker.start()
+            self._workers.append(worker)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.status == QUEUED:
+                        job.status = RUNNING
+                        job.started = time.time()
+                        metrics.JOB_WAIT_SECONDS.observe(job.started - job.created,
+                                                         queue=self.name, engine=job.engine)
+                        return job
+                if self._shutdown:
+                    return None
+                self._cond.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                job.check_cancelled()
+                # ジョブ内の構造化ログにジョブIDを付ける
+                with metrics.trace(job.id):
+                    job.result = job.fn(job)
+                status = DONE
+            except JobCancelled:
+                status = CANCELLED
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                status = CANCELLED if job.cancel_requested else FAILED
+            with self._cond:
+                self._finish(job, status)
+
+    def _finish(self, job, status):
+        """終了状態にし、古い終了済みジョブを削除（_cond を保持して呼ぶ）"""
+        job.status = status
+        job.finished = time.time()
+        metrics.JOBS.inc(queue=self.name, engine=job.engine, status=status)
+        if job.started is not None:
+            metrics.JOB_RUN_SECONDS.observe(job.finished - job.started, queue=self.name,
+                                            engine=job.engine, status=status)
+        metrics.log_event('job', trace_id=job.id, queue=self.name, engine=job.engine,
+                          name=job.name, status=status,
+                          wait=round((job.started or job.finished) - job.created, 6),
+                          seconds=round(job.elapsed, 6), error=job.error)
+        job._done_event.set()
+        with job._update_cond:
+            job._update_cond.notify_all()
+        self._finished.append(job)
+        while len(self._finished) > self.max_finished:
+            old = self._finished.pop(0)
+            self._jobs.pop(old.id, None)
+            shutil.rmtree(old.workspace, ignore_errors=True)
+
+
+def max_workers_from_env(name, default=1):
+    """環境変数から同時実行数を取得"""
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
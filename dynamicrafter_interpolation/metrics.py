@@ -0,0 +1,521 @@
+"""
+計測（段階ごとのタイマー・カウンター）とメトリクスの公開
+
+- 段階ごとの所要時間: 補間器の ProgressTracker のイベント（load / motion / preprocess /
+  encode / condition / sampling / decode / write）を StageMetrics が購読してヒストグラムにする。
+  サンプリングは1ステップごとの時間も記録する。イベントを出さない処理（RIFE）は
+  stage_timer() で直接計測する
+- トレースID: ジョブごとのIDを contextvars で持ち回り、構造化ログ（1行1JSON）に付ける。
+  サブプロセスには環境変数 DYNAMICRAFTER_TRACE_ID で引き継ぐ
+- 公開: Prometheusのテキスト形式 (/metrics) を http.server で返す。WebUIが起動時に開始する。
+  キューの待ち件数・ジョブの待ち時間と実行時間・各キャッシュのヒット率も含む
+
+構造化ログは環境変数 DYNAMICRAFTER_TRACE_LOG（ファイルのパス、'-' で標準エラー出力）を
+設定したときだけ出力する。
+"""
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_ENV = 'DYNAMICRAFTER_TRACE_ID'
+TRACE_LOG_ENV = 'DYNAMICRAFTER_TRACE_LOG'
+METRICS_PORT_ENV = 'DYNAMICRAFTER_METRICS_PORT'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ヒストグラムの区切り（秒）
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+STEP_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+logger = logging.getLogger('dynamicrafter.trace')
+
+_trace_id = contextvars.ContextVar('dynamicrafter_trace_id', default=None)
+
+
+# --- メトリクス ---
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    text = ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs)
+    return '{' + text + '}'
+
+
+class _Metric:
+    """
+    メトリクスの基底クラス
+
+    set_function() で関数を登録すると、出力のたびに呼んで値を取る
+    （関数は {ラベル値のタプル: 値} を返す）。カウンターでは、キャッシュの
+    hits のように別のオブジェクトが数えている累積値を公開するのに使う。
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._functions = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function, owner=None):
+        """値を返す関数を登録（同じ owner で登録し直すと置き換える）"""
+        with self._lock:
+            self._functions[owner] = function
+
+    def samples(self):
+        """(サフィックス, ラベル値, 追加ラベル, 値) のリスト"""
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.values())
+        for function in functions:
+            values.update({tuple(str(v) for v in key): value for key, value in function().items()})
+        return [('', key, (), value) for key, value in sorted(values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """単調増加するカウンター（名前は *_total）"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """現在値"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        if function is not None:
+            self.set_function(function)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """区切りごとの累積件数・合計・件数"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, (list(counts), total))
+                           for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', key, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """メトリクスの登録先。render() でPrometheusのテキスト形式にする"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス {name} は別の型・ラベルで登録済みです")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """プロセス共有のレジストリを取得"""
+    return _registry
+
+
+STAGE_SECONDS = _registry.histogram(
+    'dynamicrafter_stage_seconds', '処理の段階ごとの所要時間（秒）', ('engine', 'stage'))
+SAMPLING_STEP_SECONDS = _registry.histogram(
+    'dynamicrafter_sampling_step_seconds', 'DDIMサンプリングの1ステップの時間（秒）', ('engine',),
+    buckets=STEP_BUCKETS)
+RUNS = _registry.counter(
+    'dynamicrafter_runs_total', '補間の実行回数（cached は結果キャッシュから返した回数）',
+    ('engine', 'outcome'))
+JOBS = _registry.counter(
+    'dynamicrafter_jobs_total', '終了したジョブ数', ('queue', 'engine', 'status'))
+JOB_WAIT_SECONDS = _registry.histogram(
+    'dynamicrafter_job_wait_seconds', 'ジョブがキューで待った時間（秒）', ('queue', 'engine'),
+    buckets=JOB_BUCKETS)
+JOB_RUN_SECONDS = _registry.histogram(
+    'dynamicrafter_job_run_seconds', 'ジョブの実行時間（秒）', ('queue', 'engine', 'status'),
+    buckets=JOB_BUCKETS)
+QUEUE_JOBS = _registry.gauge(
+    'dynamicrafter_queue_jobs', 'キューのジョブ数（状態別）', ('queue', 'state'))
+CACHE_LOOKUPS = _registry.counter(
+    'dynamicrafter_cache_lookups_total', 'キャッシュの検索回数（結果別、プロセス起動から）',
+    ('cache', 'result'))
+CACHE_HIT_RATIO = _registry.gauge(
+    'dynamicrafter_cache_hit_ratio', 'キャッシュのヒット率', ('cache',))
+CACHE_BYTES = _registry.gauge(
+    'dynamicrafter_cache_bytes', 'キャッシュの使用量（バイト）', ('cache',))
+
+
+def observe_stage(engine, stage, seconds, **fields):
+    """段階の所要時間を記録し、構造化ログに出す"""
+    STAGE_SECONDS.observe(seconds, engine=engine, stage=stage)
+    log_event('stage', engine=engine, stage=stage, seconds=round(seconds, 6), **fields)
+
+
+def observe_run(engine, outcome, seconds=0.0, trace_id=None, log=True):
+    """
+    補間の実行1回を記録
+
+    Args:
+        outcome: 'generated', 'cached'（結果キャッシュから返した）, 'error'
+    """
+    RUNS.inc(engine=engine, outcome=outcome)
+    if log:
+        log_event('run', trace_id=trace_id, engine=engine, outcome=outcome,
+                  seconds=round(seconds, 6))
+
+
+@contextlib.contextmanager
+def stage_timer(engine, stage, **fields):
+    """with の間の時間を段階の所要時間として記録（例外で抜けた場合も記録する）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(engine, stage, time.perf_counter() - start, **fields)
+
+
+class TimedIterator:
+    """元のイテレータから要素を取り出すのにかかった時間を合計する"""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+class StageMetrics:
+    """
+    ProgressTracker のリスナー。イベントから段階ごとの時間とサンプリングの1ステップの時間を記録
+
+    段階の時間は次の段階（または done / error）のイベントまでの経過時間。
+    サブプロセスから中継されたイベントにも使えるよう、時刻はイベントの elapsed を使う。
+    """
+
+    def __init__(self, engine, trace_id=None, log=True):
+        """
+        Args:
+            engine: エンジン名（'dynamicrafter', 'advanced' など）
+            trace_id: ログに付けるトレースID（省略時は呼び出し時のコンテキストのもの）
+            log: Falseなら構造化ログを出さない（サブプロセス側で出力済みの場合）
+        """
+        self.engine = engine
+        self.trace_id = trace_id
+        self.log = log
+        self.stage = None
+        self.stage_started = 0.0
+        self.last_step = 0.0
+
+    def __call__(self, event):
+        kind = event.get('event')
+        now = event.get('elapsed', 0.0)
+        if kind == 'stage':
+            self._close(now)
+            self.stage = event.get('stage')
+            self.stage_started = self.last_step = now
+        elif kind == 'step' and self.stage == 'sampling' and now >= self.last_step:
+            SAMPLING_STEP_SECONDS.observe(now - self.last_step, engine=self.engine)
+            self.last_step = now
+        elif kind in ('done', 'error'):
+            self._close(now)
+            outcome = 'error' if kind == 'error' else ('cached' if event.get('cached') else 'generated')
+            observe_run(self.engine, outcome, now, trace_id=self._trace_id(), log=self.log)
+
+    def _close(self, now):
+        if self.stage is None:
+            return
+        stage, self.stage = self.stage, None
+        # ProgressTracker.reset() の後は elapsed が巻き戻るので、前の段階は捨てる
+        if now < self.stage_started:
+            return
+        seconds = now - self.stage_started
+        STAGE_SECONDS.observe(seconds, engine=self.engine, stage=stage)
+        if self.log:
+            log_event('stage', engine=self.engine, stage=stage, seconds=round(seconds, 6),
+                      trace_id=self._trace_id())
+
+    def _trace_id(self):
+        return self.trace_id or current_trace_id()
+
+
+def watch_cache(name, cache):
+    """
+    キャッシュの stats()（hits / misses / bytes、TensorCache は disk_hits も）を公開する
+
+    Args:
+        name: メトリクスのラベル（'result', 'embedding', 'prompt' など）
+        cache: stats() を持つキャッシュ
+    """
+    def lookups():
+        stats = cache.stats()
+        values = {(name, 'hit'): stats['hits'], (name, 'miss'): stats['misses']}
+        if 'disk_hits' in stats:
+            values[(name, 'disk_hit')] = stats['disk_hits']
+        return values
+
+    CACHE_LOOKUPS.set_function(lookups, owner=name)
+    CACHE_HIT_RATIO.set_function(lambda: {(name,): cache.stats()['hit_rate']}, owner=name)
+    if 'bytes' in cache.stats():
+        CACHE_BYTES.set_function(lambda: {(name,): cache.stats()['bytes']}, owner=name)
+
+
+def watch_queue(name, queue):
+    """ジョブキューの状態別の件数 (queue.counts()) を公開する"""
+    QUEUE_JOBS.set_function(
+        lambda: {(name, state): count for state, count in queue.counts().items()}, owner=name)
+
+
+# --- トレースIDと構造化ログ ---
+
+def new_trace_id():
+    return uuid.uuid4().hex[:12]
+
+
+def current_trace_id():
+    """現在のコンテキストのトレースID（なければNone）"""
+    return _trace_id.get()
+
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """
+    with の間のトレースIDを設定
+
+    Args:
+        trace_id: トレースID（省略時は環境変数 DYNAMICRAFTER_TRACE_ID、それもなければ新規）
+
+    Yields:
+        トレースID
+    """
+    trace_id = trace_id or os.environ.get(TRACE_ENV) or new_trace_id()
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+def trace_env(trace_id=None):
+    """サブプロセスにトレースIDを引き継ぐための環境変数"""
+    env = dict(os.environ)
+    trace_id = trace_id or current_trace_id()
+    if trace_id:
+        env[TRACE_ENV] = trace_id
+    return env
+
+
+def log_event(event, trace_id=None, **fields):
+    """構造化ログを1行出力（configure_logging() していなければ何もしない）"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = {'ts': round(time.time(), 6), 'event': event,
+              'trace_id': trace_id or current_trace_id(), **fields}
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def configure_logging(path=None):
+    """
+    構造化ログの出力先を設定
+
+    Args:
+        path: ファイルのパス、'-' なら標準エラー出力（省略時は環境変数 DYNAMICRAFTER_TRACE_LOG、
+            それもなければ出力しない）
+
+    Returns:
+        構造化ログを出力するならTrue
+    """
+    path = path or os.environ.get(TRACE_LOG_ENV)
+    if not path or logger.handlers:
+        return bool(logger.handlers)
+    handler = logging.StreamHandler(sys.stderr) if path == '-' else logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return True
+
+
+def trace_listeners(engine):
+    """
+    CLI用: 構造化ログが有効なら段階ごとの時間をログに出す ProgressTracker のリスナーを返す
+
+    トレースIDは親プロセス（WebUIのジョブ）から環境変数で渡されたもの、なければ新規。
+    """
+    if not configure_logging():
+        return []
+    return [StageMetrics(engine, trace_id=os.environ.get(TRACE_ENV) or new_trace_id())]
+
+
+# --- /metrics エンドポイント ---
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = _registry
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # スクレイプごとのアクセスログは出さない
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=None):
+    """
+    メトリクスのHTTPサーバーをバックグラウンドのスレッドで開始
+
+    Args:
+        port: ポート番号
+        host: 待ち受けるアドレス
+        registry: 公開するレジストリ（省略時はプロセス共有のもの）
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    handler = type('Handler', (MetricsHandler,), {'registry': registry or _registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name='metrics-server')
+    thread.start()
+    return server
+
+
+def metrics_port_from_env(default):
+    """環境変数 DYNAMICRAFTER_METRICS_PORT からポート番号を取得（0で無効）"""
+    try:
+        return int(os.environ.get(METRICS_PORT_ENV, default))
+    except ValueError:
+        return default
+
+
+def start_metrics_server_from_env(default_port):
+    """
+    WebUI用: ポートを環境変数から決めてメトリクスのサーバーを開始（構造化ログも設定）
+
+    ポートが使用中でも WebUI 自体は起動できるよう、警告を出して続ける。
+
+    Returns:
+        ThreadingHTTPServer（無効・失敗時はNone）
+    """
+    configure_logging()
+    port = metrics_port_from_env(default_port)
+    if port <= 0:
+        return None
+    try:
+        server = start_metrics_server(port)
+    except OSError as e:
+        print(f"⚠️ メトリクスのサーバーを開始できません (ポート {port}): {e}")
+        return None
+    print(f"📈 メトリクス: http://localhost:{port}/metrics")
+    return server
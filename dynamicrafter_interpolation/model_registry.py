@@ -0,0 +1,303 @@
+"""
+DynamiCrafterモデルのプロセス共有レジストリ
+
+FrameInterpolator と AdvancedFrameInterpolator は同じチェックポイントを使うため、
+モデルを (config_path, model_path, device, dtype) ごとに1つだけ読み込み、
+参照カウントで共有する。すべての利用者が release したときに解放する。
+"""
+import contextlib
+import gc
+import os
+import threading
+import time
+from collections import defaultdict
+
+import torch
+
+from precision import DTYPES, cast_model_precision, model_memory_bytes
+from quantize import load_quantized_cache, quantize_model, save_quantized_cache
+
+
+# 重み読み込み前の乱数初期化をスキップするため無効化する torch.nn.init の関数
+_INIT_FUNCTIONS = [
+    'uniform_', 'normal_', 'trunc_normal_', 'constant_', 'ones_', 'zeros_',
+    'xavier_uniform_', 'xavier_normal_', 'kaiming_uniform_', 'kaiming_normal_', 'orthogonal_',
+]
+
+
+@contextlib.contextmanager
+def no_init_weights():
+    """
+    パラメータの乱数初期化を無効化するコンテキスト
+
+    直後にチェックポイントで上書きされるパラメータの初期化（大きなモデルでは
+    数十秒かかる）を省略する。
+    """
+    originals = {name: getattr(torch.nn.init, name) for name in _INIT_FUNCTIONS}
+
+    def skip(tensor, *args, **kwargs):
+        return tensor
+
+    try:
+        for name in _INIT_FUNCTIONS:
+            setattr(torch.nn.init, name, skip)
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(torch.nn.init, name, fn)
+
+
+def load_dynamicrafter_model(config_path, model_path, device, dtype='fp32'):
+    """
+    DynamiCrafterモデルを読み込む
+    
+    model_path が .safetensors（convert_checkpoint.py で変換した推論専用版）なら
+    高速パスを使う: metaデバイス上にモデルを構築し、mmapした重みをそのまま割り当てる。
+    dtype='int8' ではLinear層を動的量子化し、量子化済みモデルをディスクに
+    キャッシュする（次回以降はキャッシュから直接読み込む）。
+    各段階の所要時間は model.load_timings に記録して表示する。
+
+    Args:
+        config_path: 設定ファイルのパス
+        model_path: チェックポイントのパス (.ckpt / .safetensors)
+        device: 使用するデバイス
+        dtype: 重み形式 'fp32', 'bf16' (precision.py), 'int8' (quantize.py)
+
+    Returns:
+        eval モードのモデル
+    """
+    try:
+        from omegaconf import OmegaConf
+        from utils.utils import instantiate_from_config
+        from scripts.evaluation.funcs import load_model_checkpoint
+    except ImportError as e:
+        print(f"警告: DynamiCrafterのモジュールが見つかりません: {e}")
+        print("このスクリプトはDynamiCrafterリポジトリのルートディレクトリから実行してください。")
+        raise
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"モデルファイルが見つかりません: {model_path}")
+
+    timings = {}
+    start = time.perf_counter()
+
+    if dtype == 'int8':
+        model = load_quantized_cache(config_path, model_path)
+        if model is not None:
+            model.eval()
+            timings['quantized_cache'] = timings['total'] = time.perf_counter() - start
+            model.load_timings = timings
+            print(f"量子化キャッシュからモデルを読み込みました ({timings['total']:.1f}s)")
+            return model
+
+    # 設定ファイルを読み込み
+    config = OmegaConf.load(config_path)
+    model_config = config.pop("model", OmegaConf.create())
+    model_config['params']['unet_config']['params']['use_checkpoint'] = False
+    timings['config'] = time.perf_counter() - start
+
+    if str(model_path).endswith('.safetensors'):
+        model = _load_safetensors_model(model_config, instantiate_from_config, model_path,
+                                        dtype, timings)
+    else:
+        # モデルを初期化してチェックポイントを読み込み
+        t = time.perf_counter()
+        model = instantiate_from_config(model_config)
+        timings['instantiate'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        model = load_model_checkpoint(model, model_path)
+        timings['load_checkpoint'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    model = model.to(device)
+    model.eval()
+    timings['to_device'] = time.perf_counter() - t
+
+    if dtype == 'int8':
+        t = time.perf_counter()
+        quantize_model(model)
+        timings['quantize'] = time.perf_counter() - t
+        path = save_quantized_cache(model, config_path, model_path)
+        if path:
+            print(f"量子化済みモデルを保存しました: {path}")
+    elif dtype != 'fp32':
+        t = time.perf_counter()
+        cast_model_precision(model, dtype)
+        timings['cast'] = time.perf_counter() - t
+    timings['total'] = time.perf_counter() - start
+
+    model.load_timings = timings
+    print("モデル読み込み時間: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items()))
+    print(f"モデルのメモリ使用量: {model_memory_bytes(model) / 1024 ** 3:.2f} GB ({dtype})")
+    return model
+
+
+def _cast_for_precision(state_dict, dtype):
+    """
+    state_dict の浮動小数点の重みを読み込み後の精度に合わせる
+
+    保存時と同じ dtype の重みはmmapのまま（コピーしない）。ルート直下のバッファ
+    (拡散スケジュール) は convert_checkpoint.py と同じく fp32 のまま。
+    """
+    target = DTYPES.get(dtype, torch.float32)  # int8 は fp32 で読み込んでから量子化
+    for key, value in state_dict.items():
+        if value.is_floating_point():
+            state_dict[key] = value.to(target if '.' in key else torch.float32)
+    return state_dict
+
+
+def _meta_tensor_names(model):
+    """読み込み後も meta デバイスに残っているパラメータ・バッファの名前"""
+    tensors = list(model.named_parameters()) + list(model.named_buffers())
+    return [name for name, tensor in tensors if tensor.is_meta]
+
+
+def _assign_state_dict(model, state_dict):
+    """重みをコピーせずにパラメータとして割り当て、欠損したキーを返す"""
+    missing, unexpected = model.load_state_dict(state_dict, strict=False, assign=True)
+    if unexpected:
+        print(f"警告: 未使用のキーが{len(unexpected)}個あります: {unexpected[:5]}")
+    return missing
+
+
+def _load_safetensors_model(model_config, instantiate_from_config, model_path, dtype, timings):
+    """
+    convert_checkpoint.py で変換した .safetensors を読み込む（高速パス）
+
+    モデルは meta デバイス上に（メモリを確保せずに）構築し、mmapした重みを
+    load_state_dict(assign=True) でそのままパラメータとして差し込むので、
+    重みのコピーは精度の変換が必要な場合の1回だけ。meta で構築できないモデル
+    （構築時に事前学習済みの重みを読むなど）は乱数初期化を省略してCPU上に構築する。
+    """
+    from safetensors.torch import load_file
+
+    # mmapで重みを読み込み、指定の精度に合わせる（fp16 で保存した重みを fp32 に戻さない）
+    t = time.perf_counter()
+    state_dict = _cast_for_precision(load_file(model_path, device='cpu'), dtype)
+    timings['read_weights'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    model = None
+    try:
+        with torch.device('meta'):
+            model = instantiate_from_config(model_config)
+    except Exception as e:
+        print(f"警告: metaデバイスで構築できないため通常の構築に切り替えます: {e}")
+    timings['instantiate'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    if model is not None:
+        _assign_state_dict(model, state_dict)
+        # 非永続バッファなど、チェックポイントにない値は meta のまま残る
+        missing = [name for name in _meta_tensor_names(model)
+                   if not name.startswith('model_ema.')]
+        if missing:
+            print(f"警告: metaデバイスで構築すると値のないテンソルが残るため、"
+                  f"通常の構築に切り替えます: {missing[:5]}")
+            model = None
+    if model is None:
+        # 乱数初期化を省略してCPU上に構築し、同じく重みを割り当てる
+        with no_init_weights():
+            model = instantiate_from_config(model_config)
+        missing = _assign_state_dict(model, state_dict)
+        # 初期化を省略しているため、EMA以外の欠損は未初期化のまま残ってしまう
+        missing = [key for key in missing if not key.startswith('model_ema.')]
+        if missing:
+            raise RuntimeError(f"チェックポイントに含まれないパラメータがあります: {missing[:5]} ...")
+    del state_dict
+    if _meta_tensor_names(model):
+        # 推論では使わないEMAの重みは、デバイス移動できるよう領域だけ確保する
+        model.model_ema.to_empty(device='cpu')
+    timings['load_state_dict'] = time.perf_counter() - t
+    return model
+
+
+class ModelRegistry:
+    """参照カウント付きのモデルレジストリ"""
+
+    def __init__(self, loader=load_dynamicrafter_model):
+        """
+        初期化
+
+        Args:
+            loader: loader(config_path, model_path, device, dtype) でモデルを返す関数
+        """
+        self.loader = loader
+        self._entries = {}  # key -> {'model': model, 'refs': 参照数}
+        self._lock = threading.Lock()
+        self._load_locks = defaultdict(threading.Lock)  # 同じキーの同時読み込みを防ぐ
+
+    @staticmethod
+    def make_key(config_path, model_path, device, dtype='fp32'):
+        """レジストリのキー（パスは絶対パスに正規化）"""
+        return (os.path.abspath(config_path), os.path.abspath(model_path), str(device), str(dtype))
+
+    def acquire(self, config_path, model_path, device, dtype='fp32'):
+        """
+        モデルを取得（未読み込みなら読み込む）。参照カウントを1増やす
+
+        Returns:
+            共有モデル
+        """
+        key = self.make_key(config_path, model_path, device, dtype)
+        with self._lock:
+            load_lock = self._load_locks[key]
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['refs'] += 1
+                    return entry['model']
+
+            # 読み込みはロック外で（別キーの取得をブロックしない）
+            model = self.loader(config_path, model_path, device, dtype)
+            with self._lock:
+                self._entries[key] = {'model': model, 'refs': 1}
+            return model
+
+    def release(self, config_path, model_path, device, dtype='fp32'):
+        """
+        参照カウントを1減らし、0になったらモデルを解放
+
+        Returns:
+            解放した場合はTrue
+        """
+        key = self.make_key(config_path, model_path, device, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return False
+            del self._entries[key]
+
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return True
+
+    def stats(self):
+        """読み込み済みモデルと参照数の一覧"""
+        with self._lock:
+            return {key: entry['refs'] for key, entry in self._entries.items()}
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """プロセス共有のレジストリ"""
+    return _registry
+
+
+def acquire_model(config_path, model_path, device, dtype='fp32'):
+    """プロセス共有レジストリからモデルを取得"""
+    return _registry.acquire(config_path, model_path, device, dtype)
+
+
+def release_model(config_path, model_path, device, dtype='fp32'):
+    """プロセス共有レジストリのモデルを解放"""
+    return _registry.release(config_path, model_path, device, dtype)
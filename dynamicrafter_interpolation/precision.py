@@ -0,0 +1,91 @@
+"""
+DynamiCrafterモデルの推論精度 (fp32 / bf16)
+
+bf16 モードでは setup_model 時に重みを bfloat16 に変換し（メモリ約半分）、
+条件付け・サンプリング・デコードを CPU の autocast 内で実行する。
+AVX512-BF16 / AMX を持つCPUでは行列演算が bf16 で高速化される。
+
+数値的に敏感な部分は fp32 のまま残す:
+- LatentDiffusion直下のバッファ (betas, alphas_cumprod などの拡散スケジュール)
+- 正規化層 (GroupNorm / LayerNorm) の重み（autocastでも fp32 で計算される）
+"""
+import contextlib
+
+import torch
+
+PRECISIONS = ['fp32', 'bf16']
+
+DTYPES = {'fp32': torch.float32, 'bf16': torch.bfloat16}
+
+# fp32 のまま残す層
+_FP32_MODULES = (torch.nn.GroupNorm, torch.nn.LayerNorm, torch.nn.BatchNorm2d)
+
+
+def check_precision(precision):
+    """精度の指定を検証"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"不明な精度: {precision} ({', '.join(PRECISIONS)})")
+    return precision
+
+
+def cast_model_precision(model, precision):
+    """
+    モデルの重みを指定の精度に変換
+
+    ルート直下のパラメータ・バッファ（拡散スケジュール）と正規化層は fp32 のまま。
+
+    Args:
+        model: LatentDiffusionモデル
+        precision: 'fp32' または 'bf16'
+
+    Returns:
+        変換したモデル（同じオブジェクト）
+    """
+    dtype = DTYPES[check_precision(precision)]
+    if dtype == torch.float32:
+        return model
+
+    for child in model.children():
+        child.to(dtype)
+        for module in child.modules():
+            if isinstance(module, _FP32_MODULES):
+                module.float()
+    return model
+
+
+def autocast_context(device, precision):
+    """
+    推論用のautocastコンテキスト
+
+    - CUDA: 従来どおり fp16 の autocast（bf16 指定時は bf16）
+    - CPU: bf16 指定時のみ bf16 の autocast、fp32 では何もしない
+
+    Args:
+        device: 'cuda' / 'cpu' などのデバイス
+        precision: 'fp32' または 'bf16'
+    """
+    device_type = torch.device(device).type
+    if device_type == 'cuda':
+        dtype = torch.bfloat16 if precision == 'bf16' else torch.float16
+        return torch.autocast('cuda', dtype=dtype)
+    if precision == 'bf16':
+        return torch.autocast(device_type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def model_memory_bytes(model):
+    """
+    重みの合計バイト数
+
+    int8量子化したLinearの重みはパラメータではなく state_dict 内のタプル
+    (_packed_params) に入るため、state_dict から数える。
+    """
+    total = 0
+    values = list(model.state_dict(keep_vars=True).values())
+    while values:
+        value = values.pop()
+        if isinstance(value, (tuple, list)):
+            values.extend(value)
+        elif torch.is_tensor(value):
+            total += value.numel() * value.element_size()
+    return total
@@ -0,0 +1,197 @@
+"""
+進捗イベント
+
+補間器は処理の段階（前処理・エンコード・条件付け・サンプリング・デコード・書き出し）ごとに
+構造化された進捗イベントを ProgressTracker に送り、登録されたリスナーへ配信する。
+WebUIのプログレスバー、ジョブキュー、メトリクスはすべてこのイベントを購読する。
+
+イベントはJSONにできるdict:
+  {"event": "stage", "stage": "sampling", "total": 50, "elapsed": 1.2}
+  {"event": "step", "stage": "sampling", "step": 12, "total": 50,
+   "stage_elapsed": 30.1, "eta": 95.4, "elapsed": 31.3}
+  {"event": "done", "elapsed": 130.0}
+  {"event": "error", "error": "...", "elapsed": 12.0}
+
+サブプロセス（CLI の --progress-json）では PROGRESS_PREFIX を付けた1行のJSONとして
+標準出力に書き出し、親プロセスは parse_progress_line() で読み戻す。
+"""
+import json
+import sys
+import time
+
+PROGRESS_PREFIX = '@@progress '
+
+# 段階名
+STAGE_LABELS = {
+    'load': 'モデル読み込み',
+    'motion': 'モーション変換',
+    'preprocess': '前処理',
+    'encode': 'VAEエンコード',
+    'condition': '条件付け',
+    'sampling': 'サンプリング',
+    'decode': 'デコード',
+    'write': '動画書き出し',
+    'interpolate': 'フレーム補間',
+}
+
+# サンプリングより前に来る段階（プログレスバーでは0%として扱う）
+PRE_SAMPLING_STAGES = ('load', 'motion', 'preprocess', 'encode', 'condition')
+
+
+class ProgressTracker:
+    """進捗イベントの送信元。リスナーがなければ何もしない"""
+
+    def __init__(self, listeners=None):
+        """
+        Args:
+            listeners: listener(event) を呼ぶ関数のリスト
+        """
+        self.listeners = list(listeners or [])
+        self.started = time.perf_counter()
+        self.stage = None
+        self.stage_total = None
+        self.stage_step = 0
+        self.stage_started = self.started
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def emit(self, event, **fields):
+        """イベントをリスナーに配信（リスナーの例外はそのまま伝わり、処理を中止できる）"""
+        if not self.listeners:
+            return
+        fields['event'] = event
+        fields['elapsed'] = time.perf_counter() - self.started
+        for listener in list(self.listeners):
+            listener(fields)
+
+    def reset(self):
+        """新しい処理の開始（経過時間を0に戻す）"""
+        self.started = time.perf_counter()
+        self.stage = None
+
+    def start(self, stage, total=None, **info):
+        """
+        段階を開始
+
+        Args:
+            stage: 段階名 (STAGE_LABELS のキー)
+            total: この段階のステップ数（不明ならNone）
+        """
+        self.stage = stage
+        self.stage_total = total
+        self.stage_step = 0
+        self.stage_started = time.perf_counter()
+        self.emit('stage', stage=stage, total=total, **info)
+
+    def advance(self, count=1, **info):
+        """現在の段階を count ステップ進める（残り時間はこの段階の平均ステップ時間から推定）"""
+        self.stage_step += count
+        stage_elapsed = time.perf_counter() - self.stage_started
+        eta = None
+        if self.stage_total:
+            eta = stage_elapsed / self.stage_step * max(0, self.stage_total - self.stage_step)
+        self.emit('step', stage=self.stage, step=self.stage_step, total=self.stage_total,
+                  stage_elapsed=stage_elapsed, eta=eta, **info)
+
+    def step_callback(self, total, stage='sampling', callback=None):
+        """
+        DDIMSampler.sample に渡すコールバックを作成（段階を開始する）
+
+        Args:
+            total: ステップの総数
+            stage: 段階名
+            callback: 既存のコールバック（中止用など）。進捗の後に呼ぶ
+        """
+        self.start(stage, total)
+
+        def on_step(step):
+            self.advance()
+            if callback is not None:
+                callback(step)
+
+        if not self.listeners:
+            return callback
+        return on_step
+
+    def track(self, iterable, stage, total=None):
+        """
+        イテレータを流しながら1要素ごとに進める（フレームの書き出しなど）
+
+        Yields:
+            iterable の要素
+        """
+        self.start(stage, total)
+        for item in iterable:
+            yield item
+            self.advance()
+
+    def done(self, **info):
+        self.emit('done', **info)
+
+    def error(self, error):
+        self.emit('error', error=str(error))
+
+
+def print_progress(event, stream=None):
+    """イベントを PROGRESS_PREFIX 付きの1行JSONで出力（サブプロセス用のリスナー）"""
+    stream = stream or sys.stdout
+    stream.write(PROGRESS_PREFIX + json.dumps(event, ensure_ascii=False) + '\n')
+    stream.flush()
+
+
+def parse_progress_line(line):
+    """
+    サブプロセスの出力行から進捗イベントを取り出す
+
+    Returns:
+        イベントのdict（進捗行でなければNone）
+    """
+    line = line.strip()
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+
+
+def format_event(event):
+    """イベントを表示用の文字列に変換"""
+    kind = event.get('event')
+    if kind == 'done':
+        return f"完了 ({format_seconds(event['elapsed'])})"
+    if kind == 'error':
+        return f"エラー: {event.get('error')}"
+    label = STAGE_LABELS.get(event.get('stage'), event.get('stage') or '')
+    if kind == 'step' and event.get('total'):
+        text = f"{label} {event['step']}/{event['total']}"
+        if event.get('eta') is not None:
+            text += f" (残り約{format_seconds(event['eta'])})"
+        return text
+    if kind == 'step':
+        return f"{label} {event['step']}"
+    return f"{label}..."
+
+
+def event_fraction(event):
+    """段階内の進捗率 (0〜1)。不明ならNone"""
+    if event.get('event') == 'done':
+        return 1.0
+    if event.get('event') == 'step' and event.get('total'):
+        return min(1.0, event['step'] / event['total'])
+    if event.get('event') == 'stage':
+        return 0.0
+    return None
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}秒"
+    return f"{seconds // 60}分{seconds % 60}秒"
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+DynamiCrafterモデルのint8動的量子化（CPU）
+
+拡散UNet・テキストエンコーダ・画像埋め込み (embedder + image_proj_model) の
+nn.Linear を torch の動的量子化 (重みint8、活性化は実行時に量子化) に置き換える。
+CPUではAttentionブロックのLinearが処理時間の大半を占めるため、ここが効く。
+
+量子化済みモデルはディスクにキャッシュし、次回以降は元のチェックポイントの
+読み込みと量子化をスキップする。
+
+使用例（fp32との比較レポート）:
+  python quantize.py --report --steps 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+from embedding_cache import model_identity
+
+# DynamiCrafterのモジュールパスを追加（単体で実行する場合）
+DYNAMICRAFTER_DIR = Path(__file__).parent.parent / "DynamiCrafter"
+if DYNAMICRAFTER_DIR.exists() and str(DYNAMICRAFTER_DIR) not in sys.path:
+    sys.path.insert(0, str(DYNAMICRAFTER_DIR))
+
+QUANTIZE_MODES = ['none', 'int8']
+
+# 量子化する部分モジュール（LatentDiffusion の属性パス）
+QUANTIZED_SUBMODULES = [
+    'model.diffusion_model',  # 拡散UNet
+    'cond_stage_model',       # テキストエンコーダ (OpenCLIP)
+    'embedder',               # 画像エンコーダ (OpenCLIP ViT)
+    'image_proj_model',       # 画像埋め込みの射影 (Resampler)
+]
+
+CACHE_SUFFIX = '.int8.pt'
+
+# 量子化の対象を変えたら上げる（古いキャッシュを作り直す）
+QUANTIZE_VERSION = 2
+
+
+def check_quantize(quantize, precision='fp32', device='cpu'):
+    """
+    量子化モードの指定を検証
+
+    動的量子化はCPU専用で、活性化はfp32で扱うため bf16 とは併用できない。
+    """
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"不明な量子化モード: {quantize} ({', '.join(QUANTIZE_MODES)})")
+    if quantize == 'int8':
+        if torch.device(device).type != 'cpu':
+            raise ValueError("int8量子化はCPUでのみ使用できます")
+        if precision != 'fp32':
+            raise ValueError("int8量子化は --precision fp32 と組み合わせてください")
+    return quantize
+
+
+def model_dtype(precision, quantize):
+    """モデルレジストリのキーに使う重み形式 ('fp32', 'bf16', 'int8')"""
+    return 'int8' if quantize == 'int8' else precision
+
+
+def _get_submodule(model, path):
+    for name in path.split('.'):
+        model = getattr(model, name, None)
+        if model is None:
+            return None
+    return model
+
+
+def quantize_model(model):
+    """
+    Linear層をint8動的量子化に置き換える（モデルをその場で書き換える）
+
+    Args:
+        model: CPU上のfp32 LatentDiffusionモデル
+
+    Returns:
+        量子化したモデル（同じオブジェクト）
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    # 指定した部分モジュール以下の nn.Linear だけを置き換える
+    # (VAEなどのConv中心の部分はそのまま)。型で一致させるので、
+    # nn.MultiheadAttention の out_proj (NonDynamicallyQuantizableLinear) は対象外になる。
+    # 名前で指定すると out_proj まで置き換わり、MHAのforwardが失敗する
+    for path in QUANTIZED_SUBMODULES:
+        submodule = _get_submodule(model, path)
+        if submodule is not None:
+            quantize_dynamic(submodule, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    model.quantized = 'int8'
+    return model
+
+
+def quantized_cache_path(model_path):
+    """
+    量子化済みモデルのキャッシュファイルのパス
+
+    環境変数 DYNAMICRAFTER_QUANTIZED_CACHE_DIR があればそこに、
+    なければチェックポイントと同じディレクトリに保存する。
+    """
+    model_path = Path(model_path)
+    cache_dir = os.environ.get('DYNAMICRAFTER_QUANTIZED_CACHE_DIR')
+    directory = Path(cache_dir) if cache_dir else model_path.parent
+    return directory / (model_path.stem + CACHE_SUFFIX)
+
+
+def _cache_identity(config_path, model_path):
+    # チェックポイント・設定の差し替えやtorchの更新で無効化する
+    return model_identity(model_path, config_path, 'int8', torch.__version__,
+                          f"quantize-v{QUANTIZE_VERSION}")
+
+
+def load_quantized_cache(config_path, model_path):
+    """
+    キャッシュ済みの量子化モデルを読み込む
+
+    Returns:
+        モデル（キャッシュがない・古い場合はNone）
+    """
+    path = quantized_cache_path(model_path)
+    if not path.exists():
+        return None
+    try:
+        # 自分で保存したモデル全体のpickle
+        data = torch.load(path, map_location='cpu', weights_only=False)
+    except Exception as e:
+        print(f"警告: 量子化キャッシュの読み込みに失敗しました ({path}): {e}")
+        return None
+    if data.get('identity') != _cache_identity(config_path, model_path):
+        print(f"量子化キャッシュが古いため作り直します: {path}")
+        return None
+    return data['model']
+
+
+def save_quantized_cache(model, config_path, model_path):
+    """
+    量子化モデルをキャッシュに保存（失敗しても処理は続ける）
+
+    Returns:
+        保存先のパス（失敗した場合はNone）
+    """
+    path = quantized_cache_path(model_path)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        torch.save({'identity': _cache_identity(config_path, model_path), 'model': model}, tmp)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"警告: 量子化キャッシュを保存できませんでした ({path}): {e}")
+        Path(tmp).unlink(missing_ok=True)
+        return None
+    return path
+
+
+# ============================================================
+# fp32 との比較レポート
+# ============================================================
+
+def _peak_rss_mb():
+    import resource
+    # Linuxではキロバイト単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(config_path, model_path, quantize='none', steps=5, num_frames=16,
+            resolution=(320, 512)):
+    """
+    モデル読み込み時間・条件付け時間・UNet 1ステップの時間・ピークメモリを計測
+
+    Args:
+        config_path: 設定ファイルのパス
+        model_path: チェックポイントのパス
+        quantize: 'none' または 'int8'
+        steps: 計測するUNetステップ数（別に1回ウォームアップ）
+        num_frames: フレーム数
+        resolution: (H, W)
+
+    Returns:
+        計測結果のdict
+    """
+    from model_registry import load_dynamicrafter_model
+
+    start = time.perf_counter()
+    model = load_dynamicrafter_model(config_path, model_path, 'cpu', model_dtype('fp32', quantize))
+    load_seconds = time.perf_counter() - start
+
+    h, w = resolution[0] // 8, resolution[1] // 8
+    channels = model.model.diffusion_model.out_channels
+
+    with torch.no_grad():
+        start = time.perf_counter()
+        text_emb = model.get_learned_conditioning([""])
+        image = torch.zeros(1, 3, *resolution)
+        img_emb = model.image_proj_model(model.embedder(image))
+        cond_seconds = time.perf_counter() - start
+
+        cond = {
+            "c_crossattn": [torch.cat([text_emb, img_emb], dim=1)],
+            "c_concat": [torch.zeros(1, channels, num_frames, h, w)],
+        }
+        x = torch.randn(1, channels, num_frames, h, w)
+        t = torch.full((1,), 500, dtype=torch.long)
+        fs = torch.tensor([5], dtype=torch.long)
+
+        model.apply_model(x, t, cond, fs=fs)  # ウォームアップ
+        times = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            model.apply_model(x, t, cond, fs=fs)
+            times.append(time.perf_counter() - start)
+
+    return {
+        'quantize': quantize,
+        'load_seconds': load_seconds,
+        'cond_seconds': cond_seconds,
+        'step_seconds': sum(times) / len(times),
+        'peak_rss_mb': _peak_rss_mb(),
+        'threads': torch.get_num_threads(),
+    }
+
+
+def report(config_path, model_path, steps=5, num_frames=16):
+    """
+    fp32 と int8 をそれぞれ別プロセスで計測して比較表を表示
+
+    ピークメモリをモードごとに正しく測るため、計測はサブプロセスで行う。
+    """
+    results = {}
+    for quantize in QUANTIZE_MODES:
+        print(f"計測中: {quantize} ...")
+        cmd = [sys.executable, str(Path(__file__).resolve()), '--measure',
+               '--quantize', quantize, '--steps', str(steps), '--frames', str(num_frames),
+               '--model-path', model_path, '--config-path', config_path]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"計測に失敗しました ({quantize}, code {proc.returncode})")
+        # 最終行がJSON
+        results[quantize] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    base, q = results['none'], results['int8']
+    print()
+    print(f"{'':16}{'fp32':>12}{'int8':>12}{'比率':>10}")
+    for key, label in [('load_seconds', '読み込み (s)'), ('cond_seconds', '条件付け (s)'),
+                       ('step_seconds', '1ステップ (s)'), ('peak_rss_mb', 'ピークRSS (MB)')]:
+        ratio = q[key] / base[key] if base[key] else float('nan')
+        print(f"{label:16}{base[key]:>12.2f}{q[key]:>12.2f}{ratio:>9.2f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DynamiCrafterのint8動的量子化')
+    parser.add_argument('--model-path', type=str,
+                        default='checkpoints/dynamicrafter_512_interp_v1/model.ckpt',
+                        help='モデルファイルのパス')
+    parser.add_argument('--config-path', type=str, default='configs/inference_512_v1.0.yaml',
+                        help='設定ファイルのパス')
+    parser.add_argument('--report', action='store_true',
+                        help='fp32とint8の1ステップ時間・ピークメモリを比較')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--quantize', type=str, default='int8', choices=QUANTIZE_MODES,
+                        help='--measure 時の量子化モード')
+    parser.add_argument('--steps', type=int, default=5, help='計測するUNetステップ数')
+    parser.add_argument('--frames', type=int, default=16, help='フレーム数')
+    parser.add_argument('--output', type=str, default=None, help='レポートのJSON出力先')
+    args = parser.parse_args()
+
+    if args.measure:
+        result = measure(args.config_path, args.model_path, args.quantize,
+                         steps=args.steps, num_frames=args.frames)
+        print(json.dumps(result))
+        return
+
+    if args.report:
+        results = report(args.config_path, args.model_path, steps=args.steps,
+                         num_frames=args.frames)
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2))
+        return
+
+    # 量子化キャッシュの作成のみ
+    from model_registry import load_dynamicrafter_model
+    load_dynamicrafter_model(args.config_path, args.model_path, 'cpu', 'int8')
+    print(f"✓ 量子化キャッシュ: {quantized_cache_path(args.model_path)}")
+
+
+if __name__ == '__main__':
+    main()
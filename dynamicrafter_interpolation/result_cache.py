@@ -0,0 +1,305 @@
+"""
+完成した動画の結果キャッシュ
+
+シード付きのDynamiCrafterの生成は決定的なので、同じ入力画像・パラメータ・モデルでの
+再実行は同じ動画になる。入力と設定の正規化したハッシュをキーに完成した動画を保存し、
+2回目以降は生成せずにすぐ返す。
+
+- キー: 入力画像の画素のハッシュ + 正規化したパラメータ + モデル識別子
+- 保存: キャッシュ内の動画と出力先はハードリンクで共有（同じ動画のコピーを増やさない）。
+  ハードリンクできない場合（別ファイルシステムなど）はコピー
+- 削除: 合計サイズの上限を超えたら最後に使われた時刻が古いものから削除 (LRU)。
+  最終利用時刻は各エントリのメタデータファイルの更新時刻で管理するので、
+  複数のプロセスで同じディレクトリを共有できる
+
+キャッシュの動画を削除しても、ハードリンクした出力先のファイルは残る。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3  # 10GB
+
+# 生成処理を変えて以前の結果と一致しなくなったら上げる
+RESULT_CACHE_VERSION = 1
+
+# CLIの引数のうち、結果に影響しないもの（キーに含めない）
+NON_RESULT_ARGS = (
+    'image1', 'image2', 'sequence', 'output', 'model_path', 'config_path',
+    'embedding_cache_dir', 'progress_json', 'result_cache_dir', 'result_cache_max_gb',
+    'stream', 'manifest', 'output_dir', 'stop_on_error',
+)
+
+
+def image_digest(image):
+    """
+    画像の画素のSHA-256
+
+    パス・PIL Image・numpy配列のどれで渡しても、同じ画素なら同じ値になる。
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    elif not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image = image.convert('RGB')
+    h = hashlib.sha256()
+    h.update(f"{image.size}|".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def canonical_params(value):
+    """
+    パラメータをJSONで一意に表せる形に正規化
+
+    numpyのスカラーはPythonの数値に、整数値のfloatはintに (16.0 → 16)、
+    タプルはリストに、Pathは文字列にする。
+    """
+    if isinstance(value, dict):
+        return {str(k): canonical_params(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonical_params(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool) or value is None or isinstance(value, (int, str)):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, Path):
+        return str(value)
+    return str(value)
+
+
+def result_key(images, params, model_id):
+    """
+    キャッシュキーを作成
+
+    Args:
+        images: 入力画像のリスト（順番も区別する）
+        params: 生成・書き出しのパラメータ (dict)
+        model_id: モデル識別子 (embedding_cache.model_identity)
+
+    Returns:
+        40文字の16進文字列
+    """
+    payload = {
+        'version': RESULT_CACHE_VERSION,
+        'images': [image_digest(image) for image in images],
+        'params': canonical_params(params),
+        'model': str(model_id),
+    }
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()[:40]
+
+
+def cli_params(args, tool):
+    """
+    argparseの引数から結果に影響するパラメータを取り出す
+
+    Args:
+        args: parse_args() の戻り値
+        tool: スクリプトの名前（別のスクリプトの結果と区別する）
+    """
+    params = {k: v for k, v in vars(args).items() if k not in NON_RESULT_ARGS}
+    params['tool'] = tool
+    return params
+
+
+def link_or_copy(src, dest):
+    """
+    src を dest にハードリンク（できなければコピー）
+
+    dest が既にあれば置き換える。既存のファイルに上書きすると、同じ実体を共有している
+    別のリンクまで書き換わるため、一時ファイルを作ってから os.replace する。
+    """
+    src, dest = Path(src), Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists() and os.path.samefile(src, dest):
+        return
+    tmp = dest.with_name(f".{dest.name}.tmp{os.getpid()}-{threading.get_ident()}")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class ResultCache:
+    """内容アドレス方式の完成動画キャッシュ（ディスク容量の上限つきLRU）"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        初期化
+
+        Args:
+            cache_dir: キャッシュのディレクトリ
+            max_bytes: キャッシュ内の動画の合計サイズの上限
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(images, params, model_id):
+        """result_key() と同じ"""
+        return result_key(images, params, model_id)
+
+    def _video_path(self, key):
+        return self.cache_dir / f"{key}.mp4"
+
+    def _meta_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def lookup(self, key):
+        """
+        キャッシュの動画を探す（見つかれば最終利用時刻を更新）
+
+        Returns:
+            キャッシュ内の動画のパス（なければNone）
+        """
+        path = self._video_path(key)
+        meta_path = self._meta_path(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            meta = None
+        with self._lock:
+            if meta is None or not path.exists():
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += meta.get('seconds', 0.0)
+        return path
+
+    def fetch(self, key, dest):
+        """
+        キャッシュにあれば dest に取り出す
+
+        Returns:
+            ヒットしたらTrue
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            link_or_copy(path, dest)
+        except FileNotFoundError:
+            # 別のプロセスが削除した
+            return False
+        return True
+
+    def store(self, key, video_path, seconds=0.0, params=None):
+        """
+        完成した動画をキャッシュに追加（video_path とハードリンクで共有）
+
+        Args:
+            key: キー
+            video_path: 完成した動画
+            seconds: 生成にかかった時間（ヒット時の節約時間として集計）
+            params: 確認用にメタデータへ残すパラメータ
+        """
+        link_or_copy(video_path, self._video_path(key))
+        meta = {'created': time.time(), 'seconds': seconds,
+                'params': canonical_params(params or {})}
+        tmp = self._meta_path(key).with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=1))
+        os.replace(tmp, self._meta_path(key))
+        self.evict()
+
+    def entries(self):
+        """
+        キャッシュのエントリ一覧（最後に使われた順が古いものから）
+
+        Returns:
+            (最終利用時刻, キー, サイズ) のリスト
+        """
+        entries = []
+        for meta_path in self.cache_dir.glob('*.json'):
+            key = meta_path.stem
+            try:
+                last_used = meta_path.stat().st_mtime
+                size = self._video_path(key).stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((last_used, key, size))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        """
+        合計サイズが上限を超えていれば、古いものから削除
+
+        Returns:
+            削除したエントリ数
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        for _, key, size in entries:
+            if total <= max_bytes:
+                break
+            self._meta_path(key).unlink(missing_ok=True)
+            self._video_path(key).unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """全エントリを削除"""
+        return self.evict(max_bytes=0)
+
+    def stats(self):
+        """
+        ヒット率とディスク使用量
+
+        Returns:
+            dict: hits, misses, hit_rate, saved_seconds, entries, bytes
+        """
+        entries = self.entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'saved_seconds': self.saved_seconds,
+                'entries': len(entries),
+                'bytes': sum(size for _, _, size in entries),
+            }
+
+
+def max_bytes_from_env(default=DEFAULT_MAX_BYTES):
+    """環境変数 DYNAMICRAFTER_RESULT_CACHE_GB から容量の上限（バイト数）を取得"""
+    try:
+        return int(float(os.environ['DYNAMICRAFTER_RESULT_CACHE_GB']) * 1024 ** 3)
+    except (KeyError, ValueError):
+        return default
+
+
+def add_result_cache_arguments(parser):
+    """argparseに結果キャッシュのオプションを追加"""
+    parser.add_argument('--result-cache-dir', type=str,
+                        default=os.environ.get('DYNAMICRAFTER_RESULT_CACHE_DIR') or None,
+                        help='完成した動画のキャッシュの保存先 (同じ入力・設定なら生成を省略)')
+    parser.add_argument('--result-cache-max-gb', type=float, default=max_bytes_from_env() / 1024 ** 3,
+                        help='結果キャッシュの容量の上限 (GB、超えたら古いものから削除)')
+
+
+def result_cache_from_args(args):
+    """引数から ResultCache を作成（--result-cache-dir がなければNone）"""
+    if not args.result_cache_dir:
+        return None
+    return ResultCache(args.result_cache_dir, max_bytes=int(args.result_cache_max_gb * 1024 ** 3))
@@ -4,27 +4,229 @@ RIFE (Real-Time Intermediate Flow Estimation) フレーム補間
 軽量・高速な中割システム
 """
 
+import inspect
+import time
+from fractions import Fraction
+from itertools import groupby
+
 import torch
 import numpy as np
 from PIL import Image
 import cv2
 from pathlib import Path
 
+from metrics import TimedIterator, observe_stage, stage_timer
+from result_cache import add_result_cache_arguments, cli_params, result_cache_from_args
+from video_writer import write_video, add_writer_arguments, writer_options_from_args
+
+
+# flow_retime でフローを推定する画像の最小サイズ（DISのパッチより大きいこと）
+FLOW_MIN_SIZE = 16
+
+
+def frame_timesteps(num_frames):
+    """
+    等間隔なフレーム時刻 t = i/(num_frames-1) のリスト
+    
+    Args:
+        num_frames: フレーム数 (両端を含む, 2以上)
+    """
+    return [i / (num_frames - 1) for i in range(num_frames)]
+
+
+def bisection_plan(num_frames):
+    """
+    中点推論だけで num_frames 枚を作るための分割スケジュール
+    
+    時刻 [0, 1] を2等分し続ける（ノードの時刻はすべて k/2^d）。モデルは常に区間の
+    ちょうど中点を推論するので、推論したノードの時刻は正確。各出力フレームの時刻
+    t = i/(num_frames-1) について、t がノードになるか、t を挟むノードの間隔が
+    出力の間隔 1/(num_frames-1) の2倍未満になるまで分割する（推論数は num_frames-2 以下）。
+    num_frames-1 が2の冪なら全出力がノードになる。そうでない出力は挟む2ノードの
+    間をフローでワープして時刻を合わせる（ワープしたフレームは分割の端点に使わない）。
+    
+    Args:
+        num_frames: フレーム数 (両端を含む, 2以上)
+        
+    Returns:
+        (levels, brackets)
+        levels: 階層ごとの [(left, mid, right), ...] (時刻は Fraction)。前の階層までの結果だけに依存する
+        brackets: 出力フレーム i = 1 .. num_frames-2 を挟むノードの (left, right)。
+            left == right ならそのノードが出力フレーム
+    """
+    last = num_frames - 1
+    max_width = Fraction(2, max(last, 1))
+    nodes = {}  # mid -> (depth, left, right)
+    brackets = []
+    for i in range(1, last):
+        t = Fraction(i, last)
+        left, right, depth = Fraction(0), Fraction(1), 0
+        while t not in (left, right) and right - left >= max_width:
+            mid = (left + right) / 2
+            nodes[mid] = (depth, left, right)
+            left, right = (left, mid) if t <= mid else (mid, right)
+            depth += 1
+        brackets.append((t, t) if t in (left, right) else (left, right))
+    
+    levels = []
+    for mid, (depth, left, right) in sorted(nodes.items()):
+        while len(levels) <= depth:
+            levels.append([])
+        levels[depth].append((left, mid, right))
+    return levels, brackets
+
+
+def split_ratio(left, mid, right):
+    """時刻 mid が区間 (left, right) を分ける比率 (0.5 なら中点)"""
+    return (mid - left) / (right - left)
+
+
+def flow_retime(frame0, frame1, ratios):
+    """
+    2枚のフレームの間の時刻のフレームをフローでワープして作る（中点推論のみのモデル用）
+    
+    両方向の光学フロー f01, f10 を1回だけ推定し、時刻 r から両端へのフローを
+    f_r0 = -r(1-r) f01 + r^2 f10、f_r1 = (1-r)^2 f01 - r(1-r) f10 で近似して
+    (Super SloMo と同じ近似)、両端をワープして重み付きで合成する。
+    画素をそのまま混ぜるクロスフェードと違い、動いている物体が2重にならない。
+    
+    Args:
+        frame0, frame1: (1,3,H,W) テンソル [0,1]
+        ratios: 時刻 r (0 < r < 1) のリスト
+        
+    Returns:
+        (1,3,H,W) テンソルのリスト
+    """
+    h, w = frame0.shape[-2:]
+    
+    def dense_flow(a, b):
+        if min(h, w) < FLOW_MIN_SIZE:
+            # フローを推定できない小さな画像は静止として扱う（線形ブレンド）
+            return torch.zeros(h, w, 2, device=frame0.device)
+        flow, _ = coarse_flow(a[0], b[0])
+        flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR)
+        return torch.from_numpy(flow).to(frame0.device)
+    
+    f01 = dense_flow(frame0, frame1)
+    f10 = dense_flow(frame1, frame0)
+    
+    ys, xs = torch.meshgrid(torch.arange(h, device=frame0.device, dtype=torch.float32),
+                            torch.arange(w, device=frame0.device, dtype=torch.float32),
+                            indexing='ij')
+    base = torch.stack([xs, ys], dim=-1)
+    norm = torch.tensor([2.0 / max(w - 1, 1), 2.0 / max(h - 1, 1)], device=frame0.device)
+    
+    def sample(img, offset):
+        grid = ((base + offset) * norm - 1.0).unsqueeze(0)
+        out = torch.nn.functional.grid_sample(img.float(), grid, mode='bilinear',
+                                              padding_mode='border', align_corners=True)
+        return out.to(img.dtype)
+    
+    frames = []
+    for r in map(float, ratios):
+        f_r0 = -r * (1 - r) * f01 + r * r * f10
+        f_r1 = (1 - r) * (1 - r) * f01 - r * (1 - r) * f10
+        frames.append((1 - r) * sample(frame0, f_r0) + r * sample(frame1, f_r1))
+    return frames
+
+
+def tile_starts(length, tile, overlap):
+    """
+    1次元方向のタイル開始位置（隣り合うタイルは overlap 以上重なる）
+    
+    Args:
+        length: 画像の長さ
+        tile: タイルの長さ
+        overlap: 重なりの幅
+        
+    Returns:
+        開始位置のリスト（最後のタイルは末尾に揃える）
+    """
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    return starts + [length - tile]
+
+
+def feather_ramp(size, overlap, ramp_start, ramp_end):
+    """
+    タイル境界をなめらかにつなぐ1次元の重み
+    
+    他のタイルと重なる側だけ overlap 幅で 0→1 に上げ、画像の端はそのまま1。
+    
+    Args:
+        size: タイルの長さ
+        overlap: 重なりの幅
+        ramp_start: 先頭側を減衰させるか
+        ramp_end: 末尾側を減衰させるか
+    """
+    weight = torch.ones(size)
+    ramp = torch.arange(1, overlap + 1, dtype=torch.float32) / (overlap + 1)
+    if ramp_start and overlap > 0:
+        weight[:overlap] = torch.minimum(weight[:overlap], ramp)
+    if ramp_end and overlap > 0:
+        weight[-overlap:] = torch.minimum(weight[-overlap:], ramp.flip(0))
+    return weight
+
+
+def coarse_flow(I0, I1, max_side=512):
+    """
+    縮小画像で I0→I1 の大域的な光学フローを推定（DIS）
+    
+    DISは粗い階層から探索するため、タイル幅を超える大きな動きも追える。
+    
+    Args:
+        I0, I1: (3,H,W) テンソル [0,1]
+        max_side: 推定に使う画像の長辺
+        
+    Returns:
+        (H', W', 2) の numpy 配列（元解像度のピクセル単位）と縮小率
+    """
+    h, w = I0.shape[-2:]
+    scale = min(1.0, max_side / max(h, w))
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    
+    def gray(img):
+        img_np = (img.float().mean(0).cpu().numpy() * 255).clip(0, 255).astype(np.uint8)
+        return cv2.resize(img_np, size, interpolation=cv2.INTER_AREA)
+    
+    dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_MEDIUM)
+    flow = dis.calc(gray(I0), gray(I1), None)
+    return flow / scale, scale
+
 
 class RIFEInterpolator:
     """RIFE軽量版フレーム補間"""
     
-    def __init__(self, model_name='rife-v4.6', device='cpu'):
+    # RIFEの入力は32の倍数
+    TILE_ALIGN = 32
+    
+    def __init__(self, model_name='rife-v4.6', device='cpu', max_batch_size=8,
+                 tile_size=None, tile_overlap=64):
         """
         初期化
         
         Args:
             model_name: モデル名 (rife-v4.6が最新)
             device: 'cpu' or 'cuda'
+            max_batch_size: 1回の推論でまとめるフレームペア数の上限（メモリ使用量の上限）
+            tile_size: タイル推論のタイルの一辺（Noneまたは0で画像全体を一度に推論）
+            tile_overlap: 隣り合うタイルの重なり幅
         """
+        self.model_name = model_name
         self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.tile_size = None
+        if tile_size:
+            # 32の倍数に切り上げ
+            align = self.TILE_ALIGN
+            self.tile_size = max(align, (int(tile_size) + align - 1) // align * align)
+        self.tile_overlap = max(0, int(tile_overlap))
         self.model = None
+        self.model_loaded = False  # ロード試行済みか（失敗時もOpenCVへ固定し再試行しない）
         
+    @stage_timer('rife', 'motion')
     def apply_motion_transform(self, img, pan_x=0, pan_y=0, zoom=1.0, rotate=0):
         """
         画像にモーション変換を適用
@@ -58,6 +260,7 @@ class RIFEInterpolator:
         
         return Image.fromarray(transformed)
         
+    @stage_timer('rife', 'load')
     def load_model(self):
         """RIFEモデルをロード"""
         print("🔄 RIFEモデルを読み込み中...")
@@ -72,22 +275,36 @@ class RIFEInterpolator:
             print(f"❌ モデル読み込みエラー: {e}")
             print("フォールバック: OpenCV光学フローを使用")
             self.model = None
+        self.model_loaded = True
             
+    def model_identity(self):
+        """
+        結果キャッシュのキー用のモデル識別子
+        
+        読み込みに失敗してOpenCVにフォールバックした場合は結果が変わるので区別する。
+        """
+        if not self.model_loaded:
+            self.load_model()
+        return self.model_name if self.model is not None else 'opencv'
+    
     def interpolate_opencv(self, img1, img2, num_frames):
         """OpenCV光学フローによる補間（フォールバック）"""
-        frames = [img1]
+        return list(self._iter_opencv(img1, img2, num_frames))
+    
+    def _iter_opencv(self, img1, img2, num_frames):
+        """interpolate_opencv() のストリーミング版"""
+        yield img1
         
-        gray1 = cv2.cvtColor(np.array(img1), cv2.COLOR_RGB2GRAY)
-        gray2 = cv2.cvtColor(np.array(img2), cv2.COLOR_RGB2GRAY)
+        img1_np = np.array(img1)
+        img2_np = np.array(img2)
         
         for i in range(1, num_frames - 1):
             alpha = i / (num_frames - 1)
             # 単純な線形補間
-            blended = cv2.addWeighted(np.array(img1), 1-alpha, np.array(img2), alpha, 0)
-            frames.append(Image.fromarray(blended))
+            blended = cv2.addWeighted(img1_np, 1-alpha, img2_np, alpha, 0)
+            yield Image.fromarray(blended)
         
-        frames.append(img2)
-        return frames
+        yield img2
     
     def interpolate(self, img1, img2, num_frames=16, mode='basic', 
                    pan_x=0, pan_y=0, zoom=1.0, rotate=0):
@@ -106,71 +323,323 @@ class RIFEInterpolator:
         Returns:
             list of PIL Images
         """
-        if self.model is None:
+        if not self.model_loaded:
             self.load_model()
         
-        # RIFEモデルが使えない場合はOpenCVを使用
+        with stage_timer('rife', 'interpolate', frames=num_frames, mode=mode):
+            # RIFEモデルが使えない場合はOpenCVを使用
+            if self.model is None:
+                print("⚠️ RIFEモデル未使用、OpenCV補間を実行")
+                return self.interpolate_opencv(img1, img2, num_frames)
+            
+            # モーション制御モード
+            if mode in ['hybrid', 'steerable']:
+                return self.interpolate_with_motion(img1, img2, num_frames, mode,
+                                                   pan_x, pan_y, zoom, rotate)
+            
+            # 基本モード（モーションなし）
+            return self.interpolate_basic(img1, img2, num_frames)
+    
+    def iter_frames(self, img1, img2, num_frames=16, mode='basic',
+                    pan_x=0, pan_y=0, zoom=1.0, rotate=0):
+        """
+        interpolate() のストリーミング版。確定したフレームから時間順にyieldする
+        
+        二分割は深さ優先で進めるため、同時に保持するテンソルは O(log N) 枚のみ。
+        引数は interpolate() と同じ。
+        
+        Yields:
+            PIL Image
+        """
+        if not self.model_loaded:
+            self.load_model()
+        
+        # RIFEモデルが使えない場合はOpenCVを使用（interpolate()と同様にモーションなし）
         if self.model is None:
             print("⚠️ RIFEモデル未使用、OpenCV補間を実行")
-            return self.interpolate_opencv(img1, img2, num_frames)
+            yield from self._iter_opencv(img1, img2, num_frames)
+            return
         
-        # モーション制御モード
-        if mode in ['hybrid', 'steerable']:
-            return self.interpolate_with_motion(img1, img2, num_frames, mode,
-                                               pan_x, pan_y, zoom, rotate)
+        if mode == 'hybrid':
+            # hybrid: 終了フレームにモーションを適用してから補間
+            img2 = self.apply_motion_transform(img2, pan_x, pan_y, zoom, rotate)
+        
+        frames = self.iter_frames_tensor(self._to_tensor(img1), self._to_tensor(img2), num_frames)
+        for i, frame in enumerate(frames):
+            frame = self._to_image(frame)
+            if mode == 'steerable':
+                frame = self._steer(frame, i / (num_frames - 1), pan_x, pan_y, zoom, rotate)
+            yield frame
+    
+    @torch.no_grad()
+    def iter_frames_tensor(self, I0, I1, num_frames):
+        """
+        両端テンソル間の num_frames 枚を時間順にyield（両端を含む）
         
-        # 基本モード（モーションなし）
-        return self.interpolate_basic(img1, img2, num_frames)
+        Args:
+            I0, I1: 両端のテンソル (1,3,H,W) [0,1]
+            num_frames: フレーム数
+            
+        Yields:
+            (1,3,H,W) テンソル
+        """
+        yield I0
+        if self._supports_timestep():
+            # 時刻順にバッチ単位で推論し、バッチごとに解放
+            timesteps = frame_timesteps(num_frames)[1:-1]
+            for start in range(0, len(timesteps), self.max_batch_size):
+                yield from self._infer_timesteps(
+                    I0, I1, timesteps[start:start + self.max_batch_size])
+        elif num_frames > 2:
+            yield from self._iter_bisection({Fraction(0): I0, Fraction(1): I1}, num_frames)
+        yield I1
     
-    def interpolate_basic(self, img1, img2, num_frames):
-        """基本的なRIFE補間（モーションなし）"""
-        # 画像をテンソルに変換
-        def img2tensor(img):
-            img_np = np.array(img).astype(np.float32) / 255.0
-            img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).unsqueeze(0)
-            return img_tensor.to(self.device)
+    @torch.no_grad()
+    def _iter_bisection(self, nodes, num_frames):
+        """
+        bisection_plan の出力フレームを時刻順にyield（両端を除く）
         
-        I0 = img2tensor(img1)
-        I1 = img2tensor(img2)
+        Args:
+            nodes: 計算済みのノード {時刻 (Fraction): テンソル}（少なくとも両端）。
+                足りないノードは必要になったときに1枚ずつ推論し、
+                以降の出力で使わなくなったものから捨てる
+            num_frames: フレーム数
+        """
+        levels, brackets = bisection_plan(num_frames)
+        parents = {mid: (left, right) for level in levels for left, mid, right in level}
+        
+        def node(t):
+            if t not in nodes:
+                left, right = parents[t]
+                nodes[t] = self._forward(node(left), node(right))
+            return nodes[t]
+        
+        last = num_frames - 1
+        # 同じノードの間の出力はまとめてワープ（フローの推定は1回）
+        for (left, right), group in groupby(enumerate(brackets, start=1), key=lambda item: item[1]):
+            if left == right:
+                yield node(left)
+            else:
+                ratios = [split_ratio(left, Fraction(i, last), right) for i, _ in group]
+                yield from flow_retime(node(left), node(right), ratios)
+            # 後の出力は left より前のノードを使わない
+            for t in [t for t in nodes if t < left]:
+                del nodes[t]
+    
+    def interpolate_basic(self, img1, img2, num_frames):
+        """
+        基本的なRIFE補間（モーションなし）
         
-        frames = [img1]
+        t = i/(num_frames-1) の各時刻を推論し、ちょうどnum_frames枚を返す。
+        timestep対応モデルなら各時刻を直接推論し、そうでなければ
+        bisection_plan の分割スケジュールで中点だけを推論し、間の時刻はフローでワープする。
+        """
+        I0 = self._to_tensor(img1)
+        I1 = self._to_tensor(img2)
         
-        # 再帰的に中間フレームを生成
         print(f"🎬 {num_frames}フレームを生成中...")
         
         with torch.no_grad():
-            # 段階的に補間
-            n_iter = int(np.log2(num_frames - 1))
+            if self._supports_timestep():
+                # timestep対応モデル: 各時刻を直接バッチ推論
+                timesteps = frame_timesteps(num_frames)[1:-1]
+                mids = self._infer_timesteps(I0, I1, timesteps)
+            else:
+                # 分割スケジュール: 推論は num_frames-2 回以下
+                mids = self._infer_bisection(I0, I1, num_frames)
             
-            frame_list = [(0.0, I0), (1.0, I1)]
+            frames = [img1] + [self._to_image(mid) for mid in mids] + [img2]
+        
+        print(f"✓ {len(frames)}フレームを生成しました")
+        return frames
+    
+    def _to_tensor(self, img):
+        """PIL Image → (1,3,H,W) float32テンソル [0,1]"""
+        img_np = np.array(img).astype(np.float32) / 255.0
+        img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).unsqueeze(0)
+        return img_tensor.to(self.device)
+    
+    def _to_image(self, frame_tensor):
+        """(1,3,H,W) テンソル [0,1] → PIL Image"""
+        frame_np = frame_tensor.squeeze(0).permute(1, 2, 0).float().cpu().numpy()
+        frame_np = (frame_np * 255).clip(0, 255).astype(np.uint8)
+        return Image.fromarray(frame_np)
+    
+    def _supports_timestep(self):
+        """モデルが任意時刻の推論 (inference(img0, img1, timestep=...)) に対応しているか"""
+        infer = getattr(self.model, 'inference', None)
+        if infer is None:
+            return False
+        try:
+            return 'timestep' in inspect.signature(infer).parameters
+        except (TypeError, ValueError):
+            return False
+    
+    def _infer_timesteps(self, I0, I1, timesteps):
+        """
+        任意の時刻の中間フレームをバッチ推論で生成（timestep対応モデル用）
+        
+        Args:
+            I0, I1: 両端のテンソル (1,3,H,W)
+            timesteps: 時刻のリスト (0 < t < 1)
             
-            for iteration in range(n_iter):
-                new_frames = []
-                for i in range(len(frame_list) - 1):
-                    t0, frame0 = frame_list[i]
-                    t1, frame1 = frame_list[i + 1]
-                    
-                    # 中間フレーム生成
-                    mid_frame = self.model(frame0, frame1)
-                    t_mid = (t0 + t1) / 2
-                    
-                    new_frames.append((t0, frame0))
-                    new_frames.append((t_mid, mid_frame))
-                
-                new_frames.append(frame_list[-1])
-                frame_list = new_frames
+        Returns:
+            中間フレームテンソルのリスト (各 1,3,H,W)
+        """
+        mids = []
+        for start in range(0, len(timesteps), self.max_batch_size):
+            chunk = timesteps[start:start + self.max_batch_size]
+            n = len(chunk)
+            t = torch.tensor(chunk, dtype=I0.dtype, device=I0.device).view(n, 1, 1, 1)
+            out = self._forward(I0.expand(n, -1, -1, -1), I1.expand(n, -1, -1, -1),
+                                timestep=t)
+            mids.extend(out.split(1, dim=0))
+        return mids
+    
+    def _infer_bisection(self, I0, I1, num_frames):
+        """
+        分割スケジュールで中間フレームを生成（中点のみを推論できるモデル用）
+        
+        Returns:
+            内部フレーム (両端を除く num_frames-2 枚) のテンソルのリスト
+        """
+        nodes = {Fraction(0): I0, Fraction(1): I1}
+        
+        # 階層ごとにノードをまとめてバッチ推論（すべて区間のちょうど中点）
+        for level in bisection_plan(num_frames)[0]:
+            mids = self._infer_pairs([nodes[left] for left, _, _ in level],
+                                     [nodes[right] for _, _, right in level])
+            for (_, mid, _), frame in zip(level, mids):
+                nodes[mid] = frame
+        
+        return list(self._iter_bisection(nodes, num_frames))
+    
+    def _infer_pairs(self, frames0, frames1):
+        """
+        複数のフレームペアの中間フレームをバッチ推論で生成
+        
+        Args:
+            frames0: 開始側テンソルのリスト (各 1,3,H,W)
+            frames1: 終了側テンソルのリスト (各 1,3,H,W)
             
-            # テンソルをPIL Imageに変換
-            for t, frame_tensor in sorted(frame_list, key=lambda x: x[0]):
-                if t == 0.0:
-                    continue  # 最初のフレームは既に追加済み
-                    
-                frame_np = frame_tensor.squeeze(0).permute(1, 2, 0).cpu().numpy()
-                frame_np = (frame_np * 255).clip(0, 255).astype(np.uint8)
-                frames.append(Image.fromarray(frame_np))
+        Returns:
+            中間フレームテンソルのリスト (各 1,3,H,W)
+        """
+        mids = []
+        for start in range(0, len(frames0), self.max_batch_size):
+            end = start + self.max_batch_size
+            batch0 = torch.cat(frames0[start:end], dim=0)
+            batch1 = torch.cat(frames1[start:end], dim=0)
+            # (N,3,H,W) で1回だけforwardし、結果をペアごとに分割
+            mids.extend(self._forward(batch0, batch1).split(1, dim=0))
+        return mids
+    
+    def _forward(self, batch0, batch1, timestep=None):
+        """
+        モデルの推論（タイル推論が有効で画像がタイルより大きければタイルごとに実行）
         
-        print(f"✓ {len(frames)}フレームを生成しました")
-        return frames[:num_frames]  # 指定フレーム数に調整
+        Args:
+            batch0, batch1: (N,3,H,W) テンソル
+            timestep: (N,1,1,1) の時刻（Noneなら中点を推論するモデル）
+            
+        Returns:
+            (N,3,H,W) 中間フレーム
+        """
+        h, w = batch0.shape[-2:]
+        if self.tile_size is None or (h <= self.tile_size and w <= self.tile_size):
+            return self._run_model(batch0, batch1, timestep)
+        return self._forward_tiled(batch0, batch1, timestep)
+    
+    def _run_model(self, batch0, batch1, timestep=None):
+        if timestep is None:
+            return self.model(batch0, batch1)
+        return self.model.inference(batch0, batch1, timestep=timestep)
+    
+    def _forward_tiled(self, batch0, batch1, timestep=None):
+        """
+        タイルごとに推論して重み付きで合成
+        
+        タイルをまたぐ大きな動きを保つため、まず縮小画像で大域フローを推定し、
+        各タイルについて時刻 t の位置 R に来る内容を I0 は R - t*f、I1 は
+        R + (1-t)*f から切り出す（f はタイル内のフローの中央値）。
+        切り出した2枚の間の動きは小さな残差だけになり、RIFEはそれを補正する。
+        タイルの重なりは feather_ramp の重みでブレンドする。
+        
+        同時に推論するのはタイル1枚分なので、ピークメモリは解像度によらずほぼ一定。
+        """
+        n, c, h, w = batch0.shape
+        tile = self.tile_size
+        overlap = min(self.tile_overlap, tile // 2)
+        tile_h = min(tile, self._align(h))
+        tile_w = min(tile, self._align(w))
+        
+        if timestep is None:
+            times = [0.5] * n
+        else:
+            times = timestep.reshape(-1).tolist()
+        
+        # 大域フロー（同じペアの時刻違いは1回だけ推定）
+        flows = {}
+        sample_flows = []
+        for i in range(n):
+            key = (batch0[i].data_ptr(), batch1[i].data_ptr())
+            if key not in flows:
+                flows[key] = coarse_flow(batch0[i], batch1[i])
+            sample_flows.append(flows[key])
+        
+        out = torch.zeros(n, c, h, w, dtype=batch0.dtype, device=batch0.device)
+        weight_sum = torch.zeros(1, 1, h, w, dtype=batch0.dtype, device=batch0.device)
+        ys = tile_starts(h, tile_h, overlap)
+        xs = tile_starts(w, tile_w, overlap)
+        
+        for y0 in ys:
+            for x0 in xs:
+                crops0, crops1 = [], []
+                for i in range(n):
+                    fx, fy = self._tile_flow(sample_flows[i], y0, x0, tile_h, tile_w)
+                    t = times[i]
+                    crops0.append(self._crop(batch0[i:i + 1], y0 - t * fy, x0 - t * fx,
+                                             tile_h, tile_w))
+                    crops1.append(self._crop(batch1[i:i + 1], y0 + (1 - t) * fy,
+                                             x0 + (1 - t) * fx, tile_h, tile_w))
+                pred = self._run_model(torch.cat(crops0), torch.cat(crops1), timestep)
+                
+                # 画像内に収まる部分だけを合成
+                th, tw = min(tile_h, h - y0), min(tile_w, w - x0)
+                weight = (feather_ramp(tile_h, overlap, y0 > 0, y0 + tile_h < h)[:th, None]
+                          * feather_ramp(tile_w, overlap, x0 > 0, x0 + tile_w < w)[None, :tw])
+                weight = weight.to(out.dtype).to(out.device)
+                out[:, :, y0:y0 + th, x0:x0 + tw] += pred[:, :, :th, :tw].to(out.dtype) * weight
+                weight_sum[:, :, y0:y0 + th, x0:x0 + tw] += weight
+        
+        return out / weight_sum
+    
+    def _align(self, length):
+        return (length + self.TILE_ALIGN - 1) // self.TILE_ALIGN * self.TILE_ALIGN
+    
+    @staticmethod
+    def _tile_flow(flow_and_scale, y0, x0, tile_h, tile_w):
+        """タイル範囲の大域フローの中央値 (fx, fy)"""
+        flow, scale = flow_and_scale
+        fh, fw = flow.shape[:2]
+        top = min(int(y0 * scale), fh - 1)
+        left = min(int(x0 * scale), fw - 1)
+        bottom = max(top + 1, int(np.ceil((y0 + tile_h) * scale)))
+        right = max(left + 1, int(np.ceil((x0 + tile_w) * scale)))
+        region = flow[top:bottom, left:right].reshape(-1, 2)
+        fx, fy = np.median(region, axis=0)
+        return float(fx), float(fy)
+    
+    @staticmethod
+    def _crop(img, y0, x0, h, w):
+        """
+        (1,3,H,W) から左上 (y0, x0) の h×w を切り出す（画像外は端の画素で埋める）
+        """
+        y0, x0 = int(round(y0)), int(round(x0))
+        height, width = img.shape[-2:]
+        rows = torch.arange(y0, y0 + h, device=img.device).clamp(0, height - 1)
+        cols = torch.arange(x0, x0 + w, device=img.device).clamp(0, width - 1)
+        return img.index_select(2, rows).index_select(3, cols)
     
     def interpolate_with_motion(self, img1, img2, num_frames, mode,
                                pan_x, pan_y, zoom, rotate):
@@ -198,43 +667,47 @@ class RIFEInterpolator:
             for i, frame in enumerate(frames_basic):
                 # 進行度 (0.0 to 1.0)
                 progress = i / (len(frames_basic) - 1)
-                
-                # 段階的にモーションを適用
-                frame_transformed = self.apply_motion_transform(
-                    frame,
-                    pan_x * progress,
-                    pan_y * progress,
-                    1.0 + (zoom - 1.0) * progress,
-                    rotate * progress
+                frames_motion.append(
+                    self._steer(frame, progress, pan_x, pan_y, zoom, rotate)
                 )
-                frames_motion.append(frame_transformed)
             
             print(f"✓ モーション制御付き{len(frames_motion)}フレームを生成")
             return frames_motion
         
         return []
     
-    def save_video(self, frames, output_path, fps=16):
-        """フレームを動画として保存"""
-        print(f"💾 動画を保存中: {output_path}")
-        
-        if not frames:
-            raise ValueError("フレームが空です")
-        
-        # 最初のフレームからサイズを取得
-        width, height = frames[0].size
-        
-        # VideoWriter設定
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
-        
-        for frame in frames:
-            # PIL Image → OpenCV形式
-            frame_cv = cv2.cvtColor(np.array(frame), cv2.COLOR_RGB2BGR)
-            out.write(frame_cv)
+    def _steer(self, frame, progress, pan_x, pan_y, zoom, rotate):
+        """進行度 progress (0.0 to 1.0) に応じて段階的にモーションを適用"""
+        return self.apply_motion_transform(
+            frame,
+            pan_x * progress,
+            pan_y * progress,
+            1.0 + (zoom - 1.0) * progress,
+            rotate * progress
+        )
+    
+    def save_video(self, frames, output_path, fps=16, backend='auto', **writer_options):
+        """
+        フレームを動画として保存
         
-        out.release()
-        print(f"✓ 動画を保存しました: {output_path}")
+        Args:
+            frames: PIL Imageのリストまたはイテレータ（iter_frames()の出力を逐次書き込み可能）
+            output_path: 出力ファイルのパス
+            fps: フレームレート
+            backend: 'auto', 'ffmpeg', 'opencv' (video_writer.open_video_writer を参照)
+            **writer_options: codec, preset, crf, threads
+        """
+        print(f"💾 動画を保存中: {output_path}")
+        # イテレータ（iter_frames()）なら補間と書き出しが交互に進むので、フレームの生成に
+        # かかった時間を除いた分を書き出しの時間として記録する
+        streaming = not isinstance(frames, (list, tuple))
+        timed = TimedIterator(frames)
+        start = time.perf_counter()
+        count = write_video(timed, output_path, fps=fps, backend=backend, **writer_options)
+        if streaming:
+            observe_stage('rife', 'interpolate', timed.seconds, frames=count)
+        observe_stage('rife', 'write', time.perf_counter() - start - timed.seconds, frames=count)
+        print(f"✓ 動画を保存しました: {output_path} ({count}フレーム)")
         return output_path
 
 
@@ -249,23 +722,46 @@ def main():
     parser.add_argument('--frames', type=int, default=16, help='フレーム数')
     parser.add_argument('--fps', type=int, default=16, help='FPS')
     parser.add_argument('--device', default='cpu', help='cpu or cuda')
+    parser.add_argument('--batch-size', type=int, default=8,
+                       help='1回の推論でまとめるフレームペア数の上限')
+    parser.add_argument('--stream', action='store_true',
+                       help='生成と同時に逐次書き込み（長尺・高解像度向け、メモリ使用量を抑える）')
+    parser.add_argument('--tile-size', type=int, default=0,
+                       help='タイル推論のタイルの一辺（0で無効、高解像度ではメモリ使用量を抑える）')
+    parser.add_argument('--tile-overlap', type=int, default=64,
+                       help='タイルの重なり幅')
     parser.add_argument('--mode', default='basic', choices=['basic', 'hybrid', 'steerable'],
                        help='補間モード')
     parser.add_argument('--pan-x', type=float, default=0, help='パン X (-1 to 1)')
     parser.add_argument('--pan-y', type=float, default=0, help='パン Y (-1 to 1)')
     parser.add_argument('--zoom', type=float, default=1.0, help='ズーム (0.5 to 2.0)')
     parser.add_argument('--rotate', type=float, default=0, help='回転 (-180 to 180度)')
+    add_writer_arguments(parser)
+    add_result_cache_arguments(parser)
     
     args = parser.parse_args()
     
     # 画像読み込み
     img1 = Image.open(args.image1).convert('RGB')
     img2 = Image.open(args.image2).convert('RGB')
+    output_path = Path(args.output)
+    output_path.parent.mkdir(exist_ok=True, parents=True)
+    
+    interpolator = RIFEInterpolator(device=args.device, max_batch_size=args.batch_size,
+                                    tile_size=args.tile_size, tile_overlap=args.tile_overlap)
+    
+    # 結果キャッシュ（同じ入力・設定の動画があれば補間せずに返す）
+    result_cache = result_cache_from_args(args)
+    if result_cache is not None:
+        cache_params = cli_params(args, 'rife_interpolate')
+        cache_key = result_cache.key([img1, img2], cache_params, interpolator.model_identity())
+        if result_cache.fetch(cache_key, output_path):
+            print(f"\n✅ 結果キャッシュから取り出しました: {output_path}")
+            return
+    generation_start = time.perf_counter()
     
     # 補間実行
-    interpolator = RIFEInterpolator(device=args.device)
-    frames = interpolator.interpolate(
-        img1, img2, 
+    motion = dict(
         num_frames=args.frames,
         mode=args.mode,
         pan_x=args.pan_x,
@@ -273,11 +769,17 @@ def main():
         zoom=args.zoom,
         rotate=args.rotate
     )
+    if args.stream:
+        frames = interpolator.iter_frames(img1, img2, **motion)
+    else:
+        frames = interpolator.interpolate(img1, img2, **motion)
     
     # 動画保存
-    output_path = Path(args.output)
-    output_path.parent.mkdir(exist_ok=True, parents=True)
-    interpolator.save_video(frames, output_path, fps=args.fps)
+    interpolator.save_video(frames, output_path, fps=args.fps,
+                            **writer_options_from_args(args))
+    if result_cache is not None:
+        result_cache.store(cache_key, output_path, time.perf_counter() - generation_start,
+                           cache_params)
     
     print(f"\n✅ 完了! {output_path}")
 
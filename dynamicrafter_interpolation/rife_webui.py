@@ -5,92 +5,155 @@ RIFE軽量版WebUI
 """
 
 import gradio as gr
-import subprocess
+import threading
 from pathlib import Path
 import time
 
+import numpy as np
+from PIL import Image
+
+from rife_interpolate import RIFEInterpolator
+from job_queue import JobQueue, max_workers_from_env
+from metrics import start_metrics_server_from_env
+from progress import ProgressTracker, format_event
+from result_cache import link_or_copy
+
 # 出力ディレクトリ
 OUTPUT_DIR = Path(__file__).parent / "output_videos"
 INPUT_DIR = Path(__file__).parent / "input_images"
 OUTPUT_DIR.mkdir(exist_ok=True)
 INPUT_DIR.mkdir(exist_ok=True)
 
+# 常駐RIFEエンジン（スレッドごとに1つ保持し、リクエスト間で使い回す）
+# ジョブキューのワーカーはスレッドごとに別のエンジンで推論するので、
+# RIFE_WEBUI_MAX_JOBS を増やすとジョブが並行して進む
+_engines = threading.local()
+_engine_lock = threading.Lock()  # モデルの読み込み（初回はダウンロード）だけを直列化
+
+
+def get_engine():
+    """
+    このスレッドの常駐RIFEエンジンを取得（スレッドごとに初回のみモデルをロード）
+    
+    Returns:
+        ロード済みのRIFEInterpolator
+    """
+    engine = getattr(_engines, 'engine', None)
+    if engine is None:
+        with _engine_lock:
+            engine = RIFEInterpolator(device='cpu')
+            engine.load_model()
+        _engines.engine = engine
+    return engine
+
+
+def _to_pil(image):
+    """Gradioの入力（numpy / PIL）をRGBのPIL Imageに変換"""
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image).convert('RGB')
+    return image.convert('RGB')
+
+
+# ジョブキュー（ジョブごとに output_videos/jobs/<ジョブID>/ に書き出す）
+JOB_ROOT = OUTPUT_DIR / "jobs"
+job_queue = JobQueue(JOB_ROOT, max_workers=max_workers_from_env('RIFE_WEBUI_MAX_JOBS', 1),
+                     name="rife_webui")
+
+# メトリクス (/metrics) のポート（環境変数 DYNAMICRAFTER_METRICS_PORT、0で無効）
+METRICS_PORT = 9861
+
+
+def _cancellable(frames, job):
+    """フレームごとにキャンセルを確認しながら流す"""
+    for frame in frames:
+        job.check_cancelled()
+        yield frame
+
 
 def run_rife_interpolation(image1, image2, num_frames, fps, save_path, mode, 
                           pan_x, pan_y, zoom, rotate):
-    """RIFE補間を実行"""
+    """RIFE補間をジョブとしてキューに追加し、完了まで状況を表示（推論はプロセス内の常駐エンジン）"""
+    job = None
     try:
-        from PIL import Image
-        import numpy as np
+        if image1 is None or image2 is None:
+            yield None, "❌ 開始・終了フレームの両方をアップロードしてください", None
+            return
         
-        # 画像を保存
-        img1_path = INPUT_DIR / "temp_frame1.jpg"
-        img2_path = INPUT_DIR / "temp_frame2.jpg"
+        img1 = _to_pil(image1)
+        img2 = _to_pil(image2)
         
-        if isinstance(image1, np.ndarray):
-            Image.fromarray(image1).save(img1_path)
-        else:
-            image1.save(img1_path)
+        def run(job):
+            # ワーカースレッドごとのエンジンで推論（他のジョブとはロックを共有しない）
+            load_start = time.time()
+            engine = get_engine()
+            load_elapsed = time.time() - load_start
             
-        if isinstance(image2, np.ndarray):
-            Image.fromarray(image2).save(img2_path)
-        else:
-            image2.save(img2_path)
-        
-        output_path = OUTPUT_DIR / "output_rife.mp4"
-        
-        # RIFEスクリプト実行
-        script_path = Path(__file__).parent / "rife_interpolate.py"
-        
-        cmd = [
-            "python3", str(script_path),
-            "--image1", str(img1_path),
-            "--image2", str(img2_path),
-            "--output", str(output_path),
-            "--frames", str(num_frames),
-            "--fps", str(fps),
-            "--device", "cpu",
-            "--mode", mode,
-            "--pan-x", str(pan_x),
-            "--pan-y", str(pan_y),
-            "--zoom", str(zoom),
-            "--rotate", str(rotate)
-        ]
+            output_path = job.workspace / f"rife_{mode}.mp4"
+            frames = engine.iter_frames(
+                img1, img2,
+                num_frames=int(num_frames),
+                mode=mode,
+                pan_x=pan_x,
+                pan_y=pan_y,
+                zoom=zoom,
+                rotate=rotate
+            )
+            # フレームごとの進捗を job.progress に送る
+            tracker = ProgressTracker([job.report_progress])
+            frames = tracker.track(frames, 'interpolate', total=int(num_frames))
+            engine.save_video(_cancellable(frames, job), output_path, fps=int(fps))
+            tracker.done()
+            backend = "RIFE" if engine.model is not None else "OpenCV (フォールバック)"
+            return output_path, load_elapsed, backend
         
-        start_time = time.time()
+        job = job_queue.submit(run, priority="final", name=f"rife {mode}", engine="rife")
+        seen = 0
+        while not job.wait(timeout=0):
+            seen = job.wait_update(seen, timeout=1)
+            if job.wait(timeout=0):
+                break
+            if job.status == "queued":
+                yield None, f"⏳ 待機中... キューの{job_queue.position(job.id)}番目\nジョブID: {job.id}", job.id
+            else:
+                detail = f"\n進捗: {format_event(job.progress)}" if job.progress else ""
+                yield None, f"⏳ 処理中... {job.elapsed:.0f}秒経過{detail}\nジョブID: {job.id}", job.id
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5分
-        )
+        if job.status == "cancelled":
+            yield None, f"⏹ キャンセルしました (ジョブID: {job.id})", job.id
+            return
+        if job.status == "failed":
+            yield None, f"❌ エラー: {job.error}", job.id
+            return
         
-        elapsed = int(time.time() - start_time)
+        output_path, load_elapsed, backend = job.result
         
-        if result.returncode == 0:
-            if output_path.exists():
-                # ユーザー指定の保存パス、または自動生成
-                import shutil
-                if save_path and save_path.strip():
-                    download_path = Path(save_path.strip())
-                    download_path.parent.mkdir(parents=True, exist_ok=True)
-                else:
-                    timestamp = time.strftime("%Y%m%d_%H%M%S")
-                    download_path = OUTPUT_DIR / f"rife_{mode}_{timestamp}.mp4"
-                
-                shutil.copy(output_path, download_path)
-                return str(download_path), f"✓ 成功!\n\n保存先: {download_path}\n処理時間: {elapsed}秒\n\n{result.stdout}"
-            else:
-                return None, f"❌ 動画ファイルが生成されませんでした\n\n{result.stdout}"
+        # ユーザー指定の保存パス、または自動生成
+        if save_path and save_path.strip():
+            download_path = Path(save_path.strip())
+            download_path.parent.mkdir(parents=True, exist_ok=True)
         else:
-            return None, f"❌ エラー (code {result.returncode})\n\n{result.stderr}"
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            download_path = OUTPUT_DIR / f"rife_{mode}_{timestamp}_{job.id}.mp4"
+        link_or_copy(output_path, download_path)
+        
+        yield str(download_path), (
+            f"✓ 成功!\n\n保存先: {download_path}\n"
+            f"処理時間: {job.elapsed:.1f}秒 (モデル準備: {load_elapsed:.1f}秒)\n"
+            f"エンジン: {backend}\nフレーム数: {int(num_frames)}"
+        ), job.id
             
-    except subprocess.TimeoutExpired:
-        return None, "❌ タイムアウト: 処理に5分以上かかりました"
     except Exception as e:
         import traceback
-        return None, f"❌ エラー: {str(e)}\n\n{traceback.format_exc()}"
+        yield None, f"❌ エラー: {str(e)}\n\n{traceback.format_exc()}", job.id if job else None
+
+
+def cancel_rife_interpolation(job_id):
+    """実行中・待機中のジョブをキャンセル"""
+    if not job_id:
+        return "キャンセルするジョブがありません"
+    if job_queue.cancel(job_id):
+        return f"⏹ キャンセルを要求しました (ジョブID: {job_id})"
+    return f"ジョブ {job_id} はすでに終了しています"
 
 
 # UI作成
@@ -135,7 +198,10 @@ with gr.Blocks(title="RIFE フレーム補間") as app:
                 value=""
             )
             
-            btn = gr.Button("⚡ 高速生成", variant="primary", size="lg")
+            with gr.Row():
+                btn = gr.Button("⚡ 高速生成", variant="primary", size="lg")
+                cancel_btn = gr.Button("⏹ キャンセル", size="lg")
+            job_id = gr.State(None)
         
         with gr.Column():
             gr.Markdown("### 出力")
@@ -143,11 +209,14 @@ with gr.Blocks(title="RIFE フレーム補間") as app:
             status = gr.Textbox(label="ステータス", lines=10)
             download_btn = gr.File(label="📥 ダウンロード")
     
+    # 実際の同時実行数はジョブキューで制限
     btn.click(
         fn=run_rife_interpolation,
         inputs=[image1, image2, num_frames, fps, save_path, mode, pan_x, pan_y, zoom, rotate],
-        outputs=[download_btn, status]
+        outputs=[download_btn, status, job_id],
+        concurrency_limit=None
     )
+    cancel_btn.click(fn=cancel_rife_interpolation, inputs=[job_id], outputs=[status], queue=False)
     
     gr.Markdown("""
     ---
@@ -161,6 +230,10 @@ with gr.Blocks(title="RIFE フレーム補間") as app:
     4. 「高速生成」ボタンをクリック
     5. **📥ダウンロードボタンからローカルに保存**
     
+    ### 🔁 同時実行
+    - 同時実行数は環境変数 `RIFE_WEBUI_MAX_JOBS` で変更できます（既定: 1）
+    - 同時に実行するジョブはそれぞれ専用のRIFEエンジン（約30MB）で並行して処理されます
+    
     ### 🎥 モーション制御
     - **パン X/Y**: カメラの水平/垂直移動 (-1 〜 1)
     - **ズーム**: カメラのズームイン/アウト (0.5 〜 2.0)
@@ -187,6 +260,9 @@ if __name__ == "__main__":
     print("=" * 50)
     print("RIFE 軽量版 WebUI")
     print("=" * 50)
+    start_metrics_server_from_env(METRICS_PORT)
+    # 最初のリクエストでコールドスタートしないよう起動時にロード（モデルのダウンロードも済ませる）
+    get_engine()
     app.launch(
         server_name="0.0.0.0",
         server_port=7861,  # 別ポート
@@ -0,0 +1,158 @@
+"""
+DynamiCrafterのDDIMサンプリング
+
+scripts.evaluation.funcs.batch_ddim_sampling と同じ手順（無条件ガイダンスの構築、
+解像度に応じた timestep_spacing / guidance_rescale）でサンプリングするが、
+初期ノイズ x_T やステップごとのコールバックを呼び出し側から指定できる。
+複数ジョブをバッチにまとめるときに、ジョブごとのシードで初期ノイズを作るために使う。
+"""
+import torch
+
+
+def job_noise(seed, shape, device):
+    """
+    シードから初期ノイズを生成（グローバルな乱数状態に依存しない）
+
+    Args:
+        seed: ランダムシード
+        shape: (c, t, h, w)
+        device: 出力先のデバイス
+    """
+    generator = torch.Generator().manual_seed(int(seed))
+    return torch.randn(shape, generator=generator).to(device)
+
+
+def zero_image_embedding(model, batch_size):
+    """
+    無条件ガイダンス用の黒画像のCLIP埋め込み
+
+    毎回同じ値なので、モデルごとに1回だけ計算して保持する。
+    """
+    emb = getattr(model, '_zero_image_embedding', None)
+    if emb is None:
+        uc_img = torch.zeros(1, 3, 224, 224).to(model.device)
+        emb = model.image_proj_model(model.embedder(uc_img))
+        model._zero_image_embedding = emb
+    return emb.expand(batch_size, -1, -1)
+
+
+def unconditional_conditioning(model, cond, batch_size, uc_text_emb=None):
+    """
+    CFG用の無条件の条件付けを作成（batch_ddim_sampling と同じ）
+
+    Args:
+        model: DynamiCrafterモデル
+        cond: 条件付け ("fs" は取り除いたもの)
+        batch_size: バッチサイズ
+        uc_text_emb: 空プロンプト "" のテキスト埋め込み (1, L, D)。
+            呼び出し側のプロンプトキャッシュから渡す。Noneならここでエンコードする
+    """
+    if model.uncond_type == "empty_seq":
+        if uc_text_emb is None:
+            uc_text_emb = model.get_learned_conditioning([""])
+        uc_emb = uc_text_emb.expand(batch_size, -1, -1)
+    elif model.uncond_type == "zero_embed":
+        c_emb = cond["c_crossattn"][0] if isinstance(cond, dict) else cond
+        uc_emb = torch.zeros_like(c_emb)
+    else:
+        raise ValueError(f"不明な uncond_type: {model.uncond_type}")
+
+    # 画像埋め込みのトークン
+    if hasattr(model, 'embedder'):
+        uc_emb = torch.cat([uc_emb, zero_image_embedding(model, batch_size).to(uc_emb.dtype)], dim=1)
+
+    if isinstance(cond, dict):
+        uc = dict(cond)
+        uc['c_crossattn'] = [uc_emb]
+        return uc
+    return uc_emb
+
+
+def ddim_sample_latents(model, cond, noise_shape, ddim_steps=50, ddim_eta=1.0, cfg_scale=7.5,
+                        x_T=None, callback=None, uc_text_emb=None, **kwargs):
+    """
+    DDIMサンプリングを行いlatentを返す（デコードはしない）
+
+    Args:
+        model: DynamiCrafterモデル
+        cond: 条件付け ("c_crossattn", "c_concat", "fs")
+        noise_shape: [b, c, t, h, w]
+        ddim_steps: DDIMサンプリングのステップ数
+        ddim_eta: DDIMのetaパラメータ
+        cfg_scale: Classifier-free guidanceのスケール
+        x_T: 初期ノイズ (b, c, t, h, w)。Noneなら乱数状態から生成
+        callback: 各ステップ後に callback(step) を呼ぶ
+        uc_text_emb: 空プロンプトのテキスト埋め込み (unconditional_conditioning を参照)
+        **kwargs: DDIMSampler.sample に渡す追加引数 (mask, x0 など)
+
+    Returns:
+        latent (b, c, t, h, w)
+    """
+    from lvdm.models.samplers.ddim import DDIMSampler
+
+    cond = dict(cond)
+    fs = cond.pop("fs")
+    batch_size = noise_shape[0]
+
+    # 256解像度モデルとそれ以外で設定が異なる（batch_ddim_sampling と同じ）
+    if noise_shape[-1] == 32:
+        timestep_spacing, guidance_rescale = "uniform", 0.0
+    else:
+        timestep_spacing, guidance_rescale = "uniform_trailing", 0.7
+
+    uc = (unconditional_conditioning(model, cond, batch_size, uc_text_emb)
+          if cfg_scale != 1.0 else None)
+
+    sampler = DDIMSampler(model)
+    samples, _ = sampler.sample(
+        S=ddim_steps,
+        conditioning=cond,
+        batch_size=batch_size,
+        shape=noise_shape[1:],
+        verbose=False,
+        unconditional_guidance_scale=cfg_scale,
+        unconditional_conditioning=uc,
+        eta=ddim_eta,
+        x_T=x_T,
+        callback=callback,
+        fs=fs,
+        timestep_spacing=timestep_spacing,
+        guidance_rescale=guidance_rescale,
+        clean_cond=True,
+        **kwargs
+    )
+    return samples
+
+
+def encode_first_stage_mode(model, x):
+    """
+    画像をlatentに変換（VAEの事後分布の平均 (mode) を使う）
+
+    model.encode_first_stage は事後分布からサンプルするため、グローバルな乱数を消費する。
+    latentをキャッシュすると、ヒットしたときだけその乱数が消費されず、同じシードでも
+    後のDDIMのノイズが変わってしまう。乱数を使わない平均にすれば、キャッシュの状態に
+    関係なく同じ結果になる。
+
+    Args:
+        x: 画像 (N, 3, H, W) [-1, 1]
+
+    Returns:
+        latent (N, c, H/8, W/8)
+    """
+    posterior = model.first_stage_model.encode(x)
+    # lvdm の get_first_stage_encoding と同じく、テンソルならそのまま使う
+    z = posterior if isinstance(posterior, torch.Tensor) else posterior.mode()
+    return (model.scale_factor * z).detach()
+
+
+def decode_latents(model, samples):
+    """
+    latentを動画に変換
+
+    Args:
+        samples: latent (b, c, t, h, w)
+
+    Returns:
+        (b, 1, c, t, H, W) batch_ddim_sampling と同じ形式
+    """
+    return model.decode_first_stage(samples).unsqueeze(1)
@@ -5,149 +5,197 @@ DynamiCrafter Frame Interpolation Simple WebUI
 """
 
 import gradio as gr
-import subprocess
-import os
+import time
 from pathlib import Path
 
+import numpy as np
+from PIL import Image
+
+from job_queue import JobQueue, max_workers_from_env
+from metrics import start_metrics_server_from_env
+from progress import format_event, event_fraction
+from result_cache import link_or_copy
+
 # 出力ディレクトリ
 OUTPUT_DIR = Path(__file__).parent / "output_videos"
 INPUT_DIR = Path(__file__).parent / "input_images"
 OUTPUT_DIR.mkdir(exist_ok=True)
 INPUT_DIR.mkdir(exist_ok=True)
 
-def run_interpolation(image1, image2, num_frames, fps, mode, pan_x, pan_y, zoom, rotate, save_path):
-    """中割処理を実行"""
+# ジョブキュー（ジョブごとに output_videos/jobs/<ジョブID>/ を作業ディレクトリにする）
+# DynamiCrafterはメモリを大きく使うため、同時実行数は既定で1
+JOB_ROOT = OUTPUT_DIR / "jobs"
+MAX_WAIT = 30 * 60  # 30分
+# 完成した動画の結果キャッシュ（同じ入力・設定ならサブプロセスはモデルを読み込まずに終わる）
+RESULT_CACHE_DIR = OUTPUT_DIR / "result_cache"
+
+# 進捗イベントが来ないときにログ表示を更新する間隔（秒）
+LOG_REFRESH = 10
+job_queue = JobQueue(JOB_ROOT, max_workers=max_workers_from_env('DYNAMICRAFTER_WEBUI_MAX_JOBS', 1),
+                     name="simple_webui")
+
+# メトリクス (/metrics) のポート（環境変数 DYNAMICRAFTER_METRICS_PORT、0で無効）
+METRICS_PORT = 9862  # webui.py (9860)・rife_webui.py (9861) と同時に起動できるよう別ポート
+
+# プレビュー（優先実行）の設定
+PREVIEW_STEPS = 10
+PREVIEW_FRAMES = 8
+
+
+def build_command(job, num_frames, fps, mode, pan_x, pan_y, zoom, rotate, precision, preview):
+    """
+    ジョブの作業ディレクトリを使うコマンドを構築
+    
+    Returns:
+        (cmd, output_path)
+    """
+    interp_dir = Path(__file__).parent
+    img1_path = job.workspace / "frame1.png"
+    img2_path = job.workspace / "frame2.png"
+    output_path = job.workspace / f"output_{mode}.mp4"
+    
+    if preview:
+        num_frames = min(int(num_frames), PREVIEW_FRAMES)
+    
+    if mode == "basic":
+        script_path = interp_dir / "interpolate.py"
+        cmd = [
+            "python3", str(script_path),
+            "--image1", str(img1_path.resolve()),
+            "--image2", str(img2_path.resolve()),
+            "--output", str(output_path.resolve()),
+            "--frames", str(num_frames),
+            "--fps", str(fps),
+            "--precision", precision,
+            "--progress-json"
+        ]
+    else:
+        script_path = interp_dir / "advanced_interpolate.py"
+        cmd = [
+            "python3", str(script_path),
+            "--image1", str(img1_path.resolve()),
+            "--image2", str(img2_path.resolve()),
+            "--output", str(output_path.resolve()),
+            "--frames", str(num_frames),
+            "--fps", str(fps),
+            "--precision", precision,
+            "--method", mode,
+            "--camera-pan-x", str(pan_x),
+            "--camera-pan-y", str(pan_y),
+            "--camera-zoom", str(zoom - 1.0),  # スライダーは1.0が等倍
+            "--camera-rotate", str(rotate),
+            "--progress-json"
+        ]
+    if preview:
+        cmd += ["--steps", str(PREVIEW_STEPS)]
+    cmd += ["--result-cache-dir", str(RESULT_CACHE_DIR.resolve())]
+    return cmd, output_path
+
+
+def _save_image(image, path):
+    if isinstance(image, np.ndarray):
+        Image.fromarray(image).save(path)
+    else:
+        image.save(path)
+
+
+def run_interpolation(image1, image2, num_frames, fps, mode, pan_x, pan_y, zoom, rotate, save_path,
+                      precision="fp32", preview=False, progress=gr.Progress()):
+    """中割処理をジョブとしてキューに追加し、完了まで状況を表示（進捗イベントが届くたびに更新）"""
+    job = None
     try:
-        # 画像を保存
-        img1_path = INPUT_DIR / "temp_frame1.jpg"
-        img2_path = INPUT_DIR / "temp_frame2.jpg"
-        
-        from PIL import Image
-        import numpy as np
-        
-        if isinstance(image1, np.ndarray):
-            Image.fromarray(image1).save(img1_path)
-        else:
-            image1.save(img1_path)
-            
-        if isinstance(image2, np.ndarray):
-            Image.fromarray(image2).save(img2_path)
-        else:
-            image2.save(img2_path)
+        if image1 is None or image2 is None:
+            yield None, "❌ 開始・終了フレームの両方をアップロードしてください", None
+            return
         
-        output_path = OUTPUT_DIR / f"output_{mode}.mp4"
-        
-        # コマンド構築
         dynamicrafter_dir = Path(__file__).parent.parent / "DynamiCrafter"
-        interp_dir = Path(__file__).parent
-        
-        if mode == "basic":
-            script_path = interp_dir / "interpolate.py"
-            cmd = [
-                "python3", str(script_path),
-                "--image1", str(img1_path.resolve()),
-                "--image2", str(img2_path.resolve()),
-                "--output", str(output_path.resolve()),
-                "--frames", str(num_frames),
-                "--fps", str(fps)
-            ]
-        else:
-            script_path = interp_dir / "advanced_interpolate.py"
-            cmd = [
-                "python3", str(script_path),
-                "--image1", str(img1_path.resolve()),
-                "--image2", str(img2_path.resolve()),
-                "--output", str(output_path.resolve()),
-                "--frames", str(num_frames),
-                "--fps", str(fps),
-                "--mode", mode,
-                "--pan-x", str(pan_x),
-                "--pan-y", str(pan_y),
-                "--zoom", str(zoom),
-                "--rotate", str(rotate)
-            ]
-        
-        # バックグラウンドで実行（タイムアウトなし）
-        import time
-        log_file = OUTPUT_DIR / "processing.log"
-        status_file = OUTPUT_DIR / "status.txt"
-        
-        # ステータスファイルを初期化
-        status_file.write_text("processing")
         
-        # バックグラウンド実行
-        with open(log_file, 'w') as log:
-            process = subprocess.Popen(
-                cmd,
-                cwd=str(dynamicrafter_dir),
-                stdout=log,
-                stderr=subprocess.STDOUT,
-                start_new_session=True  # 親プロセスから独立
-            )
+        def run(job):
+            # 入力画像もジョブの作業ディレクトリに保存（他のユーザーと衝突しない）
+            cmd, output_path = build_command(job, num_frames, fps, mode, pan_x, pan_y,
+                                             zoom, rotate, precision, preview)
+            _save_image(image1, job.workspace / "frame1.png")
+            _save_image(image2, job.workspace / "frame2.png")
+            code = job.run_subprocess(cmd, cwd=str(dynamicrafter_dir))
+            if code != 0 or not output_path.exists():
+                raise RuntimeError(f"処理に失敗しました (code {code})")
+            return output_path
         
-        # 処理完了を待つ（最大30分、10秒ごとにチェック）
-        max_wait = 30 * 60  # 30分
-        check_interval = 10  # 10秒
-        elapsed = 0
-        last_log_size = 0
+        priority = "preview" if preview else "final"
+        job = job_queue.submit(run, priority=priority, name=f"{mode} ({priority})",
+                               engine="dynamicrafter" if mode == "basic" else "advanced")
         
-        while elapsed < max_wait:
-            time.sleep(check_interval)
-            elapsed += check_interval
-            
-            # プロセス終了チェック
-            poll = process.poll()
-            if poll is not None:
-                # プロセス終了
-                if poll == 0 and output_path.exists():
-                    # ユーザー指定の保存パス、または自動生成
-                    import shutil
-                    if save_path and save_path.strip():
-                        download_path = Path(save_path.strip())
-                        download_path.parent.mkdir(parents=True, exist_ok=True)
-                    else:
-                        timestamp = time.strftime("%Y%m%d_%H%M%S")
-                        download_path = OUTPUT_DIR / f"{mode}_{timestamp}.mp4"
-                    
-                    shutil.copy(output_path, download_path)
-                    
-                    status_file.write_text("completed")
-                    log_content = log_file.read_text()[-2000:] if log_file.exists() else ""
-                    return str(download_path), f"✓ 成功!\n\n保存先: {download_path}\n処理時間: {elapsed//60}分{elapsed%60}秒\n\n{log_content}"
-                else:
-                    status_file.write_text("failed")
-                    log_content = log_file.read_text()[-2000:] if log_file.exists() else ""
-                    return None, f"❌ エラー (code {poll})\n\n{log_content}"
-            
-            # リアルタイム進捗表示（10秒ごと）
-            minutes = elapsed // 60
-            seconds = elapsed % 60
+        # 完了を待ちながら状況を表示（サブプロセスの進捗イベントが届いたらすぐ更新）
+        seen = 0
+        while not job.wait(timeout=0):
+            seen = job.wait_update(seen, timeout=2 if job.status == "queued" else LOG_REFRESH)
+            if job.wait(timeout=0):
+                break
+            if job.elapsed > MAX_WAIT:
+                job_queue.cancel(job.id)
+                job.wait()
+                yield None, f"❌ タイムアウト: 30分以上かかりました\n\nログ: {job.log_path}", job.id
+                return
             
-            # ログファイルの最新部分を取得
-            log_preview = ""
-            if log_file.exists():
-                current_size = log_file.stat().st_size
-                if current_size > last_log_size:
-                    log_preview = "\n\n📝 最新ログ:\n" + log_file.read_text()[-500:]
-                    last_log_size = current_size
-            
-            status_msg = f"⏳ 処理中... {minutes}分{seconds}秒経過\n\n"
-            status_msg += f"モード: {mode}\n"
+            if job.status == "queued":
+                status_msg = f"⏳ 待機中... キューの{job_queue.position(job.id)}番目\n\n"
+                progress(0, desc="待機中")
+            else:
+                elapsed = int(job.elapsed)
+                status_msg = f"⏳ 処理中... {elapsed // 60}分{elapsed % 60}秒経過\n"
+                event = job.progress
+                if event is not None:
+                    status_msg += f"進捗: {format_event(event)}\n"
+                    fraction = event_fraction(event)
+                    if fraction is not None:
+                        progress(fraction, desc=format_event(event))
+                status_msg += "\n"
+            status_msg += f"ジョブID: {job.id}\n"
+            status_msg += f"モード: {mode}{' (プレビュー)' if preview else ''}\n"
             status_msg += f"フレーム数: {num_frames}\n"
-            status_msg += f"出力先: {output_path}\n"
-            status_msg += f"ログファイル: {log_file}"
-            status_msg += log_preview
+            status_msg += f"ログファイル: {job.log_path}"
+            log_preview = job.read_log(500)
+            if log_preview:
+                status_msg += "\n\n📝 最新ログ:\n" + log_preview
             
-            yield None, status_msg
+            yield None, status_msg, job.id
+        
+        elapsed = int(job.elapsed)
+        if job.status == "cancelled":
+            yield None, f"⏹ キャンセルしました (ジョブID: {job.id})", job.id
+            return
+        if job.status == "failed":
+            yield None, f"❌ エラー: {job.error}\n\n{job.read_log()}", job.id
+            return
         
-        # タイムアウト
-        process.terminate()
-        status_file.write_text("timeout")
-        return None, f"❌ タイムアウト: 30分以上かかりました\n\nログ: {log_file}"
+        # ユーザー指定の保存パス、または自動生成
+        if save_path and save_path.strip():
+            download_path = Path(save_path.strip())
+            download_path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            download_path = OUTPUT_DIR / f"{mode}_{timestamp}_{job.id}.mp4"
+        
+        # 同じ動画の実体を増やさないようハードリンク（できなければコピー）
+        link_or_copy(job.result, download_path)
+        
+        yield str(download_path), (
+            f"✓ 成功!\n\n保存先: {download_path}\n"
+            f"処理時間: {elapsed // 60}分{elapsed % 60}秒\n\n{job.read_log()}"
+        ), job.id
             
     except Exception as e:
         import traceback
-        return None, f"❌ エラー: {str(e)}\n\n{traceback.format_exc()}"
+        yield None, f"❌ エラー: {str(e)}\n\n{traceback.format_exc()}", job.id if job else None
+
+
+def cancel_interpolation(job_id):
+    """実行中・待機中のジョブをキャンセル"""
+    if not job_id:
+        return "キャンセルするジョブがありません"
+    if job_queue.cancel(job_id):
+        return f"⏹ キャンセルを要求しました (ジョブID: {job_id})"
+    return f"ジョブ {job_id} はすでに終了しています"
 
 
 # UI作成
@@ -168,6 +216,12 @@ with gr.Blocks(title="DynamiCrafter WebUI") as app:
             )
             num_frames = gr.Slider(8, 32, value=16, step=8, label="フレーム数")
             fps = gr.Slider(8, 30, value=16, step=1, label="FPS")
+            precision = gr.Radio(
+                choices=["fp32", "bf16"],
+                value="fp32",
+                label="推論精度",
+                info="bf16: メモリ約半分（AVX512-BF16/AMX対応CPUで高速）"
+            )
             
             with gr.Accordion("カメラワーク（モード=hybrid/steerable時のみ）", open=False):
                 pan_x = gr.Slider(-5, 5, value=0, step=0.5, label="パン X")
@@ -182,7 +236,15 @@ with gr.Blocks(title="DynamiCrafter WebUI") as app:
                 value=""
             )
             
-            btn = gr.Button("🎬 生成", variant="primary", size="lg")
+            preview = gr.Checkbox(
+                value=False,
+                label=f"プレビュー（{PREVIEW_FRAMES}フレーム・{PREVIEW_STEPS}ステップ、優先実行）"
+            )
+            
+            with gr.Row():
+                btn = gr.Button("🎬 生成", variant="primary", size="lg")
+                cancel_btn = gr.Button("⏹ キャンセル", size="lg")
+            job_id = gr.State(None)
         
         with gr.Column():
             gr.Markdown("### 出力")
@@ -190,11 +252,16 @@ with gr.Blocks(title="DynamiCrafter WebUI") as app:
             status = gr.Textbox(label="ステータス", lines=10)
             download_btn = gr.File(label="📥 ダウンロード")
     
+    # 待機中は状況を表示するだけなので、複数ユーザーのハンドラを同時に動かす
+    # （実際の同時実行数はジョブキューで制限）
     btn.click(
         fn=run_interpolation,
-        inputs=[image1, image2, num_frames, fps, mode, pan_x, pan_y, zoom, rotate, save_path],
-        outputs=[download_btn, status]
+        inputs=[image1, image2, num_frames, fps, mode, pan_x, pan_y, zoom, rotate, save_path,
+                precision, preview],
+        outputs=[download_btn, status, job_id],
+        concurrency_limit=None
     )
+    cancel_btn.click(fn=cancel_interpolation, inputs=[job_id], outputs=[status], queue=False)
     
     gr.Markdown("""
     ---
@@ -205,8 +272,15 @@ with gr.Blocks(title="DynamiCrafter WebUI") as app:
     4. 「生成」ボタンをクリック
     5. **生成動画は自動でダウンロード可能** (動画プレビュー右下の📥ボタン)
     
+    ### 🔁 ジョブキュー
+    - 生成はジョブとしてキューに追加され、順番が来ると実行されます（待機中はキューの順番を表示）
+    - プレビューは通常の生成より先に実行されます
+    - 「キャンセル」で待機中・実行中のジョブを中止できます
+    - 同時実行数は環境変数 `DYNAMICRAFTER_WEBUI_MAX_JOBS` で変更できます（既定: 1）
+    - 実行中はサンプリングのステップごとに進捗と残り時間の目安を表示します
+    
     ### 💾 ローカル保存
-    - 生成動画は `output_videos/{mode}_YYYYMMDD_HHMMSS.mp4` として保存
+    - 生成動画は `output_videos/{mode}_YYYYMMDD_HHMMSS_<ジョブID>.mp4` として保存
     - Gradioの動画プレビューから直接ダウンロード可能
     - タイムスタンプ付きなので履歴管理も簡単
     
@@ -216,7 +290,7 @@ with gr.Blocks(title="DynamiCrafter WebUI") as app:
     - フレーム数が多いほど時間がかかります（8フレーム推奨）
     
     💡 **ヒント**:
-    - 処理中はブラウザを閉じないでください
+    - 処理中はブラウザを閉じないでください（ジョブの作業ファイルは `output_videos/jobs/` にあります）
     - タイムアウトは30分に設定されています
     - エラーが出た場合はフレーム数を減らしてください
     """)
@@ -225,6 +299,7 @@ if __name__ == "__main__":
     print("=" * 50)
     print("DynamiCrafter Simple WebUI")
     print("=" * 50)
+    start_metrics_server_from_env(METRICS_PORT)
     app.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -0,0 +1,27 @@
+"""テスト共通設定: パッケージ直下のモジュールを import できるようにする"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def interpolator(tmp_path):
+    """スタブのモデルを読み込む FrameInterpolator（models に読み込んだスタブのリスト）"""
+    from benchmark_pipeline import stub_dynamicrafter
+    from embedding_cache import PromptEmbeddingCache, TensorCache
+    from interpolate import FrameInterpolator
+
+    # setup_model はチェックポイントの2つ上のディレクトリに hf_cache を作る
+    (tmp_path / 'stub' / 'checkpoints').mkdir(parents=True)
+    with stub_dynamicrafter() as models:
+        interpolator = FrameInterpolator(
+            model_path=str(tmp_path / 'stub' / 'checkpoints' / 'model.ckpt'),
+            config_path=str(tmp_path / 'stub' / 'inference.yaml'),
+            device='cpu', embedding_cache=TensorCache(), prompt_cache=PromptEmbeddingCache())
+        interpolator.models = models
+        yield interpolator
+        interpolator.release_model()
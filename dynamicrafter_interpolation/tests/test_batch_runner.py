@@ -0,0 +1,137 @@
+"""batch_runner のジョブハッシュ・ledger による再開・失敗の記録のテスト（モデル不要）"""
+
+import json
+
+import pytest
+from PIL import Image
+
+from batch_runner import LEDGER_NAME, BatchRunner, Ledger, job_hash, load_manifest
+
+
+def write_image(path, color):
+    Image.new('RGB', (8, 8), color).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for name, color in [('a', 'red'), ('b', 'green'), ('c', 'blue')]:
+        write_image(tmp_path / f'{name}.png', color)
+    return tmp_path
+
+
+def write_manifest(workdir, rows):
+    path = workdir / 'jobs.jsonl'
+    path.write_text('\n'.join(json.dumps(row) for row in rows), encoding='utf-8')
+    return load_manifest(path)
+
+
+class FakeStats:
+    def stats(self):
+        return {}
+
+
+class FakeInterpolator:
+    """画像パスに 'bad' を含むジョブのサンプリングと、fail_save のジョブの保存を失敗させる"""
+
+    embedding_cache = FakeStats()
+
+    def __init__(self, fail_save=()):
+        self.fail_save = set(fail_save)
+        self.calls = []
+
+    def warmup_prompts(self, prompts):
+        pass
+
+    def interpolate(self, image1, image2, **kwargs):
+        self.calls.append(('single', image1))
+        if 'bad' in image1:
+            raise ValueError(f"読めません: {image1}")
+        return image1
+
+    def interpolate_batch(self, batch, max_batch_size=4):
+        self.calls.append(('batch', len(batch)))
+        for job in batch:
+            if 'bad' in job['image1_path']:
+                raise ValueError(f"読めません: {job['image1_path']}")
+        return [job['image1_path'] for job in batch]
+
+    def save_video(self, samples, path, fps=8, **kwargs):
+        if samples in self.fail_save:
+            self.fail_save.discard(samples)  # 1回だけ失敗させる
+            raise OSError('disk full')
+        with open(path, 'wb') as f:
+            f.write(b'video')
+
+
+def make_runner(output_dir, interpolator, batch_size=1):
+    runner = BatchRunner(output_dir, batch_size=batch_size)
+    runner.get_interpolator = lambda motion: interpolator
+    return runner
+
+
+def test_job_hash_tracks_image_content(workdir):
+    job, = write_manifest(workdir, [{'id': 'j', 'image1': 'a.png', 'image2': 'b.png'}])
+    before = job_hash(job)
+    assert job_hash(dict(job, output='elsewhere.mp4')) == before
+    assert job_hash(dict(job, seed=1)) != before
+
+    write_image(workdir / 'a.png', 'white')  # 同じパスで画像を差し替え
+    assert job_hash(job) != before
+
+
+def test_ledger_resume_skips_done_jobs(workdir):
+    jobs = write_manifest(workdir, [{'id': 'j1', 'image1': 'a.png', 'image2': 'b.png'},
+                                    {'id': 'j2', 'image1': 'b.png', 'image2': 'c.png'}])
+    out = workdir / 'out'
+    first = FakeInterpolator()
+    summary = make_runner(out, first).run(jobs)
+    assert summary['completed'] == 2 and len(first.calls) == 2
+
+    # 再実行では何もしない
+    second = FakeInterpolator()
+    summary = make_runner(out, second).run(jobs)
+    assert second.calls == [] and summary['this_run']['skipped'] == 2
+
+    # 出力を消したジョブ・パラメータを変えたジョブだけ再実行
+    (out / 'j1.mp4').unlink()
+    jobs[1]['seed'] = 7
+    third = FakeInterpolator()
+    summary = make_runner(out, third).run(jobs)
+    assert len(third.calls) == 2 and summary['this_run']['skipped'] == 0
+
+
+def test_ledger_ignores_torn_last_line(workdir):
+    path = workdir / LEDGER_NAME
+    path.write_text(json.dumps({'id': 'j1', 'status': 'done', 'hash': 'x'}) + '\n{"id": "j2", "sta',
+                    encoding='utf-8')
+    ledger = Ledger(path)
+    assert set(ledger.records) == {'j1'}
+
+
+def test_failed_batch_retries_remaining_jobs_individually(workdir):
+    write_image(workdir / 'bad.png', 'black')
+    jobs = write_manifest(workdir, [{'id': 'j1', 'image1': 'a.png', 'image2': 'b.png'},
+                                    {'id': 'j2', 'image1': 'bad.png', 'image2': 'c.png'},
+                                    {'id': 'j3', 'image1': 'c.png', 'image2': 'a.png'}])
+    interpolator = FakeInterpolator()
+    summary = make_runner(workdir / 'out', interpolator, batch_size=3).run(jobs)
+
+    statuses = {r['id']: r['status'] for r in summary['job_results']}
+    assert statuses == {'j1': 'done', 'j2': 'failed', 'j3': 'done'}
+    assert interpolator.calls[0] == ('batch', 3)
+    assert len([call for call in interpolator.calls if call[0] == 'single']) == 3
+
+
+def test_jobs_saved_before_a_batch_failure_stay_done(workdir):
+    jobs = write_manifest(workdir, [{'id': 'j1', 'image1': 'a.png', 'image2': 'b.png'},
+                                    {'id': 'j2', 'image1': 'b.png', 'image2': 'c.png'},
+                                    {'id': 'j3', 'image1': 'c.png', 'image2': 'a.png'}])
+    interpolator = FakeInterpolator(fail_save=[jobs[1]['image1']])
+    summary = make_runner(workdir / 'out', interpolator, batch_size=3).run(jobs)
+
+    statuses = {r['id']: r['status'] for r in summary['job_results']}
+    assert statuses == {'j1': 'done', 'j2': 'done', 'j3': 'done'}
+    # j1 は保存済みなので再実行しない
+    assert [call for call in interpolator.calls if call[0] == 'single'] == [
+        ('single', jobs[1]['image1']), ('single', jobs[2]['image1'])]
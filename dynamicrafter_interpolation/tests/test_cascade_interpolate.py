@@ -0,0 +1,63 @@
+"""cascade_interpolate のフレーム数・キーフレームの位置のテスト（モデル不要）"""
+
+import numpy as np
+import pytest
+import torch
+
+from cascade_interpolate import CascadeInterpolator, keyframe_tensors, tensor_to_rgb24, upsample_factor
+from rife_interpolate import RIFEInterpolator
+
+
+class MidpointModel(torch.nn.Module):
+    def forward(self, img0, img1):
+        return (img0 + img1) / 2
+
+
+def make_cascade(model):
+    rife = RIFEInterpolator(device='cpu')
+    rife.model = model
+    rife.model_loaded = True
+    return CascadeInterpolator(interpolator=object(), rife=rife)
+
+
+def make_samples(keyframes, size=4):
+    # キーフレームごとに一定値の画像 (-1 → 1 の等間隔)
+    values = torch.linspace(-1, 1, keyframes)
+    video = values.view(1, 1, 1, keyframes, 1, 1).expand(1, 1, 3, keyframes, size, size)
+    return video.contiguous()
+
+
+@pytest.mark.parametrize('source_fps,target_fps,factor', [
+    (5, 30, 6), (8, 24, 3), (7, 30, 4), (30, 24, 1), (24, 24, 1),
+])
+def test_upsample_factor(source_fps, target_fps, factor):
+    assert upsample_factor(source_fps, target_fps) == factor
+
+
+def test_keyframe_tensors_maps_to_unit_range():
+    frames = list(keyframe_tensors(make_samples(3)))
+    assert len(frames) == 3
+    assert frames[0].shape == (1, 3, 4, 4)
+    assert [frame.mean().item() for frame in frames] == pytest.approx([0.0, 0.5, 1.0])
+
+
+def test_tensor_to_rgb24():
+    frame = torch.tensor([0.0, 0.5, 1.0]).view(1, 3, 1, 1).expand(1, 3, 2, 5)
+    rgb = tensor_to_rgb24(frame)
+    assert rgb.shape == (2, 5, 3) and rgb.dtype == np.uint8
+    assert rgb[0, 0].tolist() == [0, 128, 255]
+
+
+@pytest.mark.parametrize('model', [MidpointModel(), None], ids=['rife', 'blend'])
+@pytest.mark.parametrize('keyframes,factor', [(2, 1), (3, 4), (5, 2), (4, 3)])
+def test_iter_upsampled_keeps_keyframes_once(model, keyframes, factor):
+    cascade = make_cascade(model)
+    samples = make_samples(keyframes)
+    frames = list(cascade.iter_upsampled(samples, factor))
+
+    assert len(frames) == (keyframes - 1) * factor + 1
+    for i, keyframe in enumerate(keyframe_tensors(samples)):
+        assert torch.allclose(frames[i * factor], keyframe)
+    # 中点モデル・線形ブレンドとも線形なので、全体が等間隔になる
+    means = [frame.mean().item() for frame in frames]
+    assert means == pytest.approx(np.linspace(0, 1, len(frames)).tolist(), abs=1e-6)
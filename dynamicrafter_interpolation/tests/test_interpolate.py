@@ -0,0 +1,64 @@
+"""FrameInterpolator の再現性と進捗の段階のテスト（スタブのモデルで実行）"""
+
+import pytest
+import torch
+
+from advanced_interpolate import AdvancedFrameInterpolator
+from benchmark_pipeline import make_test_images, stub_dynamicrafter
+from embedding_cache import PromptEmbeddingCache, TensorCache
+
+STAGES = ['load', 'preprocess', 'encode', 'condition', 'sampling', 'decode']
+
+
+def record_stages(tracker):
+    stages = []
+    tracker.add_listener(lambda event: event['event'] == 'stage' and stages.append(event['stage']))
+    return stages
+
+
+def test_seeded_output_does_not_depend_on_latent_cache(interpolator):
+    img1, img2 = make_test_images()
+    cold = interpolator.interpolate(img1, img2, num_frames=16, ddim_steps=2, seed=7)
+    assert interpolator.embedding_cache.stats()['hits'] == 0
+    warm = interpolator.interpolate(img1, img2, num_frames=16, ddim_steps=2, seed=7)
+    assert interpolator.embedding_cache.stats()['hits'] > 0
+    assert torch.equal(cold, warm)
+    other = interpolator.interpolate(img1, img2, num_frames=16, ddim_steps=2, seed=8)
+    assert not torch.equal(cold, other)
+
+
+@pytest.mark.parametrize('method', ['interpolate', 'interpolate_long'])
+def test_stage_order(interpolator, method):
+    stages = record_stages(interpolator.progress)
+    img1, img2 = make_test_images()
+    video = getattr(interpolator, method)(img1, img2, num_frames=16, ddim_steps=2)
+    assert stages == STAGES
+    assert video.shape[:4] == (1, 1, 3, 16)
+    assert interpolator.models[-1].calls['decode_first_stage'] == 1
+
+
+def test_stage_order_sequence(interpolator):
+    stages = record_stages(interpolator.progress)
+    images = list(make_test_images()) * 2
+    video = interpolator.interpolate_sequence(images, num_frames=8, ddim_steps=2, max_batch_size=2)
+    # サンプリングを全区間で終えてからデコード
+    assert stages == STAGES
+    assert video.shape[:4] == (1, 1, 3, 3 * 7 + 1)
+    assert interpolator.models[-1].calls['decode_first_stage'] == 2
+
+
+def test_stage_order_advanced(tmp_path):
+    (tmp_path / 'stub' / 'checkpoints').mkdir(parents=True)
+    with stub_dynamicrafter():
+        interpolator = AdvancedFrameInterpolator(
+            model_path=str(tmp_path / 'stub' / 'checkpoints' / 'model.ckpt'),
+            config_path=str(tmp_path / 'stub' / 'inference.yaml'), device='cpu',
+            embedding_cache=TensorCache(), prompt_cache=PromptEmbeddingCache())
+        stages = record_stages(interpolator.progress)
+        img1, img2 = make_test_images()
+        try:
+            interpolator.interpolate(img1, img2, num_frames=16, ddim_steps=2,
+                                     motion_control={'camera': {'pan_x': 1.0}})
+        finally:
+            interpolator.release_model()
+    assert stages == ['load', 'motion', 'preprocess', 'encode', 'condition', 'sampling', 'decode']
@@ -0,0 +1,42 @@
+"""interpolate_long のウィンドウ分割と出力フレーム数のテスト（スタブのモデルで実行）"""
+
+import pytest
+
+from benchmark_pipeline import make_test_images
+from interpolate import FrameInterpolator
+
+
+@pytest.mark.parametrize('num_frames', [17, 20, 31, 32, 33, 48, 64, 100])
+@pytest.mark.parametrize('window, overlap', [(16, 4), (16, 1), (16, 14), (16, 30), (8, 2)])
+def test_window_starts_cover_all_frames(num_frames, window, overlap):
+    starts = FrameInterpolator.window_starts(num_frames, window, overlap)
+    effective = min(max(1, overlap), window - 2)
+
+    assert starts[0] == 0
+    assert starts[-1] == num_frames - window  # 最後のウィンドウは終了画像で終わる
+    covered = set()
+    for previous, start in zip(starts, starts[1:]):
+        # 前のウィンドウと overlap 以上重なり、新しいフレームを必ず生成する
+        assert previous < start <= previous + window - effective
+    # 最後以外のウィンドウは stride ずつ進む
+    for previous, start in zip(starts[:-1], starts[1:-1]):
+        assert start - previous == window - effective
+    for start in starts:
+        covered.update(range(start, start + window))
+    assert covered == set(range(num_frames))
+
+
+def test_window_starts_examples():
+    assert FrameInterpolator.window_starts(40, 16, 4) == [0, 12, 24]
+    assert FrameInterpolator.window_starts(32, 16, 4) == [0, 12, 16]
+
+
+@pytest.mark.parametrize('num_frames, overlap', [(16, 4), (24, 4), (32, 4), (40, 4), (33, 14)])
+def test_interpolate_long_returns_requested_frames(interpolator, num_frames, overlap):
+    img1, img2 = make_test_images()
+    video = interpolator.interpolate_long(img1, img2, num_frames=num_frames, ddim_steps=2,
+                                          overlap=overlap)
+    assert video.shape[:4] == (1, 1, 3, num_frames)
+    # アンカー + ウィンドウごとに1回ずつサンプリング
+    passes = interpolator.long_sampling_passes(num_frames, overlap=overlap)
+    assert interpolator.models[-1].calls['apply_model'] == passes * 2 * 2  # 2ステップ × CFG
@@ -0,0 +1,111 @@
+"""job_queue の優先度・キャンセル・同時実行のテスト"""
+
+import threading
+
+import pytest
+
+from job_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs', max_workers=1, name='test')
+    yield queue
+    queue.shutdown()
+
+
+def blocker(started, release):
+    """release されるまでワーカーを占有するジョブ"""
+    def run(job):
+        started.set()
+        while not release.wait(0.01):
+            job.check_cancelled()
+        return 'blocker'
+    return run
+
+
+def test_preview_runs_before_final(queue):
+    started, release = threading.Event(), threading.Event()
+    queue.submit(blocker(started, release))
+    assert started.wait(TIMEOUT)
+
+    order = []
+    jobs = [queue.submit(lambda job, name=name: order.append(name), priority=priority)
+            for name, priority in [('final1', 'final'), ('preview', 'preview'),
+                                   ('final2', 'final')]]
+    assert [queue.position(job.id) for job in jobs] == [2, 1, 3]
+    assert queue.counts() == {QUEUED: 3, RUNNING: 1}
+
+    release.set()
+    assert all(job.wait(TIMEOUT) for job in jobs)
+    assert order == ['preview', 'final1', 'final2']
+    assert all(job.status == DONE for job in jobs)
+
+
+def test_cancel_queued_job_never_runs(queue):
+    started, release = threading.Event(), threading.Event()
+    queue.submit(blocker(started, release))
+    assert started.wait(TIMEOUT)
+
+    ran = []
+    job = queue.submit(lambda job: ran.append(job.id))
+    assert queue.cancel(job.id)
+    assert job.status == CANCELLED and job.wait(0)
+    assert queue.position(job.id) == 0
+
+    release.set()
+    follow = queue.submit(lambda job: 'ok')
+    assert follow.wait(TIMEOUT) and follow.result == 'ok'
+    assert ran == []
+    assert not queue.cancel(job.id)  # 終了済み
+
+
+def test_cancel_running_job(queue):
+    started, release = threading.Event(), threading.Event()
+    job = queue.submit(blocker(started, release))
+    assert started.wait(TIMEOUT)
+    assert job.status == RUNNING
+    assert queue.cancel(job.id)
+    assert job.wait(TIMEOUT)
+    assert job.status == CANCELLED
+
+
+def test_failed_job_records_error(queue):
+    def fail(job):
+        raise ValueError('boom')
+
+    job = queue.submit(fail)
+    assert job.wait(TIMEOUT)
+    assert job.status == FAILED
+    assert job.error == 'ValueError: boom'
+
+
+def test_unknown_priority_raises(queue):
+    with pytest.raises(ValueError):
+        queue.submit(lambda job: None, priority='urgent')
+
+
+def test_jobs_run_concurrently_up_to_max_workers(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs', max_workers=2, name='test_concurrent')
+    try:
+        barrier = threading.Barrier(2, timeout=TIMEOUT)
+        # 2件が同時に実行されていなければ Barrier がタイムアウトする
+        jobs = [queue.submit(lambda job: barrier.wait()) for _ in range(2)]
+        assert all(job.wait(TIMEOUT) for job in jobs)
+        assert all(job.status == DONE for job in jobs)
+    finally:
+        queue.shutdown()
+
+
+def test_finished_jobs_are_pruned(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs', max_finished=2, name='test_prune')
+    try:
+        jobs = [queue.submit(lambda job: None) for _ in range(4)]
+        assert all(job.wait(TIMEOUT) for job in jobs)
+        assert queue.get(jobs[0].id) is None
+        assert not jobs[0].workspace.exists()
+        assert queue.get(jobs[-1].id) is jobs[-1]
+    finally:
+        queue.shutdown()
@@ -0,0 +1,90 @@
+"""metrics のレジストリとPrometheus形式の出力のテスト"""
+
+import ast
+from pathlib import Path
+
+import pytest
+
+from metrics import MetricsRegistry, get_registry, watch_cache
+
+
+def test_render_counter_gauge_histogram():
+    registry = MetricsRegistry()
+    runs = registry.counter('app_runs_total', '実行回数', ('engine',))
+    queue = registry.gauge('app_queue_jobs', 'ジョブ数', ('state',))
+    seconds = registry.histogram('app_seconds', '時間', ('engine',), buckets=(1, 5))
+
+    runs.inc(engine='rife')
+    runs.inc(2, engine='rife')
+    queue.set(3, state='queued')
+    seconds.observe(0.5, engine='rife')
+    seconds.observe(3, engine='rife')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE app_runs_total counter' in lines
+    assert 'app_runs_total{engine="rife"} 3' in lines
+    assert '# TYPE app_queue_jobs gauge' in lines
+    assert 'app_queue_jobs{state="queued"} 3' in lines
+    assert '# TYPE app_seconds histogram' in lines
+    assert 'app_seconds_bucket{engine="rife",le="1"} 1' in lines
+    assert 'app_seconds_bucket{engine="rife",le="5"} 2' in lines
+    assert 'app_seconds_bucket{engine="rife",le="+Inf"} 2' in lines
+    assert 'app_seconds_sum{engine="rife"} 3.5' in lines
+    assert 'app_seconds_count{engine="rife"} 2' in lines
+    # 名前順に並ぶ
+    names = [line.split()[2] for line in lines if line.startswith('# TYPE')]
+    assert names == sorted(names)
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter('app_total', 'x', ('path',)).inc(path='a"b\\c\nd')
+    assert 'app_total{path="a\\"b\\\\c\\nd"} 1' in registry.render().splitlines()
+
+
+def test_wrong_labels_and_conflicting_registration_raise():
+    registry = MetricsRegistry()
+    counter = registry.counter('app_total', 'x', ('engine',))
+    with pytest.raises(ValueError):
+        counter.inc(stage='load')
+    with pytest.raises(ValueError):
+        registry.gauge('app_total', 'x', ('engine',))
+    assert registry.counter('app_total', 'x', ('engine',)) is counter
+
+
+def test_counter_function_replaced_by_owner():
+    registry = MetricsRegistry()
+    counter = registry.counter('app_lookups_total', 'x', ('cache', 'result'))
+    counter.set_function(lambda: {('a', 'hit'): 1}, owner='a')
+    counter.set_function(lambda: {('a', 'hit'): 5}, owner='a')
+    counter.set_function(lambda: {('b', 'miss'): 2}, owner='b')
+    lines = registry.render().splitlines()
+    assert 'app_lookups_total{cache="a",result="hit"} 5' in lines
+    assert 'app_lookups_total{cache="b",result="miss"} 2' in lines
+
+
+class FakeCache:
+    def stats(self):
+        return {'hits': 3, 'misses': 1, 'disk_hits': 2, 'hit_rate': 0.75, 'bytes': 10}
+
+
+def test_watch_cache_exposes_lookups_as_counter():
+    watch_cache('test_cache', FakeCache())
+    lines = get_registry().render().splitlines()
+    assert '# TYPE dynamicrafter_cache_lookups_total counter' in lines
+    assert 'dynamicrafter_cache_lookups_total{cache="test_cache",result="hit"} 3' in lines
+    assert 'dynamicrafter_cache_lookups_total{cache="test_cache",result="disk_hit"} 2' in lines
+    assert 'dynamicrafter_cache_hit_ratio{cache="test_cache"} 0.75' in lines
+    assert 'dynamicrafter_cache_bytes{cache="test_cache"} 10' in lines
+
+
+def test_webui_metrics_ports_are_distinct():
+    # WebUI を同時に起動してもメトリクスのポートが衝突しないこと（gradio を読み込まないよう構文木から取得）
+    root = Path(__file__).resolve().parent.parent
+    ports = {}
+    for name in ('webui.py', 'simple_webui.py', 'rife_webui.py'):
+        tree = ast.parse((root / name).read_text(encoding='utf-8'))
+        ports[name] = next(node.value.value for node in tree.body
+                           if isinstance(node, ast.Assign)
+                           and any(getattr(t, 'id', None) == 'METRICS_PORT' for t in node.targets))
+    assert len(set(ports.values())) == len(ports), ports
@@ -0,0 +1,77 @@
+"""model_registry の safetensors 高速読み込みのテスト（DynamiCrafter不要）"""
+
+import pytest
+import torch
+
+from model_registry import _load_safetensors_model
+
+safetensors = pytest.importorskip('safetensors.torch')
+
+
+class TinyDiffusion(torch.nn.Module):
+    """LatentDiffusion と同じく、ルート直下に拡散スケジュールのバッファを持つモデル"""
+
+    def __init__(self, with_mask=False):
+        super().__init__()
+        self.model = torch.nn.Sequential(torch.nn.Linear(4, 4), torch.nn.LayerNorm(4))
+        self.register_buffer('betas', torch.linspace(0.1, 0.2, 4))
+        if with_mask:
+            # チェックポイントに保存されない（構築時に計算される）バッファ
+            self.register_buffer('mask', torch.ones(4), persistent=False)
+
+
+def save_checkpoint(path, dtype):
+    state_dict = TinyDiffusion().state_dict()
+    state_dict = {k: v.to(dtype) if '.' in k else v for k, v in state_dict.items()}
+    safetensors.save_file(state_dict, str(path))
+    return state_dict
+
+
+@pytest.mark.parametrize('stored, precision, expected', [
+    (torch.float16, 'fp32', torch.float32),
+    (torch.float16, 'bf16', torch.bfloat16),
+    (torch.bfloat16, 'bf16', torch.bfloat16),
+])
+def test_weights_match_requested_precision(tmp_path, stored, precision, expected):
+    path = tmp_path / 'model.safetensors'
+    saved = save_checkpoint(path, stored)
+    timings = {}
+    model = _load_safetensors_model({}, lambda config: TinyDiffusion(), str(path),
+                                    precision, timings)
+
+    assert model.model[0].weight.dtype == expected
+    assert model.betas.dtype == torch.float32  # 拡散スケジュールは fp32 のまま
+    assert not any(t.is_meta for t in model.state_dict().values())
+    torch.testing.assert_close(model.model[0].weight.float(),
+                               saved['model.0.weight'].float(), atol=1e-2, rtol=1e-2)
+    assert {'read_weights', 'instantiate', 'load_state_dict'} <= set(timings)
+
+
+def test_builds_on_meta_without_allocating(tmp_path):
+    path = tmp_path / 'model.safetensors'
+    save_checkpoint(path, torch.bfloat16)
+    devices = []
+
+    def instantiate(config):
+        model = TinyDiffusion()
+        devices.append(model.model[0].weight.device.type)
+        return model
+
+    _load_safetensors_model({}, instantiate, str(path), 'bf16', {})
+    assert devices == ['meta']
+
+
+def test_falls_back_when_meta_leaves_buffers(tmp_path):
+    path = tmp_path / 'model.safetensors'
+    save_checkpoint(path, torch.float32)
+    model = _load_safetensors_model({}, lambda config: TinyDiffusion(with_mask=True),
+                                    str(path), 'fp32', {})
+    assert not model.mask.is_meta
+    assert torch.equal(model.mask, torch.ones(4))
+
+
+def test_missing_weights_raise(tmp_path):
+    path = tmp_path / 'model.safetensors'
+    safetensors.save_file({'betas': torch.zeros(4)}, str(path))
+    with pytest.raises(RuntimeError):
+        _load_safetensors_model({}, lambda config: TinyDiffusion(), str(path), 'fp32', {})
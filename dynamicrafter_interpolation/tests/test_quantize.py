@@ -0,0 +1,65 @@
+"""quantize の int8 動的量子化のテスト（モデル不要）"""
+
+import pytest
+import torch
+from torch import nn
+
+from quantize import check_quantize, model_dtype, quantize_model
+
+
+class TextEncoder(nn.Module):
+    """OpenCLIPのテキストエンコーダと同じく nn.MultiheadAttention を含む"""
+
+    def __init__(self, dim=16):
+        super().__init__()
+        self.attn = nn.MultiheadAttention(dim, 2, batch_first=True)
+        self.mlp = nn.Linear(dim, dim)
+
+    def forward(self, x):
+        x = x + self.attn(x, x, x, need_weights=False)[0]
+        return self.mlp(x)
+
+
+class FakeLatentDiffusion(nn.Module):
+    def __init__(self, dim=16):
+        super().__init__()
+        self.model = nn.Module()
+        self.model.diffusion_model = nn.Sequential(nn.Linear(dim, dim), nn.GELU())
+        self.cond_stage_model = TextEncoder(dim)
+        self.embedder = TextEncoder(dim)
+        self.first_stage_model = nn.Linear(dim, dim)  # VAE（量子化しない）
+
+
+def test_quantize_model_keeps_attention_working():
+    torch.manual_seed(0)
+    model = FakeLatentDiffusion().eval()
+    x = torch.randn(2, 5, 16)
+    with torch.no_grad():
+        expected = model.cond_stage_model(x)
+
+    quantize_model(model)
+
+    assert model.quantized == 'int8'
+    assert type(model.cond_stage_model.mlp) is torch.ao.nn.quantized.dynamic.Linear
+    assert type(model.model.diffusion_model[0]) is torch.ao.nn.quantized.dynamic.Linear
+    # MHAの out_proj と対象外の部分モジュールはそのまま
+    assert isinstance(model.cond_stage_model.attn.out_proj.weight, torch.Tensor)
+    assert type(model.first_stage_model) is nn.Linear
+    with torch.no_grad():
+        out = model.cond_stage_model(x)
+        model.embedder(x)
+        model.model.diffusion_model(x)
+    assert out.shape == expected.shape
+    assert torch.allclose(out, expected, atol=0.1)
+
+
+def test_check_quantize():
+    assert check_quantize('int8') == 'int8'
+    assert model_dtype('fp32', 'int8') == 'int8'
+    assert model_dtype('bf16', 'none') == 'bf16'
+    with pytest.raises(ValueError):
+        check_quantize('int4')
+    with pytest.raises(ValueError):
+        check_quantize('int8', precision='bf16')
+    with pytest.raises(ValueError):
+        check_quantize('int8', device='cuda')
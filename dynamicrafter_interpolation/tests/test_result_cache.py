@@ -0,0 +1,138 @@
+"""result_cache のキー・正規化・LRU削除のテスト（モデル不要）"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from result_cache import NON_RESULT_ARGS, ResultCache, canonical_params, cli_params, result_key
+
+
+def write_image(path, color):
+    Image.new('RGB', (8, 8), color).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def images(tmp_path):
+    return [write_image(tmp_path / 'a.png', 'red'), write_image(tmp_path / 'b.png', 'blue')]
+
+
+def write_video(path, size):
+    Path(path).write_bytes(b'\0' * size)
+    return str(path)
+
+
+def test_canonical_params_normalizes_equivalent_values():
+    params = {'steps': 16.0, 'size': (320, 512), 'cfg': np.float32(7.5), 'seed': np.int64(3),
+              'path': Path('x/y'), 'eta': 0.25, 'flag': True, 'none': None}
+    assert canonical_params(params) == {
+        'cfg': 7.5, 'eta': 0.25, 'flag': True, 'none': None, 'path': str(Path('x/y')),
+        'seed': 3, 'size': [320, 512], 'steps': 16,
+    }
+    assert canonical_params({'b': 1, 'a': 2}) == canonical_params({'a': 2, 'b': 1})
+
+
+def test_result_key_is_stable_across_representations(images):
+    key = result_key(images, {'steps': 16, 'size': [320, 512]}, 'model')
+    assert len(key) == 40
+    arrays = [np.asarray(Image.open(path).convert('RGB')) for path in images]
+    assert result_key(arrays, {'size': (320, 512), 'steps': 16.0}, 'model') == key
+
+
+def test_result_key_changes_with_inputs(images, tmp_path):
+    key = result_key(images, {'steps': 16}, 'model')
+    assert result_key(images[::-1], {'steps': 16}, 'model') != key
+    assert result_key(images, {'steps': 17}, 'model') != key
+    assert result_key(images, {'steps': 16}, 'other') != key
+    # 同じパスでも画素が変われば別のキー
+    write_image(images[0], 'green')
+    assert result_key(images, {'steps': 16}, 'model') != key
+
+
+def test_cli_params_drops_non_result_args():
+    args = argparse.Namespace(image1='a.png', image2='b.png', output='o.mp4', steps=16,
+                              result_cache_dir='cache', stream=True, manifest='m.jsonl')
+    params = cli_params(args, 'interpolate')
+    assert params == {'steps': 16, 'tool': 'interpolate'}
+    assert not set(params) & set(NON_RESULT_ARGS)
+    # 出力先が違っても同じ結果なら同じキー
+    other = argparse.Namespace(**{**vars(args), 'output': 'other.mp4'})
+    assert cli_params(other, 'interpolate') == params
+    assert cli_params(args, 'rife_interpolate') != params
+
+
+def test_store_lookup_fetch(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    video = write_video(tmp_path / 'out.mp4', 100)
+
+    assert cache.lookup('k1') is None
+    assert not cache.fetch('k1', tmp_path / 'dest.mp4')
+    cache.store('k1', video, seconds=2.5, params={'steps': 16})
+
+    path = cache.lookup('k1')
+    assert path is not None and path.read_bytes() == Path(video).read_bytes()
+    assert cache.fetch('k1', tmp_path / 'dest.mp4')
+    assert (tmp_path / 'dest.mp4').read_bytes() == Path(video).read_bytes()
+
+    stats = cache.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 2
+    assert stats['hit_rate'] == 0.5
+    assert stats['saved_seconds'] == 5.0
+    assert stats['entries'] == 1 and stats['bytes'] == 100
+
+
+def test_lookup_misses_when_video_is_gone(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    cache.store('k1', write_video(tmp_path / 'out.mp4', 10))
+    (tmp_path / 'cache' / 'k1.mp4').unlink()
+    assert cache.lookup('k1') is None
+    assert cache.entries() == []
+
+
+def test_fetch_replaces_existing_output_without_touching_cache(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    cache.store('k1', write_video(tmp_path / 'out.mp4', 10))
+    dest = tmp_path / 'dest.mp4'
+    dest.write_bytes(b'old')
+    assert cache.fetch('k1', dest)
+    assert dest.read_bytes() == b'\0' * 10
+    # 取り出した動画を上書きしても、キャッシュ内の動画は変わらない
+    write_video(tmp_path / 'new.mp4', 3)
+    cache.store('k2', tmp_path / 'new.mp4')
+    cache.fetch('k2', dest)
+    assert (tmp_path / 'cache' / 'k1.mp4').read_bytes() == b'\0' * 10
+
+
+def set_last_used(cache, key, when):
+    os.utime(cache.cache_dir / f'{key}.json', (when, when))
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path / 'cache', max_bytes=250)
+    for i, key in enumerate(['k1', 'k2']):
+        cache.store(key, write_video(tmp_path / f'{key}.mp4', 100))
+        set_last_used(cache, key, 1000 + i)
+    # k1 を使うと、k2 の方が古くなる
+    cache.lookup('k1')
+    cache.store('k3', write_video(tmp_path / 'k3.mp4', 100))
+
+    assert [key for _, key, _ in cache.entries()] == ['k1', 'k3']
+    assert not (tmp_path / 'cache' / 'k2.mp4').exists()
+    # キャッシュから削除しても、ハードリンクした出力先は残る
+    assert (tmp_path / 'k2.mp4').exists()
+
+
+def test_evict_with_explicit_limit_and_clear(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    for i, key in enumerate(['k1', 'k2', 'k3']):
+        cache.store(key, write_video(tmp_path / f'{key}.mp4', 100))
+        set_last_used(cache, key, 1000 + i)
+
+    assert cache.evict(max_bytes=150) == 2
+    assert [key for _, key, _ in cache.entries()] == ['k3']
+    assert cache.clear() == 1
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,115 @@
+"""rife_interpolate の分割スケジュールとフレーム列のテスト（モデル不要）"""
+
+from fractions import Fraction
+
+import pytest
+import torch
+
+from rife_interpolate import RIFEInterpolator, bisection_plan, split_ratio
+
+
+class MidpointModel(torch.nn.Module):
+    """中点だけを返す線形ブレンドのモデル（推論したペア数を数える）"""
+
+    def __init__(self):
+        super().__init__()
+        self.pairs = 0
+
+    def forward(self, img0, img1):
+        self.pairs += img0.shape[0]
+        return (img0 + img1) / 2
+
+
+def make_rife(model, max_batch_size=4):
+    rife = RIFEInterpolator(device='cpu', max_batch_size=max_batch_size)
+    rife.model = model
+    rife.model_loaded = True
+    return rife
+
+
+PATCH = torch.rand(3, 24, 24, generator=torch.Generator().manual_seed(0))
+
+
+def scene(x):
+    """背景の上の位置 x (整数) にテクスチャのパッチがある画像"""
+    img = torch.full((1, 3, 64, 160), 0.2)
+    img[:, :, 20:44, x:x + 24] = PATCH
+    return img
+
+
+def patch_x(frame):
+    """テンプレートマッチングで求めたパッチの位置"""
+    errors = [(frame[0, :, 20:44, x:x + 24] - PATCH).abs().mean() for x in range(160 - 24)]
+    return int(torch.stack(errors).argmin())
+
+
+class PatchModel(torch.nn.Module):
+    """両端のパッチの位置の中点に描く非線形のモデル（画素の平均ではない）"""
+
+    def __init__(self):
+        super().__init__()
+        self.pairs = 0
+
+    def forward(self, img0, img1):
+        self.pairs += img0.shape[0]
+        return torch.cat([scene((patch_x(a[None]) + patch_x(b[None])) // 2)
+                          for a, b in zip(img0, img1)])
+
+
+@pytest.mark.parametrize('num_frames', range(2, 70))
+def test_bisection_plan_infers_pure_midpoints(num_frames):
+    levels, brackets = bisection_plan(num_frames)
+    known = {Fraction(0), Fraction(1)}
+    for level in levels:
+        for left, mid, right in level:
+            # 両端は前の階層までに計算済みで、mid はちょうど中点
+            assert left in known and right in known
+            assert mid == (left + right) / 2
+        known.update(mid for _, mid, _ in level)
+    assert sum(len(level) for level in levels) <= max(num_frames - 2, 0)
+
+    last = num_frames - 1
+    assert len(brackets) == max(num_frames - 2, 0)
+    for i, (left, right) in enumerate(brackets, start=1):
+        t = Fraction(i, last)
+        assert left in known and right in known
+        if left == right:
+            assert left == t
+        else:
+            # ワープはノードの間だけ（出力の間隔の2倍未満）
+            assert left < t < right
+            assert right - left < Fraction(2, last)
+
+
+@pytest.mark.parametrize('num_frames', [3, 5, 9, 17, 33])
+def test_bisection_plan_is_exact_for_power_of_two(num_frames):
+    _, brackets = bisection_plan(num_frames)
+    assert all(left == right for left, right in brackets)
+
+
+@pytest.mark.parametrize('num_frames', [4, 7, 8, 10, 16, 24, 30])
+def test_bisection_timing_with_nonlinear_model(num_frames):
+    x0, x1 = 30, 62
+    frames = make_rife(PatchModel())._infer_bisection(scene(x0), scene(x1), num_frames)
+    for i, frame in enumerate(frames, start=1):
+        # クロスフェードなら2重になり、濃い方の位置にずれる
+        assert patch_x(frame) == pytest.approx(x0 + (x1 - x0) * i / (num_frames - 1), abs=1.0)
+
+
+@pytest.mark.parametrize('num_frames', [2, 3, 4, 7, 16, 17])
+def test_bisection_inference_matches_streaming(num_frames):
+    I0 = torch.zeros(1, 3, 4, 4)
+    I1 = torch.ones(1, 3, 4, 4)
+
+    batch_model = MidpointModel()
+    batched = make_rife(batch_model)._infer_bisection(I0, I1, num_frames)
+    stream_model = MidpointModel()
+    streamed = list(make_rife(stream_model).iter_frames_tensor(I0, I1, num_frames))
+
+    nodes = sum(len(level) for level in bisection_plan(num_frames)[0])
+    assert batch_model.pairs == stream_model.pairs == nodes
+    assert len(streamed) == num_frames
+    for i, frame in enumerate([I0] + batched + [I1]):
+        expected = torch.full_like(I0, i / (num_frames - 1))
+        torch.testing.assert_close(frame, expected)
+        torch.testing.assert_close(streamed[i], expected)
@@ -0,0 +1,52 @@
+"""sampling の無条件ガイダンス構築とVAEエンコードのテスト（モデル不要）"""
+
+import torch
+
+from sampling import encode_first_stage_mode, unconditional_conditioning
+
+
+class TextOnlyModel:
+    """空プロンプトのエンコード回数を数えるモデル"""
+
+    uncond_type = 'empty_seq'
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_learned_conditioning(self, prompts):
+        self.encoded.append(list(prompts))
+        return torch.zeros(len(prompts), 77, 8)
+
+
+def test_uses_supplied_empty_prompt_embedding():
+    model = TextOnlyModel()
+    uc_text_emb = torch.ones(1, 77, 8)
+    uc = unconditional_conditioning(model, {'c_crossattn': [torch.zeros(3, 77, 8)]}, 3,
+                                    uc_text_emb=uc_text_emb)
+    assert model.encoded == []
+    assert uc['c_crossattn'][0].shape == (3, 77, 8)
+    assert torch.equal(uc['c_crossattn'][0], torch.ones(3, 77, 8))
+
+
+def test_encodes_empty_prompt_once_without_cache():
+    model = TextOnlyModel()
+    uc = unconditional_conditioning(model, torch.zeros(4, 77, 8), 4)
+    assert model.encoded == [['']]
+    assert uc.shape == (4, 77, 8)
+
+
+class TensorEncoder:
+    """事後分布ではなくテンソルを返すエンコーダ"""
+
+    scale_factor = 0.5
+
+    def __init__(self):
+        self.first_stage_model = self
+
+    def encode(self, x):
+        return x * 2
+
+
+def test_encode_first_stage_mode_accepts_plain_tensor():
+    x = torch.randn(2, 4, 3, 3)
+    assert torch.allclose(encode_first_stage_mode(TensorEncoder(), x), x)
@@ -0,0 +1,14 @@
+"""video_writer の書き出しオプションのテスト"""
+
+import argparse
+
+from video_writer import add_writer_arguments, writer_options_from_args
+
+
+def test_default_crf_keeps_original_quality():
+    parser = argparse.ArgumentParser()
+    add_writer_arguments(parser)
+    options = writer_options_from_args(parser.parse_args([]))
+    # 以前の DynamiCrafter の保存処理は crf=10
+    assert options['crf'] == 10
+    assert writer_options_from_args(parser.parse_args(['--crf', '18']))['crf'] == 18
@@ -0,0 +1,292 @@
+"""
+動画書き出しバックエンド
+
+ffmpegプロセスを起動し、rgb24の生フレームをstdin経由で1枚ずつ流し込む。
+フレーム列全体をメモリに展開せずに、生成と並行してエンコードできる。
+ffmpegが見つからない場合は cv2.VideoWriter (mp4v) にフォールバックする。
+"""
+import itertools
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# デフォルトのエンコード設定
+DEFAULT_CODEC = 'libx264'
+DEFAULT_PRESET = 'veryfast'
+DEFAULT_CRF = 10  # 元の保存処理 (torchvision.io.write_video, crf=10) と同じ画質
+DEFAULT_THREADS = 0  # 0 = ffmpegに自動選択させる
+
+WRITER_BACKENDS = ['auto', 'ffmpeg', 'opencv']
+
+
+def find_ffmpeg():
+    """
+    ffmpegの実行ファイルを探す
+
+    Returns:
+        実行ファイルのパス（見つからない場合はNone）
+    """
+    exe = shutil.which('ffmpeg')
+    if exe:
+        return exe
+
+    # imageio-ffmpeg（requirements.txt）が同梱するバイナリ
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def to_rgb24(frame):
+    """
+    フレームを (H, W, 3) uint8 の連続配列に変換
+
+    Args:
+        frame: PIL Image または numpy配列 (H, W, 3)
+    """
+    if isinstance(frame, Image.Image):
+        frame = frame.convert('RGB')
+    arr = np.asarray(frame)
+    if arr.dtype != np.uint8:
+        arr = arr.clip(0, 255).astype(np.uint8)
+    return np.ascontiguousarray(arr)
+
+
+def samples_to_frames(samples):
+    """
+    DynamiCrafterの出力テンソルを1フレームずつuint8配列に変換してyield
+
+    動画全体のuint8コピーを作らず、フレーム単位で変換する。
+
+    Args:
+        samples: 生成された動画テンソル (b, samples, c, t, h, w) [-1, 1]
+
+    Yields:
+        (h, w, 3) uint8 numpy配列
+    """
+    video = samples[0, 0].detach()  # 最初のバッチ、最初のサンプル
+    for i in range(video.shape[1]):
+        frame = video[:, i].float().clamp(-1., 1.)
+        # [-1, 1] -> [0, 255], [c, h, w] -> [h, w, c]
+        frame = ((frame + 1.0) * 127.5).round().byte().permute(1, 2, 0)
+        yield frame.cpu().numpy()
+
+
+class FFmpegVideoWriter:
+    """ffmpegのstdinへrgb24フレームを流し込む動画ライター"""
+
+    def __init__(self, output_path, width, height, fps=16, codec=DEFAULT_CODEC,
+                 preset=DEFAULT_PRESET, crf=DEFAULT_CRF, threads=DEFAULT_THREADS,
+                 pix_fmt='yuv420p', ffmpeg_path=None):
+        """
+        初期化（ffmpegプロセスを起動）
+
+        Args:
+            output_path: 出力ファイルのパス
+            width, height: フレームサイズ
+            fps: フレームレート
+            codec: 映像コーデック (libx264, libx265, libvpx-vp9 など)
+            preset: エンコードプリセット (None で指定しない)
+            crf: 品質 (小さいほど高画質・大サイズ, None で指定しない)
+            threads: エンコードスレッド数 (0 = 自動)
+            pix_fmt: 出力ピクセルフォーマット
+            ffmpeg_path: ffmpegの実行ファイル（省略時は自動検出）
+        """
+        ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if ffmpeg_path is None:
+            raise RuntimeError("ffmpegが見つかりません (PATH または imageio-ffmpeg)")
+
+        self.output_path = Path(output_path)
+        self.width = int(width)
+        self.height = int(height)
+        self.frames_written = 0
+
+        cmd = [
+            ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}', '-r', str(fps),
+            '-i', '-',
+            '-an',
+            # yuv420pは偶数サイズが必要なため、奇数サイズは1pxパディング
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-c:v', codec,
+        ]
+        if preset is not None:
+            cmd += ['-preset', str(preset)]
+        if crf is not None:
+            cmd += ['-crf', str(crf)]
+        cmd += ['-threads', str(threads), '-pix_fmt', pix_fmt]
+        if self.output_path.suffix.lower() in ('.mp4', '.mov'):
+            cmd += ['-movflags', '+faststart']
+        cmd.append(str(self.output_path))
+
+        # stderrはパイプ詰まりを避けるため一時ファイルへ
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=self._stderr)
+
+    def write(self, frame):
+        """
+        1フレームを書き込む
+
+        Args:
+            frame: PIL Image または (H, W, 3) uint8 numpy配列
+        """
+        arr = to_rgb24(frame)
+        if arr.shape != (self.height, self.width, 3):
+            raise ValueError(f"フレームサイズが一致しません: {arr.shape} "
+                             f"(期待値: {(self.height, self.width, 3)})")
+        try:
+            self._proc.stdin.write(arr.tobytes())
+        except BrokenPipeError:
+            self._proc.wait()
+            raise RuntimeError(f"ffmpegが異常終了しました: {self._read_stderr()}")
+        self.frames_written += 1
+
+    def close(self):
+        """入力を閉じてエンコード完了を待つ"""
+        if self._proc.stdin and not self._proc.stdin.closed:
+            try:
+                self._proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self._proc.wait()
+        stderr = self._read_stderr()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpegのエンコードに失敗しました (code {returncode}): {stderr}")
+
+    def abort(self):
+        """エンコードを中断（書きかけのファイルは削除）"""
+        self._proc.kill()
+        self._proc.wait()
+        self._stderr.close()
+        self.output_path.unlink(missing_ok=True)
+
+    def _read_stderr(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors='replace').strip()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class OpenCVVideoWriter:
+    """cv2.VideoWriter (mp4v) によるライター（ffmpegがない環境用）"""
+
+    def __init__(self, output_path, width, height, fps=16, **_options):
+        import cv2
+        self._cv2 = cv2
+        self.output_path = Path(output_path)
+        self.width = int(width)
+        self.height = int(height)
+        self.frames_written = 0
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self._out = cv2.VideoWriter(str(self.output_path), fourcc, fps,
+                                    (self.width, self.height))
+
+    def write(self, frame):
+        """1フレームを書き込む"""
+        arr = to_rgb24(frame)
+        self._out.write(self._cv2.cvtColor(arr, self._cv2.COLOR_RGB2BGR))
+        self.frames_written += 1
+
+    def close(self):
+        self._out.release()
+
+    def abort(self):
+        self._out.release()
+        self.output_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_video_writer(output_path, width, height, fps=16, backend='auto', **options):
+    """
+    動画ライターを開く
+
+    Args:
+        output_path: 出力ファイルのパス
+        width, height: フレームサイズ
+        fps: フレームレート
+        backend: 'auto' (ffmpegがあればffmpeg), 'ffmpeg', 'opencv'
+        **options: FFmpegVideoWriterのオプション (codec, preset, crf, threads)
+
+    Returns:
+        write(frame) / close() を持つライター
+    """
+    if backend not in WRITER_BACKENDS:
+        raise ValueError(f"不明なバックエンド: {backend} ({', '.join(WRITER_BACKENDS)})")
+    if backend == 'opencv' or (backend == 'auto' and find_ffmpeg() is None):
+        return OpenCVVideoWriter(output_path, width, height, fps)
+    return FFmpegVideoWriter(output_path, width, height, fps, **options)
+
+
+def write_video(frames, output_path, fps=16, backend='auto', **options):
+    """
+    フレーム列を逐次エンコードして保存
+
+    Args:
+        frames: PIL Image / uint8配列のリストまたはイテレータ
+        output_path: 出力ファイルのパス
+        fps: フレームレート
+        backend, **options: open_video_writer() と同じ
+
+    Returns:
+        書き込んだフレーム数
+    """
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("フレームが空です")
+
+    height, width = to_rgb24(first).shape[:2]
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    # 結果キャッシュとハードリンクで共有している場合があるので、上書きせず作り直す
+    Path(output_path).unlink(missing_ok=True)
+    with open_video_writer(output_path, width, height, fps, backend, **options) as writer:
+        for frame in itertools.chain([first], frames):
+            writer.write(frame)
+    return writer.frames_written
+
+
+def add_writer_arguments(parser):
+    """argparseに動画書き出しオプションを追加"""
+    group = parser.add_argument_group('動画書き出し')
+    group.add_argument('--writer', default='auto', choices=WRITER_BACKENDS,
+                       help='書き出しバックエンド (auto: ffmpegがあればffmpeg)')
+    group.add_argument('--codec', default=DEFAULT_CODEC, help='映像コーデック')
+    group.add_argument('--preset', default=DEFAULT_PRESET, help='エンコードプリセット')
+    group.add_argument('--crf', type=int, default=DEFAULT_CRF, help='CRF (小さいほど高画質)')
+    group.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                       help='エンコードスレッド数 (0=自動)')
+    return group
+
+
+def writer_options_from_args(args):
+    """add_writer_arguments() で追加したオプションを save_video() 用のdictに変換"""
+    return {
+        'backend': args.writer,
+        'codec': args.codec,
+        'preset': args.preset,
+        'crf': args.crf,
+        'threads': args.threads,
+    }
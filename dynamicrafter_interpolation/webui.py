@@ -6,40 +6,217 @@ Gradioベースの使いやすいWebインターフェース
 
 import os
 import sys
+import threading
+import time
+from contextlib import contextmanager
 import gradio as gr
 from pathlib import Path
 import torch
 from PIL import Image
 import numpy as np
+import torchvision.transforms as transforms
 
 # DynamiCrafterのパスを追加
 sys.path.insert(0, str(Path(__file__).parent.parent / "DynamiCrafter"))
 
 from interpolate import FrameInterpolator
 from advanced_interpolate import AdvancedFrameInterpolator
+from precision import PRECISIONS
+from rife_interpolate import RIFEInterpolator
+from progress import PRE_SAMPLING_STAGES, format_event, event_fraction
+from result_cache import ResultCache, result_key, max_bytes_from_env
+from embedding_cache import get_default_cache, get_default_prompt_cache
+from metrics import (
+    StageMetrics, new_trace_id, observe_run, stage_timer, start_metrics_server_from_env, trace,
+    watch_cache
+)
+
+DEFAULT_PROMPT = "high quality, smooth motion"
+
+# 起動時にエンコードしておくプロンプト（空欄時のデフォルトと無条件用の空文字列）
+WARMUP_PROMPTS = [DEFAULT_PROMPT, ""]
+
+
+class GenerationCancelled(Exception):
+    """入力が変更されたため生成を中止した"""
+
+
+class RenderSession:
+    """
+    Gradioのセッションごとの生成トークン（gr.State に入れる）
+
+    入力が変わるたびにそのタブのトークンを進め、同じセッションの古い生成だけを中止させる。
+    gr.State は初期値をセッションごとに複製し、イベントには同じオブジェクトを渡す。
+    """
+
+    def __init__(self):
+        self.generation = {'basic': 0, 'advanced': 0}
+
+
+# プレビューの種類
+PREVIEW_MODES = [
+    ("なし", "off"),
+    ("RIFE（即時・モーションなし）", "rife"),
+    ("低ステップ", "draft"),
+]
+
+# 低ステッププレビューの設定
+PREVIEW_STEPS = 10
+PREVIEW_FRAMES = 8
+
+# 完成した動画の結果キャッシュ（容量の上限は環境変数 DYNAMICRAFTER_RESULT_CACHE_GB）
+RESULT_CACHE_DIR = Path(__file__).parent / "output_videos" / "result_cache"
+
+# メトリクス (/metrics) のポート（環境変数 DYNAMICRAFTER_METRICS_PORT、0で無効）
+METRICS_PORT = 9860
+
+# タブごとのメトリクスのエンジン名
+TAB_ENGINES = {'basic': 'dynamicrafter', 'advanced': 'advanced'}
 
 
 class WebUI:
     def __init__(self):
         self.basic_interpolator = None
         self.advanced_interpolator = None
+        self.rife = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._generation_lock = threading.Lock()
+        # タブごとの補間器の排他（進捗リスナー・補間方法・モーション設定は補間器ごとの状態なので、
+        # 複数のセッションの生成が同じ補間器を同時に使わないようにする）
+        self._run_locks = {'basic': threading.Lock(), 'advanced': threading.Lock()}
+        self.result_cache = ResultCache(RESULT_CACHE_DIR, max_bytes=max_bytes_from_env())
+        watch_cache('result', self.result_cache)
+        watch_cache('embedding', get_default_cache())
+        watch_cache('prompt', get_default_prompt_cache())
+        
+    def initialize_basic(self, precision="fp32"):
+        """
+        基本モデルの初期化（精度が変わった場合は読み込み直す）
+
+        別のセッションの生成中は、終わるまで待ってから読み込み直す。
+        """
+        with self._run_locks['basic']:
+            if self.basic_interpolator is not None and self.basic_interpolator.precision != precision:
+                self.basic_interpolator.release_model()
+                self.basic_interpolator = None
+            if self.basic_interpolator is None:
+                print(f"🔄 基本モデルを初期化中... ({precision})")
+                with stage_timer(TAB_ENGINES['basic'], 'load'):
+                    self.basic_interpolator = FrameInterpolator(device=self.device, precision=precision)
+                    self.basic_interpolator.warmup_prompts(WARMUP_PROMPTS)
+                print("✓ 基本モデル初期化完了")
+            return self.basic_interpolator
+    
+    def initialize_advanced(self, precision="fp32"):
+        """高度なモデルの初期化（initialize_basic と同じ）"""
+        with self._run_locks['advanced']:
+            if self.advanced_interpolator is not None and self.advanced_interpolator.precision != precision:
+                self.advanced_interpolator.release_model()
+                self.advanced_interpolator = None
+            if self.advanced_interpolator is None:
+                print(f"🔄 高度なモデルを初期化中... ({precision})")
+                with stage_timer(TAB_ENGINES['advanced'], 'load'):
+                    self.advanced_interpolator = AdvancedFrameInterpolator(device=self.device, precision=precision)
+                    self.advanced_interpolator.warmup_prompts(WARMUP_PROMPTS)
+                print("✓ 高度なモデル初期化完了")
+            return self.advanced_interpolator
+    
+    def initialize_rife(self):
+        """プレビュー用のRIFEの初期化（読み込めない場合はOpenCVのブレンド）"""
+        if self.rife is None:
+            self.rife = RIFEInterpolator(device='cpu')
+            self.rife.load_model()
+        return self.rife
+    
+    def invalidate(self, tab, session):
+        """入力が変わったときに呼ぶ。そのセッションの実行中の生成は次のDDIMステップで中止される"""
+        with self._generation_lock:
+            session.generation[tab] += 1
+    
+    def _begin(self, tab, session):
+        """新しい生成を開始し、そのトークンを返す"""
+        with self._generation_lock:
+            session.generation[tab] += 1
+            return session.generation[tab]
+    
+    @staticmethod
+    def _check(tab, session, token):
+        """トークンが古くなっていれば中止"""
+        if session.generation[tab] != token:
+            raise GenerationCancelled()
+    
+    @contextmanager
+    def _tracking(self, interpolator, tab, session, token, progress, start, end, desc,
+                  trace_id=None):
+        """
+        補間器の進捗イベントをGradioのプログレスバーに反映する（with の間だけ購読）
         
-    def initialize_basic(self):
-        """基本モデルの初期化"""
-        if self.basic_interpolator is None:
-            print("🔄 基本モデルを初期化中...")
-            self.basic_interpolator = FrameInterpolator(device=self.device)
-            print("✓ 基本モデル初期化完了")
-        return self.basic_interpolator
+        with の間はタブの補間器を占有し、別のセッションの生成は終わるまで待つ。
+        サンプリングのステップごとに入力の変更も確認し、変わっていれば中止する。
+        段階ごとの時間はメトリクスにも記録する。
+        
+        Args:
+            session: RenderSession
+            start, end: サンプリングに割り当てる進捗の範囲 (0〜1)
+            desc: 表示の接頭辞
+            trace_id: 構造化ログのトレースID
+        """
+        def listener(event):
+            stage = event.get('stage')
+            if stage == 'sampling':
+                if event.get('event') == 'step':
+                    self._check(tab, session, token)
+                fraction = event_fraction(event) or 0.0
+            else:
+                # 条件付けはサンプリングの前、デコード・書き出しは後
+                fraction = 0.0 if stage in PRE_SAMPLING_STAGES else 1.0
+            progress(start + (end - start) * fraction, desc=f"{desc}: {format_event(event)}")
+        
+        stage_metrics = StageMetrics(TAB_ENGINES[tab])
+        with self._run_locks[tab]:
+            # 待っている間に入力が変わっていれば始めない
+            self._check(tab, session, token)
+            interpolator.progress.reset()
+            # 中止の例外より先に記録されるよう、メトリクスを先に登録
+            interpolator.progress.add_listener(stage_metrics)
+            interpolator.progress.add_listener(listener)
+            try:
+                with trace(trace_id):
+                    yield
+                    interpolator.progress.done()
+            except Exception as e:
+                interpolator.progress.error(e)
+                raise
+            finally:
+                interpolator.progress.remove_listener(listener)
+                interpolator.progress.remove_listener(stage_metrics)
+    
+    @staticmethod
+    def _output_paths(tab, trace_id):
+        """
+        リクエストごとの出力先
+
+        Returns:
+            (本番の動画, プレビュー) のパス
+            output_videos/webui_{tab}_{トレースID}.mp4 と ..._preview.mp4
+        """
+        output_dir = Path(__file__).parent / "output_videos"
+        output_dir.mkdir(exist_ok=True)
+        return (output_dir / f"webui_{tab}_{trace_id}.mp4",
+                output_dir / f"webui_{tab}_{trace_id}_preview.mp4")
     
-    def initialize_advanced(self):
-        """高度なモデルの初期化"""
-        if self.advanced_interpolator is None:
-            print("🔄 高度なモデルを初期化中...")
-            self.advanced_interpolator = AdvancedFrameInterpolator(device=self.device)
-            print("✓ 高度なモデル初期化完了")
-        return self.advanced_interpolator
+    def _render_rife_preview(self, interpolator, image1, image2, num_frames, fps, output_path):
+        """RIFEでモーションなしの簡易プレビューを作成"""
+        rife = self.initialize_rife()
+        # DynamiCrafterと同じ切り抜き
+        fit = transforms.Compose([
+            transforms.Resize(min(interpolator.resolution)),
+            transforms.CenterCrop(interpolator.resolution),
+        ])
+        frames = rife.iter_frames(fit(interpolator._open_image(image1)),
+                                  fit(interpolator._open_image(image2)),
+                                  num_frames=int(num_frames))
+        rife.save_video(frames, str(output_path), fps=int(fps))
     
     def basic_interpolate(
         self,
@@ -50,12 +227,23 @@ class WebUI:
         prompt,
         cfg_scale,
         ddim_steps,
+        precision="fp32",
+        preview="off",
+        session=None,
         progress=gr.Progress()
     ):
-        """基本的な中割補間"""
+        """
+        基本的な中割補間
+        
+        プレビューを指定した場合は、まず簡易版を表示してから本番の生成を続け、
+        完成したら置き換える。途中で入力が変わると本番の生成は中止する。
+        """
+        session = session or RenderSession()
+        token = self._begin('basic', session)
+        trace_id = new_trace_id()
         try:
             progress(0, desc="モデルを初期化中...")
-            interpolator = self.initialize_basic()
+            interpolator = self.initialize_basic(precision)
             
             # 画像をPILに変換
             if isinstance(image1, np.ndarray):
@@ -63,35 +251,78 @@ class WebUI:
             if isinstance(image2, np.ndarray):
                 image2 = Image.fromarray(image2)
             
-            # 出力パス
-            output_dir = Path(__file__).parent / "output_videos"
-            output_dir.mkdir(exist_ok=True)
-            output_path = output_dir / "webui_basic_output.mp4"
+            # 出力パス（リクエストごと。同時に開いた別のセッションと上書きし合わない）
+            output_path, preview_path = self._output_paths('basic', trace_id)
+            prompt = prompt if prompt else DEFAULT_PROMPT
+            
+            # 同じ入力・設定で生成済みならすぐ返す
+            cache_params = {
+                'tool': 'webui_basic', 'num_frames': num_frames, 'fps': fps, 'prompt': prompt,
+                'cfg_scale': cfg_scale, 'ddim_steps': ddim_steps,
+            }
+            cache_key = result_key([image1, image2], cache_params, interpolator.model_identity())
+            if self.result_cache.fetch(cache_key, output_path):
+                observe_run(TAB_ENGINES['basic'], 'cached', trace_id=trace_id)
+                progress(1.0, desc="完了 (キャッシュ)")
+                yield str(output_path), f"✓ 生成済みの動画をキャッシュから返しました: {output_path}"
+                return
+            generation_start = time.perf_counter()
             
-            progress(0.2, desc="中割処理を実行中...")
+            # プレビュー
+            final_start = 0.2
+            if preview == "rife":
+                progress(0.1, desc="プレビューを作成中 (RIFE)...")
+                self._render_rife_preview(interpolator, image1, image2, num_frames, fps, preview_path)
+                yield str(preview_path), "👀 プレビュー (RIFE・モーションなし)\n🔄 本番の生成を実行中..."
+            elif preview == "draft":
+                with self._tracking(interpolator, 'basic', session, token, progress, 0.0, 0.2,
+                                    "プレビューを作成中", trace_id):
+                    samples = interpolator.interpolate(
+                        image1,
+                        image2,
+                        prompt=prompt,
+                        num_frames=min(int(num_frames), PREVIEW_FRAMES),
+                        ddim_steps=PREVIEW_STEPS,
+                        cfg_scale=cfg_scale,
+                        fps=int(fps)
+                    )
+                    interpolator.save_video(samples, str(preview_path), fps=int(fps))
+                yield str(preview_path), f"👀 プレビュー ({PREVIEW_STEPS}ステップ)\n🔄 本番の生成を実行中..."
             
-            # 中割実行
-            video_path = interpolator.interpolate(
-                image1=image1,
-                image2=image2,
-                num_frames=num_frames,
-                output_path=str(output_path),
-                prompt=prompt if prompt else "high quality, smooth motion",
-                fps=fps,
-                cfg_scale=cfg_scale,
-                ddim_steps=ddim_steps
-            )
+            self._check('basic', session, token)
+            progress(final_start, desc="中割処理を実行中...")
+            
+            # 中割実行（ネイティブ長を超える場合はスライディングウィンドウ）
+            with self._tracking(interpolator, 'basic', session, token, progress, final_start, 0.95,
+                                "中割処理を実行中", trace_id):
+                samples = interpolator.interpolate_long(
+                    image1,
+                    image2,
+                    prompt=prompt,
+                    num_frames=int(num_frames),
+                    ddim_steps=int(ddim_steps),
+                    cfg_scale=cfg_scale,
+                    fps=int(fps)
+                )
+                self._check('basic', session, token)
+                interpolator.save_video(samples, str(output_path), fps=int(fps))
+            self.result_cache.store(cache_key, output_path, time.perf_counter() - generation_start,
+                                    cache_params)
+            video_path = output_path
             
             progress(1.0, desc="完了!")
             
-            return str(video_path), f"✓ 動画を生成しました: {video_path}"
+            yield str(video_path), f"✓ 動画を生成しました: {video_path}"
             
+        except GenerationCancelled:
+            print("⏹ 入力が変更されたため基本モードの生成を中止しました")
+            yield gr.update(), "⏹ 入力が変更されたため生成を中止しました"
         except Exception as e:
             error_msg = f"❌ エラー: {str(e)}"
             print(error_msg)
             import traceback
             traceback.print_exc()
-            return None, error_msg
+            yield None, error_msg
     
     def advanced_interpolate(
         self,
@@ -107,12 +338,22 @@ class WebUI:
         rotate,
         cfg_scale,
         ddim_steps,
+        precision="fp32",
+        preview="off",
+        session=None,
         progress=gr.Progress()
     ):
-        """モーション制御付き中割補間"""
+        """
+        モーション制御付き中割補間
+        
+        プレビューの扱いは basic_interpolate() と同じ。
+        """
+        session = session or RenderSession()
+        token = self._begin('advanced', session)
+        trace_id = new_trace_id()
         try:
             progress(0, desc="高度なモデルを初期化中...")
-            interpolator = self.initialize_advanced()
+            interpolator = self.initialize_advanced(precision)
             
             # 画像をPILに変換
             if isinstance(image1, np.ndarray):
@@ -120,46 +361,94 @@ class WebUI:
             if isinstance(image2, np.ndarray):
                 image2 = Image.fromarray(image2)
             
-            # 出力パス
-            output_dir = Path(__file__).parent / "output_videos"
-            output_dir.mkdir(exist_ok=True)
-            output_path = output_dir / "webui_advanced_output.mp4"
-            
-            progress(0.2, desc="モーション制御付き中割処理を実行中...")
+            # 出力パス（リクエストごと。同時に開いた別のセッションと上書きし合わない）
+            output_path, preview_path = self._output_paths('advanced', trace_id)
+            prompt = prompt if prompt else DEFAULT_PROMPT
             
-            # モーションパラメータ
-            motion_params = {
-                'pan_x': pan_x,
-                'pan_y': pan_y,
-                'zoom': zoom,
-                'rotate': rotate
+            # モーションパラメータ（ズームのスライダーは1.0が等倍）
+            motion_control = {
+                'camera': {
+                    'pan_x': pan_x,
+                    'pan_y': pan_y,
+                    'zoom': zoom - 1.0,
+                    'rotate': rotate
+                }
             }
+            # 同じ入力・設定で生成済みならすぐ返す
+            cache_params = {
+                'tool': 'webui_advanced', 'num_frames': num_frames, 'fps': fps, 'prompt': prompt,
+                'mode': mode, 'motion_control': motion_control, 'cfg_scale': cfg_scale,
+                'ddim_steps': ddim_steps,
+            }
+            cache_key = result_key([image1, image2], cache_params, interpolator.model_identity())
+            if self.result_cache.fetch(cache_key, output_path):
+                observe_run(TAB_ENGINES['advanced'], 'cached', trace_id=trace_id)
+                progress(1.0, desc="完了 (キャッシュ)")
+                yield str(output_path), f"✓ 生成済みの動画をキャッシュから返しました\n保存先: {output_path}"
+                return
+            generation_start = time.perf_counter()
+            
+            # プレビュー
+            final_start = 0.2
+            if preview == "rife":
+                progress(0.1, desc="プレビューを作成中 (RIFE)...")
+                self._render_rife_preview(interpolator, image1, image2, num_frames, fps, preview_path)
+                yield str(preview_path), "👀 プレビュー (RIFE・モーションなし)\n🔄 本番の生成を実行中..."
+            elif preview == "draft":
+                with self._tracking(interpolator, 'advanced', session, token, progress, 0.0, 0.2,
+                                    "プレビューを作成中", trace_id):
+                    # 補間器の設定は占有している間に変える
+                    interpolator.interpolation_method = mode
+                    samples = interpolator.interpolate(
+                        image1,
+                        image2,
+                        prompt=prompt,
+                        num_frames=min(int(num_frames), PREVIEW_FRAMES),
+                        ddim_steps=PREVIEW_STEPS,
+                        cfg_scale=cfg_scale,
+                        fps=int(fps),
+                        motion_control=motion_control
+                    )
+                    interpolator.save_video(samples, str(preview_path), fps=int(fps))
+                yield str(preview_path), f"👀 プレビュー ({PREVIEW_STEPS}ステップ)\n🔄 本番の生成を実行中..."
+            
+            self._check('advanced', session, token)
+            progress(final_start, desc="モーション制御付き中割処理を実行中...")
             
             # 中割実行
-            video_path = interpolator.interpolate(
-                image1=image1,
-                image2=image2,
-                num_frames=num_frames,
-                output_path=str(output_path),
-                prompt=prompt if prompt else "high quality, smooth motion",
-                fps=fps,
-                mode=mode,
-                motion_params=motion_params,
-                cfg_scale=cfg_scale,
-                ddim_steps=ddim_steps
-            )
+            with self._tracking(interpolator, 'advanced', session, token, progress, final_start, 0.95,
+                                "モーション制御付き中割処理を実行中", trace_id):
+                interpolator.interpolation_method = mode
+                samples = interpolator.interpolate(
+                    image1,
+                    image2,
+                    prompt=prompt,
+                    num_frames=int(num_frames),
+                    ddim_steps=int(ddim_steps),
+                    cfg_scale=cfg_scale,
+                    fps=int(fps),
+                    motion_control=motion_control
+                )
+                self._check('advanced', session, token)
+                interpolator.save_video(samples, str(output_path), fps=int(fps))
+            self.result_cache.store(cache_key, output_path, time.perf_counter() - generation_start,
+                                    cache_params)
+            video_path = output_path
             
             progress(1.0, desc="完了!")
             
             motion_info = f"カメラワーク: Pan X={pan_x}, Pan Y={pan_y}, Zoom={zoom}, Rotate={rotate}°"
-            return str(video_path), f"✓ 動画を生成しました\n{motion_info}\n保存先: {video_path}"
+            yield str(video_path), f"✓ 動画を生成しました\n{motion_info}\n保存先: {video_path}"
             
+        except GenerationCancelled:
+            print("⏹ 入力が変更されたためモーション制御モードの生成を中止しました")
+            yield gr.update(), "⏹ 入力が変更されたため生成を中止しました"
         except Exception as e:
             error_msg = f"❌ エラー: {str(e)}"
             print(error_msg)
             import traceback
             traceback.print_exc()
-            return None, error_msg
+            yield None, error_msg
 
 
 def create_ui():
@@ -190,14 +479,24 @@ def create_ui():
                         )
                         
                         with gr.Row():
-                            basic_frames = gr.Slider(8, 32, value=16, step=8, label="フレーム数")
+                            basic_frames = gr.Slider(8, 64, value=16, step=8, label="フレーム数")
                             basic_fps = gr.Slider(8, 30, value=16, step=1, label="FPS")
                         
                         with gr.Accordion("詳細設定", open=False):
                             basic_cfg = gr.Slider(1.0, 20.0, value=7.5, step=0.5, label="CFG Scale")
                             basic_steps = gr.Slider(10, 100, value=50, step=10, label="DDIM Steps")
+                            basic_precision = gr.Dropdown(
+                                PRECISIONS, value="fp32", label="推論精度",
+                                info="bf16: メモリ約半分（AVX512-BF16/AMX対応CPUで高速）"
+                            )
+                        
+                        basic_preview = gr.Radio(
+                            PREVIEW_MODES, value="rife", label="プレビュー",
+                            info="先に簡易版を表示し、本番の生成が終わったら置き換えます"
+                        )
                         
                         basic_btn = gr.Button("🎬 中割生成", variant="primary", size="lg")
+                        basic_session = gr.State(RenderSession())
                     
                     with gr.Column():
                         basic_output = gr.Video(label="生成された動画")
@@ -207,10 +506,17 @@ def create_ui():
                     fn=webui.basic_interpolate,
                     inputs=[
                         basic_image1, basic_image2, basic_frames, basic_fps,
-                        basic_prompt, basic_cfg, basic_steps
+                        basic_prompt, basic_cfg, basic_steps, basic_precision, basic_preview,
+                        basic_session
                     ],
                     outputs=[basic_output, basic_status]
                 )
+                
+                # 入力が変わったら、このセッションの実行中の生成を中止
+                for component in [basic_image1, basic_image2, basic_frames, basic_fps,
+                                  basic_prompt, basic_cfg, basic_steps, basic_precision]:
+                    component.change(lambda session: webui.invalidate('basic', session),
+                                     inputs=[basic_session], queue=False)
             
             # ====== モーション制御モード ======
             with gr.Tab("🎥 モーション制御モード"):
@@ -251,6 +557,15 @@ def create_ui():
                         with gr.Accordion("詳細設定", open=False):
                             adv_cfg = gr.Slider(1.0, 20.0, value=7.5, step=0.5, label="CFG Scale")
                             adv_steps = gr.Slider(10, 100, value=50, step=10, label="DDIM Steps")
+                            adv_precision = gr.Dropdown(
+                                PRECISIONS, value="fp32", label="推論精度",
+                                info="bf16: メモリ約半分（AVX512-BF16/AMX対応CPUで高速）"
+                            )
+                        
+                        adv_preview = gr.Radio(
+                            PREVIEW_MODES, value="rife", label="プレビュー",
+                            info="先に簡易版を表示し、本番の生成が終わったら置き換えます"
+                        )
                         
                         # プリセットボタン
                         gr.Markdown("#### 📋 プリセット")
@@ -261,6 +576,7 @@ def create_ui():
                             preset_reset = gr.Button("↺ リセット", size="sm")
                         
                         adv_btn = gr.Button("🎥 モーション制御中割生成", variant="primary", size="lg")
+                        adv_session = gr.State(RenderSession())
                     
                     with gr.Column():
                         adv_output = gr.Video(label="生成された動画")
@@ -289,10 +605,17 @@ def create_ui():
                     inputs=[
                         adv_image1, adv_image2, adv_frames, adv_fps, adv_prompt,
                         adv_mode, adv_pan_x, adv_pan_y, adv_zoom, adv_rotate,
-                        adv_cfg, adv_steps
+                        adv_cfg, adv_steps, adv_precision, adv_preview, adv_session
                     ],
                     outputs=[adv_output, adv_status]
                 )
+                
+                # 入力が変わったら、このセッションの実行中の生成を中止
+                for component in [adv_image1, adv_image2, adv_frames, adv_fps, adv_prompt,
+                                  adv_mode, adv_pan_x, adv_pan_y, adv_zoom, adv_rotate,
+                                  adv_cfg, adv_steps, adv_precision]:
+                    component.change(lambda session: webui.invalidate('advanced', session),
+                                     inputs=[adv_session], queue=False)
             
             # ====== 使い方 ======
             with gr.Tab("📖 使い方"):
@@ -301,11 +624,16 @@ def create_ui():
                 
                 ### 基本モード
                 1. **開始フレーム**と**終了フレーム**の2枚の画像をアップロード
-                2. **フレーム数**を選択（8, 16, 24, 32フレーム）
+                2. **フレーム数**を選択（8～64フレーム、16を超える分は重ねたウィンドウで順に生成）
                 3. **FPS**を設定（推奨: 16fps）
                 4. オプションで**プロンプト**を入力して画質を向上
                 5. 「中割生成」ボタンをクリック
                 
+                ### プレビュー
+                - **RIFE**: 数秒で簡易版（モーションなし）を表示してから本番の生成を続けます
+                - **低ステップ**: {steps}ステップ・最大{frames}フレームの下書きを先に表示します
+                - 生成中に入力を変更すると、本番の生成は自動的に中止されます（中止されるのは自分の生成だけです）
+                
                 ### モーション制御モード（高度）
                 基本モードに加えて、カメラワークを制御できます:
                 
@@ -330,14 +658,15 @@ def create_ui():
                 - プロンプト例: "cinematic motion", "smooth camera movement", "high quality animation"
                 - CFG Scaleが高いほど、プロンプトに忠実になります（推奨: 7.5）
                 - DDIM Stepsが多いほど高品質ですが、時間がかかります（推奨: 50）
+                - CPUでは推論精度を **bf16** にするとメモリ使用量が約半分になります
                 
                 ### ⚙️ 技術仕様
                 - **モデル**: DynamiCrafter 512_interp_v1
                 - **解像度**: 320x512
-                - **フレーム数**: 8～32フレーム
+                - **フレーム数**: 8～32フレーム（基本モードは64フレームまで）
                 - **モーション制御**: Steerable-Motionベース
                 - **デバイス**: {device}
-                """.format(device=webui.device.upper()))
+                """.format(device=webui.device.upper(), steps=PREVIEW_STEPS, frames=PREVIEW_FRAMES))
         
         gr.Markdown("""
         ---
@@ -357,6 +686,7 @@ if __name__ == "__main__":
     print(f"🖥️  デバイス: {'CUDA (GPU)' if torch.cuda.is_available() else 'CPU'}")
     print("🌐 WebUIを起動中...")
     print()
+    start_metrics_server_from_env(METRICS_PORT)
     
     app = create_ui()
     